@@ -5,8 +5,6 @@ from cryptography.utils import CryptographyDeprecationWarning
 warnings.filterwarnings("ignore", category=CryptographyDeprecationWarning) 
 from pathlib import Path
 import streamlit as st
-import subprocess
-import tempfile
 import pandas as pd
 import os
 from xhtml2pdf import pisa
@@ -15,6 +13,70 @@ from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Preformatted, PageBreak
 from io import BytesIO
+from P3G_core import (
+    parse_primer3_input_file,
+    fill_primer3_settings,
+    run_primer3,
+    run_split_product_ranges,
+    primer3_results_table,
+    RERANK_WEIGHTS,
+    build_candidate_pool,
+    rerank_candidates,
+    explorer_overrides,
+    build_oligo_space,
+    explore_oligo_space,
+    explorer_limits,
+    DEFAULT_WORKERS,
+    run_relax_ladder,
+    changed_settings,
+    parse_sweep_values,
+    expand_parameter_grid,
+    run_parameter_sweep,
+    RECORD_KEYS,
+    SETTING_DEFAULTS,
+    open_indexed_fasta,
+    read_regions,
+    region_records,
+    run_batch_design,
+    open_gtf_index,
+    select_transcripts,
+    junction_records,
+    run_sequencing_walk,
+    sequencing_coverage,
+    coverage_gaps,
+    coverage_map_text,
+    parse_fasta_text,
+    normalize_inventory,
+    missing_templates,
+    run_primer_check,
+    locate_oligos,
+    read_stock_primers,
+    primer_automaton,
+    stock_primer_records,
+    COMPLEXITY_DEFAULTS,
+    complexity_masks,
+    complexity_regions,
+    drop_target_overlaps,
+    excluded_region_string,
+    clean_sequence,
+    auto_excluded_region,
+    hairpin_scan,
+    hairpin_regions,
+    hairpin_overlay,
+    open_vcf_index,
+    run_variant_aware_design,
+    parse_snp_list,
+    run_arms_design,
+    run_nested_design,
+    read_alignment,
+    run_consensus_design,
+    CPG_STATES,
+    run_bisulfite_design,
+    RUN_STORE_MAX_RUNS, run_store_path, use_run_store, run_primer3_reused, search_runs, load_run, run_store_stats, stored_run_record,
+    stored_outputs, failure_analytics, build_snapshot, read_snapshot, echoed_settings,
+    import_settings_files, run_settings_replay, validate_settings, validate_records,
+    results_grid, result_grid_key, shown_result_index, result_tables, binding_rows, settings_hash,
+)
 
 st.set_page_config(page_title="P3G V 1.1", layout="wide")
 
@@ -58,41 +120,6 @@ def exclude_regions(sequence:str):
         return excluded_start, excluded_length
     return None, None
 
-# function to set the primer task based on the selected checks and/or sequences 
-def determine_primer_task(pick_left, pick_right, pick_internal, left, right, internal):
-    # if probe is picked or provided, and at least one primer is picked or provided
-    probe_selected = pick_internal or bool(internal.strip())
-    left_selected = pick_left or bool(left.strip())
-    right_selected = pick_right or bool(right.strip())
-
-    if left_selected and right_selected and probe_selected:
-        return "pick_pcr_primers_and_hyb_probe"
-    elif left_selected and right_selected:
-        return "pick_pcr_primers"
-    elif left_selected and probe_selected:
-        return "pick_pcr_primers_and_hyb_oligo"
-    elif left_selected:
-        return "pick_left_only"
-    elif right_selected and probe_selected:
-        return "pick_pcr_primers_and_hyb_oligo"
-    elif right_selected:
-        return "pick_right_only"
-    elif probe_selected:
-        return "pick_hyb_probe_only"
-    else:
-        return "pick_detection_primers"  # fallback
-    
-# function to load previous files:
-def parse_primer3_input_file(file_text):
-    parsed_input_data = {}
-    for line in file_text.splitlines():
-        if '='in line:
-            key, value = line.split('=',1)
-            parsed_input_data[key.strip()] = value.strip()
-    return parsed_input_data
-
-
-
 # convert dataframe to HTML table for display
 def dataframe_to_html_table(df):
     return df.to_html(index=False, border=1, justify="left", classes="dataframe", escape=False)
@@ -277,321 +304,149 @@ def resolve_and_check_path(path_input):
     exists = os.path.exists(resolved_path)
     return resolved_path, exists
 
+# batch results kept in the session as (table, results, records), per design mode
+BATCH_RESULT_KEYS = {
+    "Regions from reference": "regions_result",
+    "Exon-junction qPCR": "junction_result",
+    "Bulk primer check": "check_result",
+    "Stock primer reuse": "stock_result",
+    "Variant-aware design": "vcf_result",
+    "Allele-specific (ARMS) design": "arms_result",
+    "Nested PCR": "nested_result",
+    "Degenerate consensus": "consensus_result",
+    "Bisulfite design": "bisulfite_result",
+    "Settings file replay": "replay_result",
+}
+
+# function to show the results of a batch design, with the option to open one record in the output tabs
+def show_batch_results(table, results, records, key):
+    st.dataframe(table, use_container_width=True, hide_index=True)
+    st.download_button(
+        label="Download batch results as CSV",
+        data=table.to_csv(index=False).encode("utf-8"),
+        file_name=f"primer3_{key}.csv",
+        mime="text/csv",
+        key=f"{key}_download"
+    )
+    record_index = st.selectbox("Show record in output tabs", range(len(records)), format_func=lambda i: records[i]["seq_id"], key=f"{key}_show_index")
+    if st.button("Show record", key=f"{key}_show", help="Loads the record's sequence into the 'Input Settings' tab and shows its result in the output tabs."):
+        st.session_state["pending_settings"] = {k: v for k, v in records[record_index].items() if k in RECORD_KEYS or k in defaults}
+        st.session_state["raw_output"], st.session_state["primer3_success"] = results[record_index]
+        # batch results are kept without their settings, use the settings Primer3 echoed in the output
+        st.session_state["raw_settings"] = echoed_settings(results[record_index][0])
+        st.rerun()
+
+# function to show the binding sites of one result on the sequence, with the template hairpin overlay if there is one
+def show_binding_view(rows, overlay):
+    block = ""
+    for idx_row, (seq_row, marker_row) in enumerate(rows):
+        row_start = idx_row * 60 + 1
+        structure_row = f"       {overlay[row_start - 1:row_start + 59]}\n" if overlay else ""
+        if idx_row == 0:
+            block += f"\n   {row_start:>3}  {seq_row}\n       {marker_row}\n{structure_row}\n"
+        else:
+            block += f"{row_start:>6}  {seq_row}\n       {marker_row}\n{structure_row}\n"
+    block_lines = block.splitlines()
+    if block_lines:
+        # use zero-width space (U+200B) to pad the first line
+        invisible_pad = "\u200B" * 18
+        block_lines[0] = invisible_pad + block_lines[0][2:]
+    block = "\n".join(block_lines)
+    st.code(block, language="text")
+
+    # add a legend
+    legend = (
+        "**Legend:**\n\n"
+        "Forward Primer: `>`\n\n"
+        "Reverse Primer: `<`\n\n"
+        "Probe/Internal Oligo: `^`\n\n"
+        "Target Region: `*`\n\n"
+        "Excluded Region: `X`"
+    )
+    if overlay:
+        legend += "\n\nTemplate hairpin (line below the markers): `#` at or below the dG threshold, `~` below half of it"
+    st.markdown(legend)
+
+# function to find the binding sites of the provided oligos, cached so they are not searched again on every rerun
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_locate_oligos(sequence, oligos, max_mismatches, first_base_index):
+    return locate_oligos(sequence, oligos, max_mismatches, first_base_index)
+
+########################## Run history ######################################################
+
+# keep every Primer3 run in the run history store, so repeated runs are reopened instead of run again
+run_store_file = run_store_path()
+try:
+    run_store = use_run_store(run_store_file)
+except Exception as e:
+    run_store = None
+    st.sidebar.warning(f"Run history is not available: {e}")
+
 ########################## Reuploading existing files #####################################
 
-# handle uploaded file before widgets are created 
-uploaded_file = st.sidebar.file_uploader(
-    label="Upload Primer3 file created using this tool",
-    accept_multiple_files=False,
+# handle uploaded files before widgets are created, several files can be replayed as a batch in the Design Modes tab
+uploaded_files = st.sidebar.file_uploader(
+    label="Upload Primer3 file(s) created using this tool",
+    accept_multiple_files=True,
     type="txt",
     key="file_uploader"
 )
 
-if uploaded_file and "imported" not in st.session_state:
-    content = uploaded_file.read().decode("utf-8")
-    parsed = parse_primer3_input_file(content)
-    st.session_state["primer3_parsed"] = parsed
-
-    # set values before widgets are created
-    st.session_state.update({
-        # general options
-        "sequence": parsed.get("SEQUENCE_TEMPLATE", ""),
-        "seq_id": parsed.get("SEQUENCE_ID", ""),
-        "left": parsed.get("SEQUENCE_PRIMER", ""),
-        "right": parsed.get("SEQUENCE_PRIMER_REVCOMP", ""),
-        "internal": parsed.get("SEQUENCE_INTERNAL_OLIGO", ""),
-        "pick_left": parsed.get("PRIMER_PICK_LEFT_PRIMER", "1") == "1",
-        "pick_right": parsed.get("PRIMER_PICK_RIGHT_PRIMER", "1") == "1",
-        "pick_internal": parsed.get("PRIMER_PICK_INTERNAL_OLIGO", "1") == "1",
-        "target": parsed.get("SEQUENCE_TARGET", ""), 
-        "excluded_region": parsed.get("EXCLUDED_REGION", "" ),
-        "product_size_range": parsed.get("PRIMER_PRODUCT_SIZE_RANGE", ""), 
-        "num_return": parsed.get("PRIMER_NUM_RETURN", "" ),
-        "max_repeat_mispriming": float(parsed.get("PRIMER_MAX_MISPRIMING", "" )),
-        "max_template_mispriming": float(parsed.get("PRIMER_MAX_TEMPLATE_MISPRIMING", "")), 
-        "max_3_prime_stability":  float(parsed.get("PRIMER_MAX_END_STABILITY", "" )),
-        "pair_max_repeat_mispriming": float(parsed.get("PRIMER_PAIR_MAX_MISPRIMING", "")),
-        "pair_max_template_mispriming": float(parsed.get("PRIMER_PAIR_MAX_TEMPLATE_MISPRIMING","")),
-        # primer options
-        "primer_min_size": int(parsed.get("PRIMER_MIN_SIZE", "")),
-        "primer_opt_size": int(parsed.get("PRIMER_OPT_SIZE", "")),
-        "primer_max_size": int(parsed.get("PRIMER_MAX_SIZE", "")),
-        "primer_min_tm": float(parsed.get("PRIMER_MIN_TM", "")),
-        "primer_opt_tm": float(parsed.get("PRIMER_OPT_TM", "")), 
-        "primer_max_tm": float(parsed.get("PRIMER_MAX_TM", "")),
-        "product_min_tm": float(parsed.get("PRIMER_PRODUCT_MIN_TM", "")),
-        "product_opt_tm": float(parsed.get("PRIMER_PRODUCT_OPT_TM", "")),
-        "product_max_tm": float(parsed.get("PRIMER_PRODUCT_MAX_TM", "")),
-        "primer_min_GC": float(parsed.get("PRIMER_MIN_GC", "")),
-        "primer_opt_GC": float(parsed.get("PRIMER_OPT_GC_PERCENT", "")),
-        "max_tm_diff": float(parsed.get("PRIMER_PAIR_MAX_DIFF_TM", "")),
-        "thermo_param_value": parsed.get("PRIMER_TM_SANTALUCIA", ""),
-        "primer_max_self_comp": float(parsed.get("PRIMER_MAX_SELF_ANY", "")),
-        "primer_max_3prime_self_comp": float(parsed.get("PRIMER_MAX_SELF_END", "")),
-        "max_Ns": int(parsed.get("PRIMER_MAX_NS_ACCEPTED", "")),
-        "max_poly_x": int(parsed.get("PRIMER_MAX_POLY_X", "")),
-        "primer_inside_target_penalty": float(parsed.get("PRIMER_INSIDE_PENALTY", "")),
-        "primer_outside_target_penalty": float(parsed.get("PRIMER_OUTSIDE_PENALTY", "")),
-        "primer_first_base_index": int(parsed.get("PRIMER_FIRST_BASE_INDEX", "")),
-        "CG_clamp": float(parsed.get("PRIMER_GC_CLAMP", "")),
-        "primer_salt_conc_monocat": float(parsed.get("PRIMER_SALT_CONC", "")),
-        "primer_salt_conc_divcat": float(parsed.get("PRIMER_DIVALENT_CONC", "")),
-        "salt_correction_value": parsed.get("PRIMER_SALT_CORRECTIONS", "" ),
-        "primer_dntp_conc": float(parsed.get("PRIMER_DNTP_CONC", "")),
-        "annealing_oligo_conc": float(parsed.get("PRIMER_DNA_CONC", "" )),
-        "liberal_base": parsed.get("PRIMER_LIBERAL_BASE", ""),
-        "ambiguity_codes_consensus": parsed.get( "PRIMER_LIB_AMBIGUITY_CODES_CONSENSUS", ""),
-        "lowercase_masking": parsed.get("PRIMER_LOWERCASE_MASKING", "" ),
-        # probe options
-        "probe_min_size": int(parsed.get("PRIMER_INTERNAL_MIN_SIZE", "" )),
-        "probe_opt_size": int(parsed.get("PRIMER_INTERNAL_OPT_SIZE", "" )),
-        "probe_max_size": int(parsed.get("PRIMER_INTERNAL_MAX_SIZE", "" )),
-        "probe_min_tm": float(parsed.get("PRIMER_INTERNAL_MIN_TM", "" )),
-        "probe_opt_tm": float(parsed.get("PRIMER_INTERNAL_OPT_TM", "" )),
-        "probe_max_tm": float(parsed.get("PRIMER_INTERNAL_MAX_TM", "" )),
-        "probe_min_GC": float(parsed.get("PRIMER_INTERNAL_MIN_GC", "" )),
-        "probe_opt_GC": float(parsed.get("PRIMER_INTERNAL_OPT_GC_PERCENT", "" )),
-        "probe_max_GC": float(parsed.get("PRIMER_INTERNAL_MAX_GC", "")),
-        "probe_max_self_comp": float(parsed.get("PRIMER_INTERNAL_MAX_SELF_ANY", "" )),
-        "probe_max_Ns": int(parsed.get("PRIMER_INTERNAL_MAX_NS_ACCEPTED", "")),
-        "probe_min_seq_qual": float(parsed.get("PRIMER_INTERNAL_OLIGO_MIN_QUALITY", "" )),
-        "probe_salt_conc_monocat": float(parsed.get("PRIMER_INTERNAL_OLIGO_SALT_CONC", "" )),
-        "probe_salt_conc_divcat": float(parsed.get("PRIMER_INTERNAL_OLIGO_DIVALENT_CONC", "")),
-        "probe_max_3prime_self_comp": float(parsed.get("PRIMER_INTERNAL_MAX_SELF_END", "")),
-        "probe_max_poly_x": int(parsed.get("PRIMER_INTERNAL_MAX_POLY_X", "")),
-        "probe_DNA_conc": float(parsed.get("PRIMER_INTERNAL_DNA_CONC", "")),
-        "probe_dntp_conc": float(parsed.get("PRIMER_INTERNAL_DNTP_CONC", "")),
-        # set value showing that the file settings has been imported
-        "imported": True
-    })
-    # following import, set pick to False if sequence is present
-    if st.session_state["left"]:
-        st.session_state["pick_left"] = False
-    if st.session_state["right"]:
-        st.session_state["pick_right"] = False
-    if st.session_state["internal"]:
-        st.session_state["pick_internal"] = False
-
-# set standard/default values for parameters    
-defaults = {
-    "sequence": "",
-    "seq_id": "example sequence",
-    "left": "",
-    "right": "",
-    "internal": "",
-    "pick_left": False,
-    "pick_right": False,
-    "pick_internal": False,
-    "product_size_range": "100-300 150-250 301-400 401-500 501-600 601-700 701-850 851-1000",
-    "num_return": 5,
-    "max_template_mispriming": 12.0,
-    "pair_max_template_mispriming": 24.0,
-    "max_repeat_mispriming": 12.0,
-    "pair_max_repeat_mispriming": 24.0,
-    "max_3_prime_stability": 9.0,
-    "save_input_file": False,
-    "input_save_path": os.path.join(os.getcwd(), "primer3_input.txt"),
-    # primer settings
-    "primer_min_size": 18,
-    "primer_opt_size": 20,
-    "primer_max_size": 27,
-    "primer_min_tm": 57.0,
-    "primer_opt_tm": 60.0,
-    "primer_max_tm": 63.0,
-    "primer_min_GC": 20.0,
-    "primer_opt_GC": 50.0,
-    "primer_max_GC": 80.0,
-    "max_tm_diff": 100.0,
-    "primer_max_self_comp": 8.0,
-    "max_Ns": 0,
-    "primer_inside_target_penalty": -1.0,
-    "primer_outside_target_penalty": 0.0,
-    "primer_first_base_index": 1,
-    "primer_salt_conc_monocat": 50.0,
-    "primer_salt_conc_divcat": 0.0,
-    "annealing_oligo_conc": 50.0,
-    "thermo_param_value": "0",
-    "primer_max_3prime_self_comp": 3.0,
-    "max_poly_x": 5,
-    "CG_clamp": 0,
-    "salt_correction_value": "0",
-    "primer_dntp_conc": 0.0,
-    "product_min_tm": -1000000,
-    "product_opt_tm": 0.0,
-    "product_max_tm": 1000000,
-    # probe (internal oligo) settings
-    "probe_min_size": 18,
-    "probe_opt_size": 20,
-    "probe_max_size": 27,
-    "probe_min_tm": 57.0,
-    "probe_opt_tm": 60.0,
-    "probe_max_tm": 63.0,
-    "probe_min_GC": 20.0,
-    "probe_opt_GC": 50.0, 
-    "probe_max_GC": 80.0,
-    "probe_max_self_comp": 12.0,
-    "probe_max_Ns": 0,
-    "probe_min_seq_qual": 0,
-    "probe_salt_conc_monocat": 50.0,
-    "probe_salt_conc_divcat": 0.0,
-    "probe_max_3prime_self_comp": 12.0,
-    "probe_max_poly_x": 5,
-    "probe_DNA_conc": 50.0,
-    "probe_dntp_conc": 0.0,
-    # Primer3 options
-    "liberal_base_checkbox": True,
-    "ambiguity_codes_checkbox": True,
-    "lowercase_masking_checkbox": False,
-    "liberal_base": 0,
-    "ambiguity_codes_consensus": 1,
-    "lowercase_masking": 1,
-}
+upload_signature = tuple((f.name, f.size) for f in uploaded_files)
+if uploaded_files and st.session_state.get("imported") != upload_signature:
+    settings_files = import_settings_files({f.name: f.getvalue().decode("utf-8") for f in uploaded_files})
+    st.session_state["settings_files"] = settings_files
+
+    # a single file is loaded into the input tab, set values before widgets are created
+    if len(settings_files) == 1:
+        name, values, problems = settings_files[0]
+        st.session_state.update(values)
+        st.session_state["auto_excluded_region"] = ""
+        for problem in problems:
+            st.sidebar.warning(f"{name}: {problem}")
+    else:
+        st.sidebar.info(f"{len(settings_files)} settings files loaded, they can be run again as a batch with the 'Settings file replay' design mode.")
+    # set value showing which files have been imported
+    st.session_state["imported"] = upload_signature
+
+# set standard/default values for parameters, from the settings table shared with the settings file import
+defaults = {**SETTING_DEFAULTS, "input_save_path": os.path.join(os.getcwd(), "primer3_input.txt")}
 # initialize session state with default values
 for key, default in defaults.items():
     st.session_state.setdefault(key, default)
 
-### TODO: maybe order this better, so that the settings are grouped together
-# === Full Primer3 v0.4.0 settings template ===
-PRIMER3_TEMPLATE = """SEQUENCE_ID={seq_id}
-SEQUENCE_TEMPLATE={sequence}
-SEQUENCE_PRIMER={seq_primer}
-SEQUENCE_PRIMER_REVCOMP={seq_primer_rev}
-SEQUENCE_INTERNAL_OLIGO={seq_internal}
-SEQUENCE_TARGET={target}
-EXCLUDED_REGION={excluded_region}
-PRIMER_TASK={primer_task}
-PRIMER_THERMODYNAMIC_OLIGO_ALIGNMENT=0
-PRIMER_THERMODYNAMIC_TEMPLATE_ALIGNMENT=0
-PRIMER_PICK_LEFT_PRIMER=1
-PRIMER_PICK_INTERNAL_OLIGO=1
-PRIMER_PICK_RIGHT_PRIMER=1
-PRIMER_NUM_RETURN={num_return}
-PRIMER_PRODUCT_SIZE_RANGE={product_size_range}
-PRIMER_MIN_SIZE={primer_min_size}
-PRIMER_INTERNAL_MIN_SIZE={probe_min_size}
-PRIMER_OPT_SIZE={primer_opt_size}
-PRIMER_INTERNAL_OPT_SIZE={probe_opt_size}
-PRIMER_MAX_SIZE={primer_max_size}
-PRIMER_INTERNAL_MAX_SIZE={probe_max_size}
-PRIMER_MIN_GC={primer_min_GC}
-PRIMER_INTERNAL_MIN_GC={probe_min_GC}
-PRIMER_OPT_GC_PERCENT={primer_opt_GC}
-PRIMER_INTERNAL_OPT_GC_PERCENT={probe_opt_GC}
-PRIMER_MAX_GC={primer_max_GC}
-PRIMER_INTERNAL_MAX_GC={probe_max_GC}
-PRIMER_GC_CLAMP={CG_clamp}
-PRIMER_MAX_END_GC=5
-PRIMER_MIN_TM={primer_min_tm}
-PRIMER_INTERNAL_MIN_TM={probe_min_tm}
-PRIMER_OPT_TM={primer_opt_tm}
-PRIMER_INTERNAL_OPT_TM={probe_opt_tm}
-PRIMER_MAX_TM={primer_max_tm}
-PRIMER_INTERNAL_MAX_TM={probe_max_tm}
-PRIMER_PAIR_MAX_DIFF_TM={max_tm_diff}
-PRIMER_TM_SANTALUCIA={thermo_param_value}
-PRIMER_PRODUCT_MIN_TM={product_min_tm}
-PRIMER_PRODUCT_OPT_TM={product_opt_tm}
-PRIMER_PRODUCT_MAX_TM= {product_max_tm}
-PRIMER_INTERNAL_OLIGO_MIN_QUALITY={probe_min_seq_qual}
-PRIMER_INTERNAL_OLIGO_SALT_CONC={probe_salt_conc_monocat}
-PRIMER_INTERNAL_OLIGO_DIVALENT_CONC={probe_salt_conc_divcat}
-PRIMER_DNTP_CONC={primer_dntp_conc}
-PRIMER_INTERNAL_DNTP_CONC={probe_dntp_conc}
-PRIMER_SALT_CONC={primer_salt_conc_monocat}
-PRIMER_SALT_CORRECTIONS={salt_correction_value}
-PRIMER_DIVALENT_CONC={primer_salt_conc_divcat}
-PRIMER_DNA_CONC={annealing_oligo_conc}
-PRIMER_INTERNAL_DNA_CONC={probe_DNA_conc}
-PRIMER_MAX_SELF_ANY={primer_max_self_comp}
-PRIMER_INTERNAL_MAX_SELF_ANY={probe_max_self_comp}
-PRIMER_MAX_SELF_END={primer_max_3prime_self_comp}
-PRIMER_INTERNAL_MAX_SELF_END={probe_max_3prime_self_comp}
-PRIMER_MAX_END_STABILITY={max_3_prime_stability}
-PRIMER_MAX_NS_ACCEPTED={max_Ns}
-PRIMER_INTERNAL_MAX_NS_ACCEPTED={probe_max_Ns}
-PRIMER_MAX_POLY_X={max_poly_x}
-PRIMER_INTERNAL_MAX_POLY_X={probe_max_poly_x}
-PRIMER_LOWERCASE_MASKING={lowercase_masking}
-PRIMER_LIBERAL_BASE={liberal_base}
-PRIMER_FIRST_BASE_INDEX={primer_first_base_index}
-PRIMER_MAX_MISPRIMING={max_repeat_mispriming}
-PRIMER_PAIR_MAX_MISPRIMING={pair_max_repeat_mispriming}
-PRIMER_MAX_TEMPLATE_MISPRIMING={max_template_mispriming}
-PRIMER_PAIR_MAX_TEMPLATE_MISPRIMING={pair_max_template_mispriming}
-PRIMER_WT_TEMPLATE_MISPRIMING=0.0
-PRIMER_PAIR_WT_TEMPLATE_MISPRIMING=0.0
-PRIMER_LIB_AMBIGUITY_CODES_CONSENSUS={ambiguity_codes_consensus}
-PRIMER_INSIDE_PENALTY={primer_inside_target_penalty}
-PRIMER_OUTSIDE_PENALTY={primer_outside_target_penalty}
-PRIMER_MIN_5_PRIME_OVERLAP_OF_JUNCTION=5
-PRIMER_PRODUCT_OPT_SIZE=0
-PRIMER_PAIR_WT_PRODUCT_SIZE_LT=0.0
-PRIMER_PAIR_WT_PRODUCT_SIZE_GT=0.0
-PRIMER_WT_SIZE_LT=1.0
-PRIMER_INTERNAL_WT_SIZE_LT=1.0
-PRIMER_WT_SIZE_GT=1.0
-PRIMER_INTERNAL_WT_SIZE_GT=1.0
-PRIMER_WT_GC_PERCENT_LT=0.0
-PRIMER_INTERNAL_WT_GC_PERCENT_LT=0.0
-PRIMER_WT_GC_PERCENT_GT=0.0
-PRIMER_INTERNAL_WT_GC_PERCENT_GT=0.0
-PRIMER_WT_TM_LT=1.0
-PRIMER_INTERNAL_WT_TM_LT=1.0
-PRIMER_WT_TM_GT=1.0
-PRIMER_INTERNAL_WT_TM_GT=1.0
-PRIMER_PAIR_WT_DIFF_TM=0.0
-PRIMER_PAIR_MAX_COMPL_ANY=8.00
-PRIMER_WT_SELF_ANY=0.0
-PRIMER_INTERNAL_WT_SELF_ANY=0.0
-PRIMER_PAIR_WT_COMPL_ANY=0.0
-PRIMER_PAIR_MAX_COMPL_END=3.00
-PRIMER_WT_SELF_END=0.0
-PRIMER_INTERNAL_WT_SELF_END=0.0
-PRIMER_PAIR_WT_COMPL_END=0.0
-PRIMER_PAIR_WT_PRODUCT_TM_LT=0.0
-PRIMER_PAIR_WT_PRODUCT_TM_GT=0.0
-PRIMER_TM_FORMULA=0
-PRIMER_SALT_MONOVALENT=51.0
-PRIMER_INTERNAL_SALT_MONOVALENT=50.0
-PRIMER_SALT_DIVALENT=0.0
-PRIMER_INTERNAL_SALT_DIVALENT=0.0
-PRIMER_WT_END_STABILITY=0.0
-PRIMER_MIN_THREE_PRIME_DISTANCE=-1
-PRIMER_PICK_ANYWAY=1
-PRIMER_EXPLAIN_FLAG=1
-PRIMER_WT_POS_PENALTY=0.0
-PRIMER_SEQUENCING_LEAD=50
-PRIMER_SEQUENCING_SPACING=500
-PRIMER_SEQUENCING_INTERVAL=250
-PRIMER_SEQUENCING_ACCURACY=20
-PRIMER_WT_END_QUAL=0.0
-PRIMER_INTERNAL_WT_END_QUAL=0.0
-PRIMER_MAX_LIBRARY_MISPRIMING=12.00
-PRIMER_INTERNAL_MAX_LIBRARY_MISHYB=12.00
-PRIMER_PAIR_MAX_LIBRARY_MISPRIMING=24.00
-PRIMER_WT_LIBRARY_MISPRIMING=0.0
-PRIMER_INTERNAL_WT_LIBRARY_MISHYB=0.0
-PRIMER_PAIR_WT_LIBRARY_MISPRIMING=0.0
-PRIMER_MIN_QUALITY=0
-PRIMER_INTERNAL_MIN_QUALITY=0
-PRIMER_MIN_END_QUALITY=0
-PRIMER_QUALITY_RANGE_MIN=0
-PRIMER_QUALITY_RANGE_MAX=100
-PRIMER_WT_SEQ_QUAL=0.0
-PRIMER_INTERNAL_WT_SEQ_QUAL=0.0
-PRIMER_PAIR_WT_PR_PENALTY=1.0
-PRIMER_PAIR_WT_IO_PENALTY=0.0
-=
-"""
+# restore a snapshot (settings, output and batch results) without running Primer3 again
+snapshot_file = st.sidebar.file_uploader(
+    label="Upload snapshot to reopen its results",
+    accept_multiple_files=False,
+    type="p3gsnap",
+    key="snapshot_uploader"
+)
+if snapshot_file and st.session_state.get("snapshot_loaded") != (snapshot_file.name, snapshot_file.size):
+    st.session_state["snapshot_loaded"] = (snapshot_file.name, snapshot_file.size)
+    try:
+        snapshot = read_snapshot(snapshot_file.getvalue())
+    except ValueError as e:
+        st.sidebar.error(f"Could not read snapshot: {e}")
+    else:
+        st.session_state.update({k: v for k, v in snapshot["values"].items() if k in defaults or k in RECORD_KEYS})
+        st.session_state["raw_output"] = snapshot["output"]
+        st.session_state["raw_settings"] = snapshot["settings"]
+        st.session_state["primer3_success"] = snapshot["success"]
+        st.session_state.update(snapshot["batches"])
+        st.sidebar.success(f"Snapshot from {snapshot['created']} restored.")
 
+# apply settings handed over from the design modes, before the widgets are created
+if "pending_settings" in st.session_state:
+    st.session_state.update(st.session_state.pop("pending_settings"))
 
 # set tabs for the Streamlit app
-tab1, tab2, tab3, tab4 = st.tabs([
+tab1, tab2, tab3, tab4, tab5 = st.tabs([
     "🧬 Input Settings",
     "📄 Primer3 Raw Output",
     "⚠️ Primer3 Warnings",
     "📊 Primer3 Output",
-    
+    "🧰 Design Modes",
 ])
 
 # === Tab 1: Input ===
@@ -624,6 +479,33 @@ with tab1:
             st.session_state["right"] = ""
         st.text_input("Reverse Primer (RevComp)", key="right", disabled=st.session_state.get("pick_right", True))
     
+    # pre-flight check where the provided oligos bind, before Primer3 is run
+    provided_oligos = {
+        "Forward primer": st.session_state.get("left", ""),
+        "Probe": st.session_state.get("internal", ""),
+        "Reverse primer": st.session_state.get("right", ""),
+    }
+    if st.session_state["sequence"].strip() and any(oligo.strip() for oligo in provided_oligos.values()):
+        with st.expander("Binding sites of the provided oligos", expanded=True):
+            st.number_input("Allowed mismatches", min_value=0, max_value=5, value=2, key="locate_mismatches", help="Sites with up to this many mismatches are listed, on both strands of the template.")
+            binding_sites, site_counts = cached_locate_oligos(
+                st.session_state["sequence"], provided_oligos, st.session_state["locate_mismatches"], st.session_state["primer_first_base_index"]
+            )
+            # a forward primer has to bind as given (+), a reverse primer as its reverse complement (-)
+            for label, strand in (("Forward primer", "+"), ("Reverse primer", "-"), ("Probe", None)):
+                if label not in site_counts:
+                    continue
+                exact = binding_sites[(binding_sites["Oligo"] == label) & (binding_sites["Mismatches"] == 0)]
+                if strand is not None:
+                    exact = exact[exact["Strand"] == strand]
+                if site_counts[label] == 0:
+                    st.error(f"{label}: no binding site found with up to {st.session_state['locate_mismatches']} mismatches. Primer3 will fail for this oligo.")
+                elif exact.empty:
+                    st.warning(f"{label}: no exact match{' on the expected strand (' + strand + ')' if strand else ''}, only near matches were found.")
+                elif site_counts[label] > 1:
+                    st.info(f"{label}: {site_counts[label]} binding sites found, the oligo may bind more than once.")
+            st.dataframe(binding_sites, use_container_width=True, hide_index=True)
+    
 
     
     # set target and excluded regions
@@ -644,8 +526,111 @@ with tab1:
     else:
         st.text_input("Excluded Region (optional)", key="excluded_region", help="Specify manually or use angle brackets like TCA<CTG>GAT in the sequence above.")
 
+    # automatic excluded regions only apply to the sequence they were found on
+    if st.session_state["auto_excluded_region"] and not auto_excluded_region(st.session_state):
+        st.session_state["auto_excluded_region"] = ""
+        st.session_state.pop("complexity_regions", None)
+        st.session_state.pop("hairpin_regions", None)
+        st.warning("The sequence changed since the automatic excluded regions were found, so they were removed. Scan the new sequence again if needed.")
+
+    # automatic excluded regions from the sequence complexity scan
+    with st.expander("Automatic excluded regions (complexity scan)"):
+        st.markdown("Flags extreme GC windows, homopolymer runs, low complexity (DUST) and dinucleotide repeats, and adds the merged regions to the excluded regions. Regions overlapping the target are left out.")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.number_input("GC window", min_value=10, value=COMPLEXITY_DEFAULTS["window"], key="complexity_window")
+            st.number_input("Merge gap", min_value=0, value=COMPLEXITY_DEFAULTS["merge_gap"], key="complexity_merge_gap", help="Flagged regions closer than this are joined.")
+        with col2:
+            st.number_input("Min GC %", min_value=0.0, max_value=100.0, value=COMPLEXITY_DEFAULTS["gc_min"], key="complexity_gc_min")
+            st.number_input("Max GC %", min_value=0.0, max_value=100.0, value=COMPLEXITY_DEFAULTS["gc_max"], key="complexity_gc_max")
+        with col3:
+            st.number_input("Homopolymer length", min_value=2, value=COMPLEXITY_DEFAULTS["homopolymer"], key="complexity_homopolymer")
+            st.number_input("Dinucleotide repeats", min_value=2, value=COMPLEXITY_DEFAULTS["dinucleotide_repeats"], key="complexity_dinucleotide")
+        with col4:
+            st.number_input("DUST threshold", min_value=0.5, value=COMPLEXITY_DEFAULTS["dust_threshold"], step=0.5, key="complexity_dust", help="Triplet repetitiveness score of 64 base windows, random sequence scores about 0.5.")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔍 Scan sequence", key="complexity_scan"):
+                masks = complexity_masks(
+                    st.session_state["sequence"],
+                    window=st.session_state["complexity_window"],
+                    gc_min=st.session_state["complexity_gc_min"],
+                    gc_max=st.session_state["complexity_gc_max"],
+                    homopolymer=st.session_state["complexity_homopolymer"],
+                    dust_threshold=st.session_state["complexity_dust"],
+                    dinucleotide_repeats=st.session_state["complexity_dinucleotide"],
+                )
+                regions = complexity_regions(masks, st.session_state["complexity_merge_gap"], st.session_state["primer_first_base_index"])
+                regions = drop_target_overlaps(regions, st.session_state["target"])
+                st.session_state["auto_excluded_region"] = excluded_region_string(regions)
+                st.session_state["auto_excluded_sequence"] = clean_sequence(st.session_state["sequence"]).upper()
+                st.session_state["complexity_regions"] = regions
+        with col2:
+            if st.button("Clear automatic regions", key="complexity_clear"):
+                st.session_state["auto_excluded_region"] = ""
+                st.session_state.pop("complexity_regions", None)
+        if st.session_state["auto_excluded_region"]:
+            st.info(f"{len(st.session_state['auto_excluded_region'].split())} automatic excluded region(s) are added to EXCLUDED_REGION.")
+            if "complexity_regions" in st.session_state:
+                st.dataframe(st.session_state["complexity_regions"], use_container_width=True, hide_index=True)
+        elif "complexity_regions" in st.session_state:
+            st.success("No problem regions found.")
+
+    # template secondary structure, hairpin dG of sliding windows computed with primer3-py or ntthal
+    with st.expander("Template secondary structure (hairpin scan)"):
+        st.markdown("Computes the hairpin dG of sliding windows over the template with primer3-py, or with ntthal (installed with Primer3) when primer3-py is not installed. Bases in windows at or below the threshold can be added to the excluded regions, and the scan is shown as an overlay in the binding site view of the 'Primer3 Output' tab.")
+        col1, col2, col3, col4, col5 = st.columns(5)
+        with col1:
+            st.number_input("Window", min_value=10, max_value=60, value=40, key="hairpin_window", help="Window length, at most 60 bases (Primer3 thermodynamic alignment limit).")
+        with col2:
+            st.number_input("Step", min_value=1, value=5, key="hairpin_step")
+        with col3:
+            st.number_input("Temperature (°C)", min_value=0.0, max_value=100.0, value=60.0, key="hairpin_temperature", help="Temperature at which the dG is calculated, e.g. the annealing temperature.")
+        with col4:
+            st.number_input("dG threshold (kcal/mol)", max_value=0.0, value=-4.0, step=0.5, key="hairpin_threshold")
+        with col5:
+            st.number_input("Parallel ntthal runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="hairpin_workers", help="Only used when primer3-py is not installed and ntthal is run once per window.")
+        col1, col2 = st.columns(2)
+        with col1:
+            scan_clicked = st.button("🔍 Scan hairpins", key="hairpin_scan")
+        with col2:
+            add_clicked = st.button("Add structured regions to excluded regions", key="hairpin_add")
+        if (scan_clicked or add_clicked) and not st.session_state["sequence"].strip():
+            st.warning("Please enter a DNA sequence first.")
+        elif scan_clicked or add_clicked:
+            try:
+                with st.spinner("Scanning template structure..."):
+                    scan = hairpin_scan(
+                        st.session_state["sequence"], st.session_state,
+                        window=st.session_state["hairpin_window"],
+                        step=st.session_state["hairpin_step"],
+                        temperature=st.session_state["hairpin_temperature"],
+                        max_workers=st.session_state["hairpin_workers"],
+                    )
+            except (FileNotFoundError, RuntimeError) as e:
+                st.error(f"Could not compute the hairpins: {e}")
+            else:
+                threshold = st.session_state["hairpin_threshold"]
+                st.session_state["hairpin_overlay"] = (clean_sequence(st.session_state["sequence"]).upper(), hairpin_overlay(scan, threshold))
+                structured = drop_target_overlaps(
+                    hairpin_regions(scan, threshold, first_base_index=st.session_state["primer_first_base_index"]), st.session_state["target"]
+                )
+                st.session_state["hairpin_regions"] = structured
+                if add_clicked:
+                    current = st.session_state["auto_excluded_region"].split()
+                    added = [region for region in excluded_region_string(structured).split() if region not in current]
+                    st.session_state["auto_excluded_region"] = " ".join(current + added)
+                    st.session_state["auto_excluded_sequence"] = clean_sequence(st.session_state["sequence"]).upper()
+                    st.success(f"{len(added)} structured region(s) added to the automatic excluded regions.")
+        if "hairpin_regions" in st.session_state:
+            if st.session_state["hairpin_regions"].empty:
+                st.success("No windows at or below the dG threshold.")
+            else:
+                st.dataframe(st.session_state["hairpin_regions"].drop(columns="Reason"), use_container_width=True, hide_index=True)
+
     # product size ranges        
     st.text_input("Custom Product Size Range", key="product_size_range", help="Space-separated size ranges (e.g. 100-200 300-400)")
+    st.checkbox("Run product size ranges in parallel", key="split_size_ranges", help="Runs each product size range as its own Primer3 job at the same time and merges the pairs as Primer3 would. Can be faster for long templates with many ranges.")
     
     #### Basic settings ####
     col1, col2 = st.columns(2)
@@ -1080,30 +1065,12 @@ with tab1:
                 help="Concentration of dNTPs in millimolar (mM). Default is 0.0."
             )
 
-    ### check if minimum and maximum sizes are respected
-    left_seq = st.session_state.get("left", "")
-    right_seq = st.session_state.get("right", "")
-    internal_seq = st.session_state.get("internal", "")
-
-    min_primer = st.session_state.get("primer_min_size", 18)
-    min_internal = st.session_state.get("probe_min_size", 18)
-    max_primer = st.session_state.get("primer_max_size", 27)
-    max_internal = st.session_state.get("probe_max_size", 27)
-
-    if left_seq and len(left_seq) < min_primer:
-        st.warning(f"Forward primer sequence is shorter ({len(left_seq)}) than the minimum set length ({min_primer}).")
-    if right_seq and len(right_seq) < min_primer:
-        st.warning(f"Reverse primer sequence is shorter ({len(right_seq)}) than the minimum set length ({min_primer}).")
-    if internal_seq and len(internal_seq) < min_internal:
-        st.warning(f"Probe sequence is shorter ({len(internal_seq)}) than the minimum set length ({min_internal}).")
-    if left_seq and len(left_seq) > max_primer:
-        st.warning(f"Forward primer sequence is longer ({len(left_seq)}) than the maximum set length ({max_primer}).")
-    if left_seq and len(right_seq) > max_primer:
-        st.warning(f"Forward primer sequence is longer ({len(right_seq)}) than the maximum set length ({max_primer}).")
-    if internal_seq and len(internal_seq) > max_internal:
-        st.warning(f"Probe sequence is longer ({len(internal_seq)}) than the maximum set length ({max_internal})")
-                
-    
+    ### check if minimum and maximum sizes are respected (the rules are evaluated once per settings change)
+    validation = validate_settings(st.session_state)
+    for stage, severity, message in validation:
+        if stage == "oligo":
+            (st.error if severity == "error" else st.warning)(message)
+
     # add option to save input settings into file 
     save_input_file = st.checkbox("Save input settings file after run", value=defaults["save_input_file"], key="save_input_file")
     input_save_path = ""
@@ -1133,70 +1100,11 @@ with tab1:
     # if st.session_state["run"]:
     #     st.toast("Running Primer3 with the provided settings...", icon="🔄")
 
-    # validation checks
-    if st.session_state["run"] and not st.session_state["sequence"].strip():
-        st.warning("Please enter a DNA sequence before running Primer3.")
-    
-    # warning for if one of the primers is not provided or set to pick:
-    if (
-        st.session_state["run"]
-        and st.session_state["sequence"].strip()
-        and not st.session_state.get("pick_left", False)
-        and not st.session_state.get("pick_right", False)
-        and not st.session_state.get("left", "").strip()
-        and not st.session_state.get("right", "").strip()
-    ):
-        st.warning("You must either select to pick primers or provide sequences for the forward and/or reverse primers.")
-    if (
-        st.session_state["run"]
-        and st.session_state["sequence"].strip()
-        and (
-            (
-                st.session_state.get("left", "").strip()
-                and not st.session_state.get("pick_right", False)
-                and not st.session_state.get("right", "").strip()
-            )
-            or
-            (
-                st.session_state.get("right", "").strip()
-                and not st.session_state.get("pick_left", False)
-                and not st.session_state.get("left", "").strip()
-            )
-        )
-    ):
-        st.warning("You must provide both primer sequences or select to pick the missing primer.")
-    
-    # add additional warnings for optimum primer and probe settings
-    if (st.session_state["primer_opt_size"] < st.session_state["primer_min_size"]
-        or st.session_state["primer_opt_size"] > st.session_state["primer_max_size"]
-    ):
-        st.warning(f"Optimal primer size ({st.session_state['primer_opt_size']}) should be between minimum ({st.session_state['primer_min_size']}) and maximum ({st.session_state['primer_max_size']}) size.")
-
-    if (st.session_state["primer_opt_tm"] < st.session_state["primer_min_tm"]
-        or st.session_state["primer_opt_tm"] > st.session_state["primer_max_tm"]
-    ):
-        st.warning(f"Optimal primer Tm ({st.session_state['primer_opt_tm']}) should be between minimum ({st.session_state['primer_min_tm']}) and maximum ({st.session_state['primer_max_tm']}) Tm.")
-
-    if (st.session_state["primer_opt_GC"] < st.session_state["primer_min_GC"]
-        or st.session_state["primer_opt_GC"] > st.session_state["primer_max_GC"]
-    ):
-        st.warning(f"Optimal primer GC% ({st.session_state['primer_opt_GC']}) should be between minimum ({st.session_state['primer_min_GC']}) and maximum ({st.session_state['primer_max_GC']}) GC%.")
-
-    # additional warnings for probe settings 
-    if (st.session_state["probe_opt_size"] < st.session_state["probe_min_size"]
-        or st.session_state["probe_opt_size"] > st.session_state["probe_max_size"]
-    ):
-        st.warning(f"Optimal probe size ({st.session_state['probe_opt_size']}) should be between minimum ({st.session_state['probe_min_size']}) and maximum ({st.session_state['probe_max_size']}) size.")
-
-    if (st.session_state["probe_opt_tm"] < st.session_state["probe_min_tm"]
-        or st.session_state["probe_opt_tm"] > st.session_state["probe_max_tm"]
-    ):
-        st.warning(f"Optimal probe Tm ({st.session_state['probe_opt_tm']}) should be between minimum ({st.session_state['probe_min_tm']}) and maximum ({st.session_state['probe_max_tm']}) Tm.")
-
-    if (st.session_state["probe_opt_GC"] < st.session_state["probe_min_GC"]
-        or st.session_state["probe_opt_GC"] > st.session_state["probe_max_GC"]
-    ):
-        st.warning(f"Optimal probe GC% ({st.session_state['probe_opt_GC']}) should be between minimum ({st.session_state['probe_min_GC']}) and maximum ({st.session_state['probe_max_GC']}) GC%.")
+    # validation checks, the input is only checked when Primer3 is run and errors block the run
+    for stage, severity, message in validation:
+        if stage == "range" or (stage == "run" and st.session_state["run"]):
+            (st.error if severity == "error" else st.warning)(message)
+    blocking_errors = any(severity == "error" for _, severity, _ in validation)
         
     # save input file if requested
     if st.session_state.get("run") and st.session_state.get("save_input_file") and st.session_state.get("input_save_path"):
@@ -1210,139 +1118,29 @@ with tab1:
         #else:
             #st.info(f"Path exists: {resolved_path}")
 
-    if st.session_state.get("run") and st.session_state.get("sequence"):
-
-        # determine primer task
-        primer_task = determine_primer_task(
-            st.session_state["pick_left"],
-            st.session_state["pick_right"],
-            st.session_state["pick_internal"],
-            st.session_state["left"],
-            st.session_state["right"],
-            st.session_state["internal"]
-        )
-
-        # clean sequence and filter template
-        template_lines = PRIMER3_TEMPLATE.splitlines()
-        filtered_lines = []
-        sequence_cleaned = st.session_state["sequence"].replace("\n", "").replace("[", "").replace("]", "")
-        for line in template_lines:
-            if line.startswith("SEQUENCE_TEMPLATE="):
-                line = f"SEQUENCE_TEMPLATE={sequence_cleaned}"
-            if line.startswith("SEQUENCE_PRIMER=") and st.session_state["pick_left"]:
-                continue
-            if line.startswith("SEQUENCE_PRIMER_REVCOMP=") and st.session_state["pick_right"]:
-                continue
-            if line.startswith("SEQUENCE_INTERNAL_OLIGO="):
-                # Only keep if the primer_task actually uses a probe
-                if st.session_state["pick_internal"] or primer_task not in [
-                    "pick_hyb_probe_only",
-                    "pick_pcr_primers_and_hyb_probe",
-                    "pick_pcr_primers_and_hyb_oligo"
-                ]:
-                    continue
-            filtered_lines.append(line)
-        template = "\n".join(filtered_lines)
+    if st.session_state.get("run") and not blocking_errors:
 
         # fill template with session state values
-        settings_filled = template.format(
-            seq_id=st.session_state["seq_id"],
-            sequence=sequence_cleaned,
-            seq_primer=st.session_state["left"],
-            seq_primer_rev=st.session_state["right"],
-            seq_internal=st.session_state["internal"],
-            target=st.session_state["target"],
-            product_size_range=st.session_state["product_size_range"],
-            excluded_region=st.session_state["excluded_region"],
-            num_return=st.session_state["num_return"],
-            max_template_mispriming=st.session_state["max_template_mispriming"],
-            pair_max_template_mispriming=st.session_state["pair_max_template_mispriming"],
-            max_repeat_mispriming=st.session_state["max_repeat_mispriming"],
-            max_3_prime_stability=st.session_state["max_3_prime_stability"],
-            pair_max_repeat_mispriming=st.session_state["pair_max_repeat_mispriming"],
-            primer_task=primer_task,
-
-            ### general primer picking settings
-            primer_min_size=st.session_state["primer_min_size"],
-            primer_min_tm=st.session_state["primer_min_tm"],
-            product_min_tm=st.session_state["product_min_tm"],
-            primer_min_GC=st.session_state["primer_min_GC"],
-            primer_opt_size=st.session_state["primer_opt_size"],
-            primer_opt_tm=st.session_state["primer_opt_tm"],
-            product_opt_tm=st.session_state["product_opt_tm"],
-            primer_opt_GC=st.session_state["primer_opt_GC"],
-            primer_max_size=st.session_state["primer_max_size"],
-            primer_max_tm=st.session_state["primer_max_tm"],
-            product_max_tm=st.session_state["product_max_tm"],
-            primer_max_GC=st.session_state["primer_max_GC"],
-            max_tm_diff=st.session_state["max_tm_diff"],
-            thermo_param_value=st.session_state["thermo_param_value"],
-            primer_max_self_comp=st.session_state["primer_max_self_comp"],
-            max_Ns=st.session_state["max_Ns"],
-            primer_inside_target_penalty=st.session_state["primer_inside_target_penalty"],
-            primer_first_base_index=st.session_state["primer_first_base_index"],
-            primer_salt_conc_monocat=st.session_state["primer_salt_conc_monocat"],
-            primer_salt_conc_divcat=st.session_state["primer_salt_conc_divcat"],
-            annealing_oligo_conc=st.session_state["annealing_oligo_conc"],
-            primer_max_3prime_self_comp=st.session_state["primer_max_3prime_self_comp"],
-            max_poly_x=st.session_state["max_poly_x"],
-            primer_outside_target_penalty=st.session_state["primer_outside_target_penalty"],
-            CG_clamp=st.session_state["CG_clamp"],
-            salt_correction_value=st.session_state["salt_correction_value"],
-            primer_dntp_conc=st.session_state["primer_dntp_conc"],  
-            liberal_base=st.session_state["liberal_base"],
-
-            ### general probe picking settings
-            probe_min_size=st.session_state["probe_min_size"],
-            probe_min_tm=st.session_state["probe_min_tm"],
-            probe_min_GC=st.session_state["probe_min_GC"],
-            probe_opt_size=st.session_state["probe_opt_size"],
-            probe_opt_tm=st.session_state["probe_opt_tm"],
-            probe_opt_GC=st.session_state["probe_opt_GC"],
-            probe_max_size=st.session_state["probe_max_size"],
-            probe_max_tm=st.session_state["probe_max_tm"],
-            probe_max_GC=st.session_state["probe_max_GC"],
-            probe_max_self_comp=st.session_state["probe_max_self_comp"],
-            probe_max_Ns=st.session_state["probe_max_Ns"],
-            probe_min_seq_qual=st.session_state["probe_min_seq_qual"],
-            probe_salt_conc_monocat=st.session_state["probe_salt_conc_monocat"],
-            probe_salt_conc_divcat=st.session_state["probe_salt_conc_divcat"],
-            probe_max_3prime_self_comp=st.session_state["probe_max_3prime_self_comp"],
-            probe_max_poly_x=st.session_state["probe_max_poly_x"],
-            probe_DNA_conc=st.session_state["probe_DNA_conc"],
-            probe_dntp_conc=st.session_state["probe_dntp_conc"],
-            ambiguity_codes_consensus=st.session_state["ambiguity_codes_consensus"],
-            lowercase_masking=st.session_state["lowercase_masking"],
-        )
+        settings_filled = fill_primer3_settings(st.session_state)
 
-        # run Primer3 with temporary settings file
-        with tempfile.TemporaryDirectory() as tmpdir:
-            input_path = os.path.join(tmpdir, "input.txt")
-            with open(input_path, "w") as f:
-                f.write(settings_filled)
-
-            # save input file to user path if requested
-            if st.session_state.get("save_input_file") and st.session_state.get("input_save_path"):
-                try:
-                    with open(st.session_state["input_save_path"], "w") as f:
-                        f.write(settings_filled)
-                    st.success(f"Input file saved to: {st.session_state['input_save_path']}")
-                except Exception as e:
-                    st.error(f"Failed to save input file: {e}")
-
-            # run Primer3 and store results in session_state
+        # save input file to user path if requested
+        if st.session_state.get("save_input_file") and st.session_state.get("input_save_path"):
             try:
-                result = subprocess.run(
-                    ["primer3_core", input_path],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                st.session_state["raw_output"] = result.stdout
-                st.session_state["primer3_success"] = True
-            except subprocess.CalledProcessError as e:
-                st.session_state["raw_output"] = e.stderr
-                st.session_state["primer3_success"] = False
+                with open(st.session_state["input_save_path"], "w") as f:
+                    f.write(settings_filled)
+                st.success(f"Input file saved to: {st.session_state['input_save_path']}")
+            except Exception as e:
+                st.error(f"Failed to save input file: {e}")
+
+        # run Primer3 and store results in session_state
+        if st.session_state.get("split_size_ranges") and len(st.session_state["product_size_range"].split()) > 1:
+            st.session_state["raw_output"], st.session_state["primer3_success"], _ = run_split_product_ranges(st.session_state)
+        else:
+            st.session_state["raw_output"], st.session_state["primer3_success"], reused = run_primer3_reused(settings_filled)
+            if reused:
+                st.info("These settings were run before, the output is reopened from the run history instead of running Primer3 again.")
+        # keep the settings that produced the output, e.g. for snapshots
+        st.session_state["raw_settings"] = settings_filled
             
 output = st.session_state.get("raw_output", "")
 
@@ -1356,6 +1154,24 @@ with tab2:
         else:
             st.error("Primer3 execution failed.")
         st.text_area("Primer3 Output", st.session_state["raw_output"], height=400)
+
+        # snapshot of the current settings, output and batch results, to reopen them later without running again
+        if st.button("📦 Create snapshot", key="snapshot_create", help="Packs the settings, the raw and parsed output and the batch results of this session into one compressed file."):
+            st.session_state["snapshot_bytes"] = build_snapshot(
+                {key: st.session_state[key] for key in (*defaults, *RECORD_KEYS) if key in st.session_state},
+                st.session_state.get("raw_settings", ""),
+                st.session_state["raw_output"],
+                st.session_state.get("primer3_success", False),
+                {key: st.session_state[key] for key in BATCH_RESULT_KEYS.values() if key in st.session_state},
+            )
+        if "snapshot_bytes" in st.session_state:
+            st.download_button(
+                label="Download snapshot",
+                data=st.session_state["snapshot_bytes"],
+                file_name=f"{st.session_state['seq_id'] or 'primer3'}.p3gsnap",
+                mime="application/gzip",
+                key="snapshot_download"
+            )
     else:
         st.info("Go to the Input tab, enter your sequence and press 'Run Primer3'.")
         
@@ -1370,45 +1186,12 @@ with tab3:
     no_primers = False
 
 
-    # --- primer checks
-    checks = [
-        (
-            st.session_state["primer_opt_size"] < st.session_state["primer_min_size"]
-            or st.session_state["primer_opt_size"] > st.session_state["primer_max_size"],
-            f"Optimal primer size ({st.session_state['primer_opt_size']}) should be between minimum ({st.session_state['primer_min_size']}) and maximum ({st.session_state['primer_max_size']}) size."
-        ),
-        (
-            st.session_state["primer_opt_tm"] < st.session_state["primer_min_tm"]
-            or st.session_state["primer_opt_tm"] > st.session_state["primer_max_tm"],
-            f"Optimal primer Tm ({st.session_state['primer_opt_tm']}) should be between minimum ({st.session_state['primer_min_tm']}) and maximum ({st.session_state['primer_max_tm']}) Tm."
-        ),
-        (
-            st.session_state["primer_opt_GC"] < st.session_state["primer_min_GC"]
-            or st.session_state["primer_opt_GC"] > st.session_state["primer_max_GC"],
-            f"Optimal primer GC% ({st.session_state['primer_opt_GC']}) should be between minimum ({st.session_state['primer_min_GC']}) and maximum ({st.session_state['primer_max_GC']}) GC%."
-        ),
-        (
-            st.session_state["probe_opt_size"] < st.session_state["probe_min_size"]
-            or st.session_state["probe_opt_size"] > st.session_state["probe_max_size"],
-            f"Optimal probe size ({st.session_state['probe_opt_size']}) should be between minimum ({st.session_state['probe_min_size']}) and maximum ({st.session_state['probe_max_size']}) size."
-        ),
-        (
-            st.session_state["probe_opt_tm"] < st.session_state["probe_min_tm"]
-            or st.session_state["probe_opt_tm"] > st.session_state["probe_max_tm"],
-            f"Optimal probe Tm ({st.session_state['probe_opt_tm']}) should be between minimum ({st.session_state['probe_min_tm']}) and maximum ({st.session_state['probe_max_tm']}) Tm."
-        ),
-        (
-            st.session_state["probe_opt_GC"] < st.session_state["probe_min_GC"]
-            or st.session_state["probe_opt_GC"] > st.session_state["probe_max_GC"],
-            f"Optimal probe GC% ({st.session_state['probe_opt_GC']}) should be between minimum ({st.session_state['probe_min_GC']}) and maximum ({st.session_state['probe_max_GC']}) GC%."
-        ),
-    ]
-
-    # loop once
-    for condition, message in checks:
-        if condition:
-            st.warning(message)
-            minor_warning_detected = True
+    # --- primer and probe min/opt/max checks
+    for stage, _, message in validation:
+        if stage != "range":
+            continue
+        st.warning(message)
+        minor_warning_detected = True
     
     # --- set logic for different checks (missing primer seqs, warnings, errors) ---
     no_sequence = not st.session_state.get("sequence", "").strip()
@@ -1582,204 +1365,57 @@ with tab4:
                 lines = lines[i:] 
                 break
 
-        # count how many results there are
-        num_results = 0
-        for line in lines:
-            if line.startswith("PRIMER_PAIR_") and "_PENALTY=" in line:
-                parts = line.split("_")
-                if parts[2].isdigit():
-                    idx = int(line.split("_")[2])
-                    num_results = max(num_results, idx + 1)
-
-        # setup result for later export
-        all_results_for_export = []        
-
-        # for each result, extract the relevant info
-        for idx in range(num_results):
-            st.subheader(f"Result {idx+1}")
-            row_data = []
-            # only include HYB OLIGO if probe is picked or provided
-            primer_rows = [
-                ("LEFT PRIMER", "PRIMER_LEFT"),
-                ("RIGHT PRIMER", "PRIMER_RIGHT"),
-            ]
-            if st.session_state.get("pick_internal") or st.session_state.get("internal", "").strip():
-                primer_rows.append(("HYB OLIGO", "PRIMER_INTERNAL"))
-
-            for label, prefix in primer_rows:
-                seq = None
-                start = None
-                length = None
-                tm = None
-                gc = None
-                any_ = None
-                end = None
-
-                for line in lines:
-                    if line.startswith(f"{prefix}_{idx}_SEQUENCE="):
-                        seq = line.split("=", 1)[1]
-                    if line.startswith(f"{prefix}_{idx}="):
-                        parts = line.split("=", 1)[1].split(",")
-                        if len(parts) == 2:
-                            start = parts[0]
-                            length = parts[1]
-                    if line.startswith(f"{prefix}_{idx}_TM="):
-                        tm = line.split("=", 1)[1]
-                    if line.startswith(f"{prefix}_{idx}_GC_PERCENT="):
-                        gc = line.split("=", 1)[1]
-                    if line.startswith(f"{prefix}_{idx}_SELF_ANY="):
-                        any_ = line.split("=", 1)[1]
-                    if line.startswith(f"{prefix}_{idx}_SELF_END="):
-                        end = line.split("=", 1)[1]
-
-                row_data.append({
-                    "Type": label,
-                    "Start": start,
-                    "Len": length,
-                    "Tm": tm,
-                    "GC%": gc,
-                    "Any": any_,
-                    "3'": end,
-                    "Seq": seq,
-                })
-            st.dataframe(pd.DataFrame(row_data), use_container_width=True, hide_index=True)
-
-            # product info
-            product_data = []
-            product_size = None
-            self_comp = None
-            prime_end = None
-            product_tm = None
-
-            #st.subheader(f"Result {idx+1} product info")
-            for line in lines:
-                if line.startswith(f"PRIMER_PAIR_{idx}_PRODUCT_SIZE="):
-                    product_size = line.split("=", 1)[1] 
-                if line.startswith(f"PRIMER_PAIR_{idx}_COMPL_ANY="):
-                    self_comp = line.split("=", 1)[1]             
-                if line.startswith(f"PRIMER_PAIR_{idx}_COMPL_END="):
-                    prime_end = line.split("=", 1)[1]
-                if line.startswith(f"PRIMER_PAIR_{idx}_PRODUCT_TM"):
-                    product_tm = line.split("=", 1)[1]    
-                
-            product_data.append({
-                "Product size": product_size,
-                "Product Tm": product_tm,
-                "Self complementary": self_comp,
-                "3' end complementary": prime_end,
-                })
-        
+        # all results go into one grid, only the selected result is shown in detail
+        parsed_output = parse_primer3_input_file(output)
+        include_internal = bool(st.session_state.get("pick_internal") or st.session_state.get("internal", "").strip())
+        results = results_grid(parsed_output, include_internal)
+        num_results = len(results)
+
+        # hairpin overlay from the template structure scan, only if it was run on this sequence
+        seq = clean_sequence(st.session_state.get("sequence", ""))
+        overlay_sequence, overlay = st.session_state.get("hairpin_overlay", ("", ""))
+        if overlay_sequence != seq.upper():
+            overlay = ""
+
+        if num_results:
+            st.subheader(f"Results ({num_results})")
+            result_filter = st.text_input(
+                "Filter results",
+                key="result_filter",
+                help="Only show results with an oligo containing this sequence. Click a column header to sort, click a row to show its details."
+            ).strip().upper()
+            shown_results = results
+            if result_filter:
+                sequence_columns = [column for column in ("Forward primer", "Reverse primer", "Probe") if column in results]
+                matches = results[sequence_columns].apply(lambda column: column.fillna("").str.contains(result_filter, regex=False))
+                shown_results = results[matches.any(axis=1)]
+
+            # a row selection is kept by output and result number, see result_grid_key and shown_result_index
+            output_key = settings_hash(output)
+            grid = st.dataframe(
+                shown_results,
+                use_container_width=True,
+                hide_index=True,
+                on_select="rerun",
+                selection_mode="single-row",
+                key=result_grid_key(output_key, result_filter)
+            )
+            if grid.selection.rows:
+                st.session_state["selected_result"] = (output_key, int(shown_results["Result"].iloc[grid.selection.rows[0]]))
 
-            st.dataframe(pd.DataFrame(product_data), use_container_width=True, hide_index=True)
-
-
-            # get binding info from output
-            left_start, left_len = None, None
-            right_start, right_len = None, None
-            hyb_start, hyb_len = None, None
-            target_start, target_len = None, None
-            excluded_start, excluded_len = None, None
-            for line in lines:
-                if line.startswith(f"PRIMER_LEFT_{idx}="):
-                    parts = line.split("=", 1)[1].split(",")
-                    if len(parts) == 2:
-                        left_start, left_len = int(parts[0]), int(parts[1])
-                if line.startswith(f"PRIMER_RIGHT_{idx}="):
-                    parts = line.split("=", 1)[1].split(",")
-                    if len(parts) == 2:
-                        right_start, right_len = int(parts[0]), int(parts[1])
-                if line.startswith(f"PRIMER_INTERNAL_{idx}="):
-                    parts = line.split("=", 1)[1].split(",")
-                    if len(parts) == 2:
-                        hyb_start, hyb_len = int(parts[0]), int(parts[1])
-                if line.startswith("SEQUENCE_TARGET="):
-                    parts = line.split("=", 1)[1].split(",")
-                    if len(parts) ==2: 
-                        target_start, target_len = int(parts[0]), int(parts[1])
-                if line.startswith("EXCLUDED_REGION="):
-                    parts = line.split("=", 1)[1].split(",")
-                    if len(parts) == 2:
-                        excluded_start, excluded_len = int(parts[0]), int(parts[1])         
-            
-            # prepare sequences for markings
-            seq = st.session_state.get("sequence", "").replace("\n", "").replace("[", "").replace("]", "")
-            seq_len = len(seq)
-
-            # prepare marker lines
-            marker = [" "]*seq_len
-            if left_start is not None and left_len is not None:
-                for i in range(left_start, left_start + left_len):
-                    if 0 <= i < seq_len:
-                        marker[i] = ">"
-            if right_start is not None and right_len is not None:
-                # right primer: position is last base, so mark backwards
-                for i in range(right_start - right_len + 1, right_start + 1):
-                    if 0 <= i < seq_len:
-                        marker[i] = "<"
-            if hyb_start is not None and hyb_len is not None:
-                for i in range(hyb_start, hyb_start + hyb_len):
-                    if 0 <= i < seq_len:
-                        marker[i] = "^"
-            if target_start is not None and target_len is not None:
-                for i in range(target_start, target_start + target_len):
-                    if 0 <= i < seq_len:
-                        marker[i] = "*"
-            if excluded_start is not None and excluded_len is not None:
-                for i in range(excluded_start, excluded_start + excluded_len):
-                    if 0 <= i < seq_len:
-                        marker[i] = "X"
-
-            # Split sequence and marker into 60-base rows
-            rows = []
-            for i in range(0, seq_len, 60):
-                seq_row = seq[i:i+60]
-                marker_row = "".join(marker[i:i+60])
-                rows.append((seq_row, marker_row))
-
-            for idx_row, (seq_row, marker_row) in enumerate(rows):
-                # If the first character in marker_row is '>' and the previous row exists, move it to the end of the previous marker_row
-                if idx_row > 0 and marker_row[0] == ">":
-                    # Convert to list for mutability
-                    prev_marker_row = list(rows[idx_row-1][1])
-                    prev_marker_row[-1] = ">"
-                    rows[idx_row-1] = (rows[idx_row-1][0], "".join(prev_marker_row))
-                    # Remove the marker from the current row
-                    marker_row = " " + marker_row[1:]
-                    rows[idx_row] = (seq_row, marker_row)
-
-            with st.expander("Show binding sites on sequence"):
-                block = ""
-                for idx_row, (seq_row, marker_row) in enumerate(rows):
-                    row_start = idx_row * 60 + 1
-                    if idx_row == 0:
-                        block += f"\n   {row_start:>3}  {seq_row}\n       {marker_row}\n\n"
-                    else:
-                        block += f"{row_start:>6}  {seq_row}\n       {marker_row}\n\n"
-                block_lines = block.splitlines()
-                if block_lines:
-                    # use zero-width space (U+200B) to pad the first line
-                    invisible_pad = "\u200B" * 18  
-                    block_lines[0] = invisible_pad + block_lines[0][2:]  
-                block = "\n".join(block_lines)
-                st.code(block, language="text")
-                
-                # add a legend
-                legend = (
-                    "**Legend:**\n\n"
-                    "Forward Primer: `>`\n\n"
-                    "Reverse Primer: `<`\n\n"
-                    "Probe/Internal Oligo: `^`\n\n"
-                    "Target Region: `*`\n\n"
-                    "Excluded Region: `X`"
-                )
-                st.markdown(legend)
+            # show the selected result, or the best shown result when nothing is selected
+            if shown_results.empty:
+                st.info("No results match the filter.")
+            else:
+                idx = shown_result_index(shown_results, output_key, st.session_state.get("selected_result"))
+                st.subheader(f"Result {idx+1}")
+                primer_table, product_table = result_tables(parsed_output, idx, include_internal)
+                st.dataframe(primer_table, use_container_width=True, hide_index=True)
+                if not product_table.empty:
+                    st.dataframe(product_table, use_container_width=True, hide_index=True)
+                with st.expander("Show binding sites on sequence"):
+                    show_binding_view(binding_rows(seq, parsed_output, idx), overlay)
 
-            # add results into variable for later saving
-            all_results_for_export.append({
-                "primer_table": pd.DataFrame(row_data),
-                "product_table": pd.DataFrame(product_data),     
-                "sequence_block": rows                      
-            })
 
         
         explain_data = { 
@@ -1858,7 +1494,17 @@ with tab4:
         st.subheader("📥 Export Primer3 Results")
         format_option = st.selectbox("Choose download format:", ["Select format", "HTML", "PDF"], key="export_format")
 
-        if format_option != "Select format" and all_results_for_export:
+        if format_option != "Select format" and num_results:
+            # the export holds every result, so their tables are only built once a format is chosen
+            all_results_for_export = []
+            for idx in results["Result"] - 1:
+                primer_table, product_table = result_tables(parsed_output, idx, include_internal)
+                all_results_for_export.append({
+                    "primer_table": primer_table,
+                    "product_table": product_table,
+                    "sequence_block": binding_rows(seq, parsed_output, idx)
+                })
+
             #set file name
             file_name_input = st.text_input("Enter file name (without extentions like .pdf or .html)", value = "primer3_results")
             #generate html report contents
@@ -1883,3 +1529,941 @@ with tab4:
                 else:
                     st.error("Failed to generate PDF.")
 
+
+# === Tab 5: additional design modes ===
+with tab5:
+    st.title("🧰 Design Modes")
+
+    design_mode = st.selectbox(
+        "Design mode",
+        ["Penalty weight re-ranking", "What-if constraint explorer", "Auto-relax constraints", "Parameter sweep",
+         "Regions from reference (BED/GFF)", "Exon-junction qPCR (GTF)",
+         "Sequencing primer walking", "Bulk primer check",
+         "Stock primer reuse", "Variant-aware design (VCF)",
+         "Allele-specific (ARMS) design", "Nested PCR", "Degenerate consensus (alignment)",
+         "Bisulfite design", "Run history", "Failure analytics", "Settings file replay"],
+        key="design_mode",
+        help="Additional ways of running Primer3 using the settings from the 'Input Settings' tab."
+    )
+
+    #### Penalty weight re-ranking ####
+    if design_mode == "Penalty weight re-ranking":
+        st.markdown(
+            "Primer3 is run once for a large pool of candidate pairs. Changing the penalty weights below "
+            "recomputes the penalties and the ranking of this pool directly, without running Primer3 again."
+        )
+        st.number_input("Candidate pool size", min_value=10, max_value=5000, value=500, step=50, key="rerank_pool_size", help="Number of pairs requested from Primer3 for the pool. Default is 500.")
+        pool_overrides = {"PRIMER_NUM_RETURN": st.session_state["rerank_pool_size"]}
+
+        if st.button("Build candidate pool", key="rerank_build"):
+            if not st.session_state["sequence"].strip():
+                st.warning("Please enter a DNA sequence before running Primer3.")
+            else:
+                pool_settings = fill_primer3_settings(st.session_state, pool_overrides)
+                pool_output, pool_success = run_primer3(pool_settings)
+                if not pool_success or "PRIMER_ERROR" in pool_output:
+                    st.error("Primer3 could not build a candidate pool with the current settings, see the Primer3 Warnings tab after a regular run.")
+                else:
+                    st.session_state["rerank_pool"] = build_candidate_pool(parse_primer3_input_file(pool_output), st.session_state)
+                    st.session_state["rerank_pool_settings"] = pool_settings
+
+        pool = st.session_state.get("rerank_pool")
+        if pool is None:
+            st.info("Build a candidate pool to start re-ranking.")
+        elif len(pool["table"]) == 0:
+            st.warning("Primer3 returned no candidate pairs with the current settings.")
+        else:
+            if st.session_state.get("sequence") and fill_primer3_settings(st.session_state, pool_overrides) != st.session_state["rerank_pool_settings"]:
+                st.warning("The input settings have changed since the candidate pool was built. Rebuild the pool to include these changes.")
+
+            # weight sliders, grouped per oligo type
+            weight_groups = [
+                ("Primer penalty weights", "PRIMER_WT_"),
+                ("Probe penalty weights", "PRIMER_INTERNAL_WT_"),
+                ("Pair penalty weights", "PRIMER_PAIR_WT_"),
+            ]
+            weights = {}
+            for group_label, prefix in weight_groups:
+                with st.expander(group_label, expanded=prefix == "PRIMER_PAIR_WT_"):
+                    cols = st.columns(3)
+                    group_keys = [key for key in RERANK_WEIGHTS if key.startswith(prefix)]
+                    for i, key in enumerate(group_keys):
+                        with cols[i % 3]:
+                            weights[key] = st.slider(
+                                key.replace(prefix, "").replace("_", " ").lower(),
+                                min_value=0.0,
+                                max_value=5.0,
+                                value=RERANK_WEIGHTS[key],
+                                step=0.1,
+                                key=f"rerank_{key}",
+                                help=f"{key}. Default is {RERANK_WEIGHTS[key]}."
+                            )
+            product_opt_size = st.number_input("Optimal Product Size", min_value=0, value=0, key="rerank_product_opt_size", help="Used by the product size weights. Default is 0.")
+
+            ranked = rerank_candidates(pool, weights, product_opt_size)
+            shown_columns = [
+                column for column in (
+                    "new_rank", "rank", "new_penalty", "pair_penalty", "left_sequence", "right_sequence",
+                    "internal_sequence", "left_tm", "right_tm", "pair_product_size", "pair_product_tm",
+                ) if column in ranked
+            ]
+            ranked_view = ranked[shown_columns].head(int(st.session_state["num_return"])).rename(columns={
+                "new_rank": "New rank",
+                "rank": "Primer3 result",
+                "new_penalty": "New penalty",
+                "pair_penalty": "Primer3 penalty",
+                "left_sequence": "Forward primer",
+                "right_sequence": "Reverse primer",
+                "internal_sequence": "Probe",
+                "left_tm": "Forward Tm",
+                "right_tm": "Reverse Tm",
+                "pair_product_size": "Product size",
+                "pair_product_tm": "Product Tm",
+            })
+            ranked_view["Primer3 result"] = ranked_view["Primer3 result"] + 1
+            st.subheader(f"Re-ranked pairs ({len(pool['table'])} candidates)")
+            st.dataframe(ranked_view, use_container_width=True, hide_index=True)
+
+            # confirm the chosen weights with a real Primer3 run
+            if st.button("▶️ Confirm with Primer3 run", key="rerank_confirm", help="Runs Primer3 with these weights. The result replaces the output shown in the other tabs."):
+                confirm_overrides = dict(weights)
+                confirm_overrides["PRIMER_PRODUCT_OPT_SIZE"] = product_opt_size
+                st.session_state["raw_settings"] = fill_primer3_settings(st.session_state, confirm_overrides)
+                st.session_state["raw_output"], st.session_state["primer3_success"] = run_primer3(st.session_state["raw_settings"])
+                confirm_table = primer3_results_table(parse_primer3_input_file(st.session_state["raw_output"]))
+                if len(confirm_table) and confirm_table.loc[0, "left_sequence"] == ranked.loc[0, "left_sequence"] and confirm_table.loc[0, "right_sequence"] == ranked.loc[0, "right_sequence"]:
+                    st.session_state["rerank_confirm_message"] = ("success", "Primer3 picked the same best pair with these weights. See the Primer3 Output tab.")
+                else:
+                    st.session_state["rerank_confirm_message"] = ("warning", "Primer3 picked a different best pair with these weights, for example because it was outside of the candidate pool. See the Primer3 Output tab.")
+                # rerun so the other tabs show the new output
+                st.rerun()
+            if "rerank_confirm_message" in st.session_state:
+                message_type, message = st.session_state.pop("rerank_confirm_message")
+                if message_type == "success":
+                    st.success(message)
+                else:
+                    st.warning(message)
+
+    #### What-if constraint explorer ####
+    elif design_mode == "What-if constraint explorer":
+        st.markdown(
+            "Primer3 is run once with relaxed constraints to list all candidate oligos. The sliders below then "
+            "filter this candidate space directly, showing how many oligos each constraint would reject."
+        )
+
+        if st.button("Compute candidate space", key="explorer_build"):
+            if not st.session_state["sequence"].strip():
+                st.warning("Please enter a DNA sequence before running Primer3.")
+            else:
+                space_output, space_success = run_primer3(
+                    fill_primer3_settings(st.session_state, explorer_overrides(st.session_state))
+                )
+                if not space_success or "PRIMER_ERROR" in space_output:
+                    st.error("Primer3 could not list the candidate oligos with the current settings.")
+                else:
+                    st.session_state["explorer_space"] = build_oligo_space(parse_primer3_input_file(space_output))
+
+        space = st.session_state.get("explorer_space")
+        if not space:
+            st.info("Compute the candidate space to start exploring.")
+        else:
+            current_limits = explorer_limits(st.session_state)
+            limits = {}
+            for oligo, label in (("LEFT", "Primer"), ("INTERNAL", "Probe")):
+                if oligo not in space:
+                    continue
+                arrays = space[oligo]
+                size_bounds = (int(arrays["size"].min()), int(arrays["size"].max()))
+                with st.expander(f"{label} constraints", expanded=True):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        min_size, max_size = st.slider(
+                            f"{label} size", *size_bounds,
+                            value=(max(size_bounds[0], current_limits[oligo]["min_size"]), min(size_bounds[1], current_limits[oligo]["max_size"])),
+                            key=f"explorer_{oligo}_size"
+                        )
+                        min_tm, max_tm = st.slider(
+                            f"{label} Tm", 0.0, 100.0,
+                            value=(float(current_limits[oligo]["min_tm"]), float(current_limits[oligo]["max_tm"])),
+                            step=0.5, key=f"explorer_{oligo}_tm"
+                        )
+                        min_gc, max_gc = st.slider(
+                            f"{label} GC content (%)", 0.0, 100.0,
+                            value=(float(current_limits[oligo]["min_gc"]), float(current_limits[oligo]["max_gc"])),
+                            step=1.0, key=f"explorer_{oligo}_gc"
+                        )
+                    with col2:
+                        max_poly_x = st.slider(f"{label} max poly X", 1, 36, value=max(1, int(current_limits[oligo]["max_poly_x"])), key=f"explorer_{oligo}_poly_x")
+                        max_self_any = st.slider(f"{label} max self complementarity", 0.0, 50.0, value=float(current_limits[oligo]["max_self_any"]), step=0.5, key=f"explorer_{oligo}_self_any")
+                        max_self_end = st.slider(f"{label} max 3' self complementarity", 0.0, 50.0, value=float(current_limits[oligo]["max_self_end"]), step=0.5, key=f"explorer_{oligo}_self_end")
+                limits[oligo] = dict(
+                    current_limits[oligo],
+                    min_size=min_size, max_size=max_size, min_tm=min_tm, max_tm=max_tm, min_gc=min_gc, max_gc=max_gc,
+                    max_poly_x=max_poly_x, max_self_any=max_self_any, max_self_end=max_self_end,
+                )
+            # forward and reverse primers share the primer constraints
+            limits["RIGHT"] = limits["LEFT"]
+
+            st.subheader("Oligo Explanation Summary (explored)")
+            st.table(explore_oligo_space(space, limits))
+
+            if st.button("Apply to Input Settings", key="explorer_apply", help="Copies the explored constraints to the 'Input Settings' tab."):
+                pending = {}
+                for oligo, prefix in (("LEFT", "primer"), ("INTERNAL", "probe")):
+                    if oligo not in limits:
+                        continue
+                    pending.update({
+                        f"{prefix}_min_size": limits[oligo]["min_size"],
+                        f"{prefix}_max_size": limits[oligo]["max_size"],
+                        f"{prefix}_min_tm": limits[oligo]["min_tm"],
+                        f"{prefix}_max_tm": limits[oligo]["max_tm"],
+                        f"{prefix}_min_GC": limits[oligo]["min_gc"],
+                        f"{prefix}_max_GC": limits[oligo]["max_gc"],
+                        f"{prefix}_max_self_comp": limits[oligo]["max_self_any"],
+                        f"{prefix}_max_3prime_self_comp": limits[oligo]["max_self_end"],
+                        "max_poly_x" if prefix == "primer" else "probe_max_poly_x": limits[oligo]["max_poly_x"],
+                    })
+                st.session_state["pending_settings"] = pending
+                st.rerun()
+
+    #### Auto-relax constraints ####
+    elif design_mode == "Auto-relax constraints":
+        st.markdown(
+            "Builds a ladder of progressively relaxed settings (Tm window, GC window, poly X, product size ranges, ...) "
+            "and runs the variants in parallel. The least relaxed variant that returns enough results is reported."
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            st.number_input("Minimum number of results", min_value=1, value=int(st.session_state["num_return"]), key="relax_min_pairs", help="A variant is usable when Primer3 returns at least this many pairs.")
+        with col2:
+            st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="relax_workers")
+
+        if st.button("▶️ Run auto-relax", key="relax_run"):
+            if not st.session_state["sequence"].strip():
+                st.warning("Please enter a DNA sequence before running Primer3.")
+            else:
+                st.session_state["relax_result"] = run_relax_ladder(
+                    st.session_state, st.session_state["relax_min_pairs"], st.session_state["relax_workers"]
+                )
+
+        if "relax_result" in st.session_state:
+            chosen, ladder, summary = st.session_state["relax_result"]
+            if chosen is None:
+                st.error("None of the relaxed variants returned enough results. Check the sequence, target and excluded regions.")
+            elif chosen == 0:
+                st.success("The current settings already return enough results, no relaxation is needed.")
+            else:
+                st.success(f"Variant {chosen} returned {ladder[chosen]['returned']} results after {chosen} relaxation step(s):")
+                for relaxation in ladder[chosen]["relaxations"]:
+                    st.write(f"- {relaxation}")
+                st.dataframe(changed_settings(ladder[0]["values"], ladder[chosen]["values"]).astype(str), use_container_width=True, hide_index=True)
+
+            with st.expander("Show all ladder variants"):
+                st.dataframe(summary, use_container_width=True, hide_index=True)
+
+            if chosen is not None and st.button("Use this design", key="relax_use", help="Copies the relaxed settings to the 'Input Settings' tab and shows this result in the output tabs."):
+                relaxed_values = ladder[chosen]["values"]
+                st.session_state["pending_settings"] = {
+                    key: relaxed_values[key] for key in changed_settings(ladder[0]["values"], relaxed_values).get("Setting", [])
+                }
+                st.session_state["raw_output"] = ladder[chosen]["output"]
+                st.session_state["raw_settings"] = ladder[chosen]["settings"]
+                st.session_state["primer3_success"] = ladder[chosen]["success"]
+                st.rerun()
+
+    #### Parameter sweep ####
+    elif design_mode == "Parameter sweep":
+        st.markdown(
+            "Runs every combination of the chosen setting values on a pool of Primer3 processes and collects the "
+            "best result of each variant in one comparison table. All other settings are taken from the 'Input Settings' tab."
+        )
+        sweep_keys = st.multiselect(
+            "Settings to sweep",
+            [key for key in defaults if key not in ("sequence", "seq_id", "left", "right", "internal", "save_input_file", "input_save_path")],
+            default=["primer_salt_conc_monocat", "primer_salt_conc_divcat"],
+            key="sweep_keys",
+        )
+        grid = {}
+        for key in sweep_keys:
+            sweep_text = st.text_input(
+                f"Values for {key}",
+                value=str(st.session_state[key]),
+                key=f"sweep_values_{key}",
+                help=f"Comma separated values, e.g. 25, 50, 75. Current value is {st.session_state[key]}."
+            )
+            try:
+                grid[key] = parse_sweep_values(sweep_text, defaults[key])
+            except ValueError:
+                st.error(f"Could not read the values for {key}.")
+                grid[key] = []
+
+        variant_count = len(expand_parameter_grid(grid)) if grid else 0
+        st.write(f"Number of variants: **{variant_count}**")
+        st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="sweep_workers")
+
+        if st.button("▶️ Run sweep", key="sweep_run", disabled=variant_count == 0):
+            if not st.session_state["sequence"].strip():
+                st.warning("Please enter a DNA sequence before running Primer3.")
+            else:
+                progress_bar = st.progress(0.0, text="Running sweep")
+                st.session_state["sweep_result"] = run_parameter_sweep(
+                    st.session_state, grid, st.session_state["sweep_workers"],
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Running sweep ({done}/{total})"),
+                )
+                progress_bar.empty()
+
+        if "sweep_result" in st.session_state:
+            sweep_table, sweep_settings, sweep_results = st.session_state["sweep_result"]
+            st.subheader("Sweep results")
+            st.dataframe(sweep_table, use_container_width=True)
+            st.download_button(
+                label="Download sweep results as CSV",
+                data=sweep_table.to_csv(index=False).encode("utf-8"),
+                file_name="primer3_sweep.csv",
+                mime="text/csv"
+            )
+            variant_index = st.number_input("Show variant in output tabs", min_value=0, max_value=len(sweep_table) - 1, value=0, key="sweep_show_index", help="Row number of the variant in the table above.")
+            if st.button("Show variant", key="sweep_show"):
+                st.session_state["raw_output"], st.session_state["primer3_success"] = sweep_results[variant_index]
+                st.session_state["raw_settings"] = sweep_settings[variant_index]
+                st.rerun()
+
+    #### Regions from a reference (BED/GFF) ####
+    elif design_mode == "Regions from reference (BED/GFF)":
+        st.markdown(
+            "Extracts each region of a BED or GFF file from a local reference FASTA, adds flanking sequence, marks the "
+            "region as the target and designs all regions in parallel. The reference is read through its .fai index "
+            "(built next to the FASTA when missing), so it is never loaded into memory as a whole."
+        )
+        st.text_input("Reference FASTA path", key="regions_fasta_path", help="Path to an uncompressed FASTA file, e.g. C:/Users/yourname/genome.fa or genomes/genome.fa.")
+        regions_file = st.file_uploader("BED or GFF file with target regions", type=["bed", "gff", "gff3", "gtf", "txt"], key="regions_file")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.number_input("Flank size (bases)", min_value=0, value=250, step=50, key="regions_flank", help="Sequence added on both sides of each region. Default is 250.")
+        with col2:
+            st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="regions_workers")
+
+        if st.button("▶️ Extract and design", key="regions_run"):
+            fasta_path, fasta_exists = resolve_and_check_path(st.session_state.get("regions_fasta_path", ""))
+            if not fasta_exists:
+                st.error(f"Reference FASTA not found: {fasta_path}")
+            elif regions_file is None:
+                st.warning("Please upload a BED or GFF file with the target regions.")
+            else:
+                file_format = "BED" if regions_file.name.lower().endswith((".bed", ".txt")) else "GFF"
+                try:
+                    regions = read_regions(regions_file.getvalue().decode("utf-8"), file_format)
+                    region_list = region_records(
+                        open_indexed_fasta(fasta_path), regions, st.session_state["regions_flank"], st.session_state["primer_first_base_index"]
+                    )
+                except (KeyError, ValueError, IndexError) as e:
+                    st.error(f"Could not extract the regions: {e}")
+                else:
+                    progress_bar = st.progress(0.0, text="Designing regions")
+                    region_table, region_results = run_batch_design(
+                        st.session_state, region_list, st.session_state["regions_workers"],
+                        progress=lambda done, total: progress_bar.progress(done / total, text=f"Designing regions ({done}/{total})"),
+                    )
+                    progress_bar.empty()
+                    region_table.insert(1, "Location", [f"{r['chrom']}:{r['start'] + 1}-{r['start'] + len(r['sequence'])} ({r['strand']})" for r in region_list])
+                    st.session_state["regions_result"] = (region_table, region_results, region_list)
+
+        if "regions_result" in st.session_state:
+            show_batch_results(*st.session_state["regions_result"], key="regions")
+
+    #### Exon-junction qPCR (GTF) ####
+    elif design_mode == "Exon-junction qPCR (GTF)":
+        st.markdown(
+            "Builds spliced mRNA templates from a local GTF annotation and reference FASTA and passes the exon-exon "
+            "junctions as SEQUENCE_OVERLAP_JUNCTION_LIST, so one primer of each pair spans a junction "
+            "(by at least PRIMER_MIN_5_PRIME_OVERLAP_OF_JUNCTION bases). The GTF is indexed once into a small .p3gidx "
+            "file next to it, later runs only read the index."
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            st.text_input("Reference FASTA path", key="junction_fasta_path", help="Path to an uncompressed FASTA file matching the annotation.")
+        with col2:
+            st.text_input("GTF annotation path", key="junction_gtf_path", help="Path to a GTF file (may be gzipped) with exon features and transcript_id/gene_id/gene_name attributes.")
+        st.text_area("Genes or transcripts", key="junction_names", help="Gene names, gene ids or transcript ids, separated by spaces, commas or new lines. A gene selects all of its transcripts.")
+        st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="junction_workers")
+
+        if st.button("▶️ Build templates and design", key="junction_run"):
+            fasta_path, fasta_exists = resolve_and_check_path(st.session_state.get("junction_fasta_path", ""))
+            gtf_path, gtf_exists = resolve_and_check_path(st.session_state.get("junction_gtf_path", ""))
+            if not fasta_exists:
+                st.error(f"Reference FASTA not found: {fasta_path}")
+            elif not gtf_exists:
+                st.error(f"GTF annotation not found: {gtf_path}")
+            else:
+                with st.spinner("Loading annotation index..."):
+                    gtf_index = open_gtf_index(gtf_path)
+                transcript_ids, missing = select_transcripts(gtf_index, st.session_state.get("junction_names", ""))
+                if missing:
+                    st.warning(f"Not found in the annotation: {', '.join(missing)}")
+                try:
+                    junction_list, single_exon = junction_records(
+                        open_indexed_fasta(fasta_path), gtf_index, transcript_ids, st.session_state["primer_first_base_index"]
+                    )
+                except (KeyError, ValueError) as e:
+                    st.error(f"Could not build the templates: {e}")
+                else:
+                    if single_exon:
+                        st.info(f"Skipped {len(single_exon)} single-exon transcript(s) without junctions: {', '.join(single_exon)}")
+                    if not junction_list:
+                        st.warning("No transcripts with exon-exon junctions were selected.")
+                    else:
+                        progress_bar = st.progress(0.0, text="Designing transcripts")
+                        junction_table, junction_results = run_batch_design(
+                            st.session_state, junction_list, st.session_state["junction_workers"],
+                            progress=lambda done, total: progress_bar.progress(done / total, text=f"Designing transcripts ({done}/{total})"),
+                        )
+                        progress_bar.empty()
+                        junction_table.insert(2, "Junctions", [r["junctions"] for r in junction_list])
+                        st.session_state["junction_result"] = (junction_table, junction_results, junction_list)
+
+        if "junction_result" in st.session_state:
+            show_batch_results(*st.session_state["junction_result"], key="junction")
+
+    #### Sequencing primer walking ####
+    elif design_mode == "Sequencing primer walking":
+        st.markdown(
+            "Picks sequencing primers (Primer3 task pick_sequencing_primers) along the sequence from the 'Input Settings' "
+            "tab. Long templates are split into chunks on the primer spacing grid, designed in parallel and stitched back "
+            "into one tiling. The target from the 'Input Settings' tab is not used, the whole sequence is covered."
+        )
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.number_input("Chunk size", min_value=500, value=5000, step=500, key="walk_chunk_size", help="Template bases per Primer3 run, rounded down to a multiple of the spacing. Default is 5000.")
+            st.number_input("Read length", min_value=100, value=800, step=50, key="walk_read_length", help="Usable read length, only used for the coverage map. Default is 800.")
+        with col2:
+            st.number_input("Spacing", min_value=50, value=500, step=50, key="walk_spacing", help="PRIMER_SEQUENCING_SPACING: distance between primers on the same strand. Default is 500.")
+            st.number_input("Interval", min_value=10, value=250, step=10, key="walk_interval", help="PRIMER_SEQUENCING_INTERVAL: distance between primers on opposite strands. Default is 250.")
+        with col3:
+            st.number_input("Lead", min_value=0, value=50, step=5, key="walk_lead", help="PRIMER_SEQUENCING_LEAD: unreadable bases between the primer's 3' end and the first called base. Default is 50.")
+            st.number_input("Accuracy", min_value=1, value=20, step=5, key="walk_accuracy", help="PRIMER_SEQUENCING_ACCURACY: how far a primer may be from its ideal position. Default is 20.")
+        with col4:
+            st.checkbox("Forward primers", value=True, key="walk_forward")
+            st.checkbox("Reverse primers", value=True, key="walk_reverse")
+            st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="walk_workers")
+
+        if st.button("▶️ Design sequencing primers", key="walk_run"):
+            if not st.session_state.get("sequence", "").strip():
+                st.warning("Please enter a sequence in the 'Input Settings' tab.")
+            elif not (st.session_state["walk_forward"] or st.session_state["walk_reverse"]):
+                st.warning("Please choose forward and/or reverse primers.")
+            else:
+                progress_bar = st.progress(0.0, text="Designing chunks")
+                walk_table, walk_chunks, walk_length = run_sequencing_walk(
+                    st.session_state,
+                    chunk_size=st.session_state["walk_chunk_size"],
+                    lead=st.session_state["walk_lead"],
+                    spacing=st.session_state["walk_spacing"],
+                    interval=st.session_state["walk_interval"],
+                    accuracy=st.session_state["walk_accuracy"],
+                    forward=st.session_state["walk_forward"],
+                    reverse=st.session_state["walk_reverse"],
+                    max_workers=st.session_state["walk_workers"],
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Designing chunks ({done}/{total})"),
+                )
+                progress_bar.empty()
+                st.session_state["walk_result"] = (walk_table, walk_chunks, walk_length)
+
+        if "walk_result" in st.session_state:
+            walk_table, walk_chunks, walk_length = st.session_state["walk_result"]
+            first_base_index = st.session_state["primer_first_base_index"]
+            depth = sequencing_coverage(walk_table, walk_length, st.session_state["walk_read_length"], st.session_state["walk_lead"], first_base_index)
+            gaps = coverage_gaps(depth, first_base_index)
+            st.markdown(f"**{len(walk_table)} primers** over {walk_length} bases in {len(walk_chunks)} chunk(s)")
+            st.code(coverage_map_text(depth, first_base_index=first_base_index), language=None)
+            st.caption("Read depth per bin: '.' not covered, 1-9 reads, '+' more than 9 reads.")
+            if gaps:
+                st.warning("Not covered: " + ", ".join(f"{start}-{end}" for start, end in gaps))
+            else:
+                st.success("The whole template is covered by at least one read.")
+            st.dataframe(walk_table, use_container_width=True, hide_index=True)
+            st.download_button(
+                label="Download sequencing primers as CSV",
+                data=walk_table.to_csv(index=False).encode("utf-8"),
+                file_name="primer3_sequencing_primers.csv",
+                mime="text/csv",
+                key="walk_download"
+            )
+            with st.expander("Chunks"):
+                st.dataframe(walk_chunks, use_container_width=True, hide_index=True)
+
+    #### Bulk primer check ####
+    elif design_mode == "Bulk primer check":
+        st.markdown(
+            "Re-validates existing primer pairs with Primer3's check_primers task, using the settings from the 'Input "
+            "Settings' tab. Upload a CSV/TSV table with the columns name, left, right and optionally internal (probe) and "
+            "template. The template column holds either a template sequence or the id of a sequence in the FASTA file."
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            inventory_file = st.file_uploader("Primer table (CSV/TSV)", type=["csv", "tsv", "txt"], key="check_inventory_file")
+        with col2:
+            templates_file = st.file_uploader("Templates (FASTA, optional)", type=["fa", "fasta", "fna", "txt"], key="check_templates_file")
+        st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="check_workers")
+
+        if st.button("▶️ Check primers", key="check_run"):
+            if inventory_file is None:
+                st.warning("Please upload a primer table.")
+            else:
+                inventory = normalize_inventory(pd.read_csv(inventory_file, sep=None, engine="python", dtype=str))
+                templates = parse_fasta_text(templates_file.getvalue().decode("utf-8")) if templates_file is not None else {}
+                missing = missing_templates(inventory, templates)
+                if missing:
+                    st.warning(f"Templates not found in the FASTA file, these are checked without a template: {', '.join(missing[:20])}")
+                    inventory.loc[inventory["template"].isin(missing), "template"] = ""
+                progress_bar = st.progress(0.0, text="Checking primers")
+                check_table, check_results, check_list = run_primer_check(
+                    st.session_state, inventory, templates, st.session_state["check_workers"],
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Checking primers ({done}/{total})"),
+                )
+                progress_bar.empty()
+                st.session_state["check_result"] = (check_table, check_results, check_list)
+
+        if "check_result" in st.session_state:
+            check_table = st.session_state["check_result"][0]
+            col1, col2, col3 = st.columns(3)
+            col1.metric("OK", int((check_table["Status"] == "ok").sum()))
+            col2.metric("With warnings / problems", int((check_table["Status"] == "problems").sum()))
+            col3.metric("Failed", int((check_table["Status"] == "failed").sum()))
+            show_batch_results(*st.session_state["check_result"], key="check")
+
+    #### Stock primer reuse ####
+    elif design_mode == "Stock primer reuse":
+        st.markdown(
+            "Scans the templates for primers from your stock in a single pass (Aho-Corasick search over all stock primers "
+            "and their reverse complements). Every exact hit is fixed as forward or reverse primer and Primer3 only designs "
+            "the missing partner. Two stock primers that give a product in the product size range are checked as a pair."
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            stock_file = st.file_uploader("Stock primer table (CSV/TSV)", type=["csv", "tsv", "txt"], key="stock_inventory_file", help="Columns name and sequence, or a primer pair table with name, left, right (and internal).")
+        with col2:
+            stock_templates_file = st.file_uploader("Templates (FASTA, optional)", type=["fa", "fasta", "fna", "txt"], key="stock_templates_file", help="Without a FASTA file the sequence from the 'Input Settings' tab is used.")
+        st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="stock_workers")
+
+        if st.button("▶️ Find stock primers and design", key="stock_run"):
+            if stock_file is None:
+                st.warning("Please upload a stock primer table.")
+            elif stock_templates_file is None and not st.session_state.get("sequence", "").strip():
+                st.warning("Please upload templates or enter a sequence in the 'Input Settings' tab.")
+            else:
+                stock = read_stock_primers(pd.read_csv(stock_file, sep=None, engine="python", dtype=str))
+                if stock_templates_file is not None:
+                    stock_templates = parse_fasta_text(stock_templates_file.getvalue().decode("utf-8"))
+                else:
+                    stock_templates = {st.session_state["seq_id"]: st.session_state["sequence"]}
+                with st.spinner(f"Scanning {len(stock_templates)} template(s) for {len(stock)} stock primers..."):
+                    stock_list = stock_primer_records(st.session_state, stock_templates, primer_automaton(stock))
+                if not stock_list:
+                    st.session_state.pop("stock_result", None)
+                    st.warning("None of the stock primers binds to the template(s).")
+                else:
+                    progress_bar = st.progress(0.0, text="Designing partners")
+                    stock_table, stock_results = run_batch_design(
+                        st.session_state, stock_list, st.session_state["stock_workers"],
+                        progress=lambda done, total: progress_bar.progress(done / total, text=f"Designing partners ({done}/{total})"),
+                    )
+                    progress_bar.empty()
+                    stock_table.insert(1, "Template", [r["template_id"] for r in stock_list])
+                    stock_table.insert(2, "Stock primer", [r["stock"] for r in stock_list])
+                    stock_table.insert(3, "Stock position", [r["stock_position"] for r in stock_list])
+                    st.session_state["stock_result"] = (stock_table, stock_results, stock_list)
+
+        if "stock_result" in st.session_state:
+            show_batch_results(*st.session_state["stock_result"], key="stock")
+
+    #### Variant-aware design (VCF) ####
+    elif design_mode == "Variant-aware design (VCF)":
+        st.markdown(
+            "Looks up the variants of a local VCF (plain or bgzipped) for each template and either excludes the variant "
+            "positions or rejects pairs with a variant near a primer's 3' end. The VCF is indexed once into a small "
+            ".p3gvcf.npz file next to it, each template lookup is a binary search. Templates need genomic coordinates: "
+            "either the sequence from the 'Input Settings' tab with its location, or the last batch of the 'Regions from "
+            "reference (BED/GFF)' mode."
+        )
+        st.text_input("VCF path", key="vcf_path", help="Path to a VCF or VCF.gz file. Allele frequencies are read from the INFO field AF.")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.number_input("Min. allele frequency", min_value=0.0, max_value=1.0, value=0.01, step=0.01, key="vcf_min_af", help="Variants below this AF are ignored. Variants without an AF are always used.")
+        with col2:
+            st.radio("Use variants", ["Exclude variant positions", "Reject pairs with a variant at the 3' end"], key="vcf_action")
+        with col3:
+            st.number_input("3' end bases", min_value=1, max_value=15, value=5, key="vcf_three_prime", help="Only used when rejecting pairs: a variant within this many bases of a 3' end rejects the pair.")
+
+        template_sources = ["Sequence from 'Input Settings'"]
+        if "regions_result" in st.session_state:
+            template_sources.append("Last 'Regions from reference' batch")
+        st.radio("Templates", template_sources, key="vcf_source", horizontal=True)
+        if st.session_state["vcf_source"] == template_sources[0]:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.text_input("Chromosome", key="vcf_chrom")
+            with col2:
+                st.number_input("Genomic position of the first base (1-based)", min_value=1, value=1, key="vcf_position")
+            with col3:
+                st.selectbox("Strand", ["+", "-"], key="vcf_strand")
+        st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="vcf_workers")
+
+        if st.button("▶️ Design around variants", key="vcf_run"):
+            vcf_path, vcf_exists = resolve_and_check_path(st.session_state.get("vcf_path", ""))
+            if not vcf_exists:
+                st.error(f"VCF file not found: {vcf_path}")
+            elif st.session_state["vcf_source"] == template_sources[0] and not (st.session_state["sequence"].strip() and st.session_state["vcf_chrom"].strip()):
+                st.warning("Please enter a sequence in the 'Input Settings' tab and the chromosome it comes from.")
+            else:
+                if st.session_state["vcf_source"] == template_sources[0]:
+                    vcf_records = [{
+                        "seq_id": st.session_state["seq_id"],
+                        "sequence": st.session_state["sequence"],
+                        "target": st.session_state["target"],
+                        "excluded_region": " ".join(r for r in (st.session_state["excluded_region"], auto_excluded_region(st.session_state)) if r),
+                        "chrom": st.session_state["vcf_chrom"].strip(),
+                        "start": st.session_state["vcf_position"] - 1,
+                        "strand": st.session_state["vcf_strand"],
+                    }]
+                else:
+                    vcf_records = st.session_state["regions_result"][2]
+                with st.spinner("Loading VCF index..."):
+                    vcf_index = open_vcf_index(vcf_path)
+                progress_bar = st.progress(0.0, text="Designing templates")
+                vcf_table, vcf_results, vcf_list, vcf_annotations = run_variant_aware_design(
+                    st.session_state, vcf_records, vcf_index,
+                    min_af=st.session_state["vcf_min_af"],
+                    exclude=st.session_state["vcf_action"] == "Exclude variant positions",
+                    three_prime_bases=st.session_state["vcf_three_prime"],
+                    max_workers=st.session_state["vcf_workers"],
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Designing templates ({done}/{total})"),
+                )
+                progress_bar.empty()
+                st.session_state["vcf_result"] = (vcf_table, vcf_results, vcf_list)
+                st.session_state["vcf_annotations"] = vcf_annotations
+
+        if "vcf_result" in st.session_state:
+            show_batch_results(*st.session_state["vcf_result"], key="vcf")
+            with st.expander("Variants per template"):
+                first_base_index = st.session_state["primer_first_base_index"]
+                for record, variants in zip(st.session_state["vcf_result"][2], st.session_state["vcf_annotations"]):
+                    st.markdown(f"**{record['seq_id']}**: {len(variants)} variant(s)")
+                    if len(variants):
+                        st.dataframe(
+                            variants.assign(**{"Template position": variants["start"] + first_base_index}).drop(columns=["start", "end"]),
+                            use_container_width=True, hide_index=True
+                        )
+
+    #### Allele-specific (ARMS) design ####
+    elif design_mode == "Allele-specific (ARMS) design":
+        st.markdown(
+            "Builds allele-specific forward primers for a list of SNPs, with the 3' base on the variant and the optimum "
+            "primer size from the 'Input Settings' tab. Primer3 picks the common reverse primer (and probe, if 'Pick Probe' "
+            "is selected) with the allele 1 primer fixed, after which the allele 2 primer is checked with the same reverse "
+            "primer and probe. All SNPs run in parallel."
+        )
+        st.text_area(
+            "SNP list", key="arms_snps", height=200,
+            help="One SNP per line: a name followed by the flanking sequence with the SNP written as [A/G], e.g. rs123 ACGT...TTCA[C/T]GGAT...ACGT",
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            st.checkbox("Deliberate penultimate mismatch", key="arms_mismatch", help="Adds a transversion at the second base from the 3' end of both allele-specific primers to increase allele discrimination.")
+        with col2:
+            st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="arms_workers")
+
+        if st.button("▶️ Design ARMS assays", key="arms_run"):
+            snps, invalid = parse_snp_list(st.session_state.get("arms_snps", ""))
+            if invalid:
+                st.warning(f"No [A/B] SNP found for: {', '.join(invalid)}")
+            if not snps:
+                st.warning("Please enter at least one SNP with flanking sequence.")
+            else:
+                progress_bar = st.progress(0.0, text="Designing assays")
+                arms_table, arms_results, arms_list = run_arms_design(
+                    st.session_state, snps, st.session_state["arms_mismatch"], st.session_state["arms_workers"],
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Designing assays ({done}/{total})"),
+                )
+                progress_bar.empty()
+                st.session_state["arms_result"] = (arms_table, arms_results, arms_list)
+
+        if "arms_result" in st.session_state:
+            show_batch_results(*st.session_state["arms_result"], key="arms")
+
+    #### Nested PCR ####
+    elif design_mode == "Nested PCR":
+        st.markdown(
+            "Designs outer pairs for the sequence from the 'Input Settings' tab, then runs an inner design inside each of "
+            "the top outer products (between the 3' ends of the outer primers) in parallel. The probe, if picked, is only "
+            "designed for the inner pairs. Identical product interiors are designed once and repeated runs come from the "
+            "result cache. Combinations are ranked by the sum of the outer and inner pair penalties."
+        )
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.text_input("Outer product size range", value="400-800", key="nested_outer_range")
+        with col2:
+            st.text_input("Inner product size range", value="100-300", key="nested_inner_range")
+        with col3:
+            st.number_input("Outer pairs to nest into", min_value=1, max_value=50, value=5, key="nested_top_outer")
+        with col4:
+            st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="nested_workers")
+        st.caption("The number of inner pairs per outer product is the 'Number of Primer Pairs to Return' setting.")
+
+        if st.button("▶️ Design nested PCR", key="nested_run"):
+            if not st.session_state["sequence"].strip():
+                st.warning("Please enter a DNA sequence in the 'Input Settings' tab.")
+            else:
+                progress_bar = st.progress(0.0, text="Designing inner pairs")
+                nested_table, nested_list, nested_results = run_nested_design(
+                    st.session_state,
+                    st.session_state["nested_outer_range"],
+                    st.session_state["nested_inner_range"],
+                    st.session_state["nested_top_outer"],
+                    st.session_state["nested_workers"],
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Designing inner pairs ({done}/{total})"),
+                )
+                progress_bar.empty()
+                st.session_state["nested_result"] = (nested_table, nested_results, nested_list)
+
+        if "nested_result" in st.session_state:
+            nested_table = st.session_state["nested_result"][0]
+            if nested_table.empty:
+                st.warning("No outer/inner combinations were found. Check the outer design via 'Show record' below.")
+            show_batch_results(*st.session_state["nested_result"], key="nested")
+
+    #### Degenerate consensus (alignment) ####
+    elif design_mode == "Degenerate consensus (alignment)":
+        st.markdown(
+            "Designs primers conserved across strains from a multiple alignment (aligned FASTA). The per-column base "
+            "counts give an IUPAC consensus template, poorly conserved regions are excluded and ambiguous bases are "
+            "accepted up to the 'Max Ns Accepted' setting (PRIMER_LIBERAL_BASE is switched on). Each designed primer is "
+            "then checked against every strain."
+        )
+        alignment_file = st.file_uploader("Aligned FASTA", type=["fa", "fasta", "fas", "aln", "txt"], key="consensus_file")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.number_input("Min. base fraction for IUPAC code", min_value=0.0, max_value=0.5, value=0.05, step=0.01, key="consensus_min_fraction", help="Bases seen in fewer strains than this are left out of the consensus code.")
+        with col2:
+            st.number_input("Min. conservation", min_value=0.0, max_value=1.0, value=0.8, step=0.05, key="consensus_min_conservation", help="Columns where fewer strains share the most common base are excluded.")
+        with col3:
+            st.number_input("Max. gap fraction", min_value=0.0, max_value=1.0, value=0.5, step=0.05, key="consensus_max_gaps", help="Columns with more gaps than this are left out of the template.")
+        if st.session_state["max_Ns"] == 0:
+            st.info("'Max Ns Accepted' is 0, so only primers without ambiguous bases can be picked. Increase it in the 'Input Settings' tab to allow degenerate primers.")
+
+        if st.button("▶️ Design consensus primers", key="consensus_run"):
+            if alignment_file is None:
+                st.warning("Please upload an aligned FASTA file.")
+            else:
+                try:
+                    strain_names, alignment = read_alignment(alignment_file.getvalue().decode("utf-8"))
+                except ValueError as e:
+                    st.error(f"Could not read the alignment: {e}")
+                else:
+                    with st.spinner(f"Designing on the consensus of {len(strain_names)} strains..."):
+                        consensus, coverage, consensus_list, consensus_results = run_consensus_design(
+                            st.session_state, alignment,
+                            st.session_state["consensus_min_fraction"],
+                            st.session_state["consensus_max_gaps"],
+                            st.session_state["consensus_min_conservation"],
+                        )
+                    st.session_state["consensus_summary"] = (len(strain_names), consensus)
+                    st.session_state["consensus_result"] = (coverage, consensus_results, consensus_list)
+
+        if "consensus_result" in st.session_state:
+            strain_count, consensus = st.session_state["consensus_summary"]
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Strains", strain_count)
+            col2.metric("Consensus length", len(consensus["consensus"]))
+            col3.metric("Ambiguous positions", sum(base not in "ACGT" for base in consensus["consensus"]))
+            with st.expander("Consensus template"):
+                st.code(consensus["consensus"], language=None)
+            if st.session_state["consensus_result"][0].empty:
+                st.warning("No primers were found on the consensus. Check the Primer3 output via 'Show record' below.")
+            show_batch_results(*st.session_state["consensus_result"], key="consensus")
+
+    #### Bisulfite design ####
+    elif design_mode == "Bisulfite design":
+        st.markdown(
+            "Designs primers on in silico bisulfite converted templates: unmethylated C becomes T, CpG C follows the "
+            "chosen methylation state. Primers that contain a CpG depend on the methylation state and can be rejected, "
+            "as usual for bisulfite sequencing primers. Many regions (FASTA) are designed in parallel."
+        )
+        bisulfite_file = st.file_uploader("Regions (FASTA, optional)", type=["fa", "fasta", "fna", "txt"], key="bisulfite_file", help="Without a FASTA file the sequence from the 'Input Settings' tab is used, with its target and excluded regions.")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.radio("Converted strand", ["top", "bottom"], key="bisulfite_strand", horizontal=True)
+            st.selectbox("CpG methylation", list(CPG_STATES), key="bisulfite_cpg")
+        with col2:
+            st.checkbox("Reject primers containing CpGs", value=True, key="bisulfite_reject_cpg", help="Uncheck for methylation-specific primers (MSP), which are meant to cover CpGs.")
+        with col3:
+            st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="bisulfite_workers")
+
+        if st.button("▶️ Design bisulfite primers", key="bisulfite_run"):
+            if bisulfite_file is not None:
+                bisulfite_records = [
+                    {"seq_id": name, "sequence": sequence, "target": "", "excluded_region": ""}
+                    for name, sequence in parse_fasta_text(bisulfite_file.getvalue().decode("utf-8")).items()
+                ]
+            elif st.session_state["sequence"].strip():
+                bisulfite_records = [{
+                    "seq_id": st.session_state["seq_id"],
+                    "sequence": st.session_state["sequence"],
+                    "target": st.session_state["target"],
+                    "excluded_region": " ".join(r for r in (st.session_state["excluded_region"], auto_excluded_region(st.session_state)) if r),
+                }]
+            else:
+                bisulfite_records = []
+            if not bisulfite_records:
+                st.warning("Please upload regions or enter a sequence in the 'Input Settings' tab.")
+            else:
+                progress_bar = st.progress(0.0, text="Designing converted templates")
+                bisulfite_table, bisulfite_results, bisulfite_list = run_bisulfite_design(
+                    st.session_state, bisulfite_records,
+                    strand=st.session_state["bisulfite_strand"],
+                    cpg_state=CPG_STATES[st.session_state["bisulfite_cpg"]],
+                    reject_cpg=st.session_state["bisulfite_reject_cpg"],
+                    max_workers=st.session_state["bisulfite_workers"],
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Designing converted templates ({done}/{total})"),
+                )
+                progress_bar.empty()
+                st.session_state["bisulfite_result"] = (bisulfite_table, bisulfite_results, bisulfite_list)
+
+        if "bisulfite_result" in st.session_state:
+            show_batch_results(*st.session_state["bisulfite_result"], key="bisulfite")
+
+    #### Run history ####
+    elif design_mode == "Run history":
+        st.markdown(
+            "Every Primer3 run is kept in a local history store, together with its settings, output and run time. "
+            "Repeating a run with the same settings reopens the stored output instead of running Primer3 again. "
+            "Search past runs by sequence ID, oligo sequence or settings hash and reopen them in the output tabs."
+        )
+        if not run_store_file:
+            st.info("The run history is switched off (the P3G_RUN_STORE environment variable is empty).")
+        elif run_store is None:
+            st.warning("The run history store could not be opened.")
+        else:
+            stats = run_store_stats(run_store)
+            st.caption(f"{stats['runs']} runs stored in {run_store_file} (the {RUN_STORE_MAX_RUNS} most recently used runs are kept), {stats['reused']} repeated runs reused.")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.text_input("Sequence ID starts with", key="history_seq_id")
+            with col2:
+                st.text_input("Oligo sequence starts with", key="history_oligo", help="Matches forward primers, reverse primers and probes.")
+            with col3:
+                st.text_input("Settings hash starts with", key="history_hash")
+            history_table = search_runs(
+                run_store,
+                seq_id=st.session_state["history_seq_id"],
+                oligo=st.session_state["history_oligo"],
+                settings_hash_prefix=st.session_state["history_hash"],
+            )
+            if history_table.empty:
+                st.info("No stored runs match the search.")
+            else:
+                st.dataframe(history_table, use_container_width=True, hide_index=True)
+                run_id = st.selectbox(
+                    "Run to reopen", history_table["Run"].tolist(),
+                    format_func=lambda i: f"{i}: {history_table.loc[history_table['Run'] == i, 'Sequence ID'].iloc[0]}",
+                    key="history_run"
+                )
+                stored = load_run(run_store, run_id)
+                if stored is not None:
+                    with st.expander("Stored settings"):
+                        st.code(stored[0], language=None)
+                    if st.button("Reopen run", key="history_reopen", help="Loads the run's sequence into the 'Input Settings' tab and shows its stored output, without running Primer3."):
+                        st.session_state["pending_settings"] = stored_run_record(stored[0])
+                        st.session_state["raw_output"], st.session_state["primer3_success"] = stored[1], stored[2]
+                        st.session_state["raw_settings"] = stored[0]
+                        st.rerun()
+
+    #### Failure analytics ####
+    elif design_mode == "Failure analytics":
+        st.markdown(
+            "Adds up the Oligo Explanation Summary counters (PRIMER_*_EXPLAIN) and the result problems of many runs, "
+            "from the batch results of this session or from the run history. Shows which constraints reject most "
+            "candidate oligos, as a basis for tuning the default settings."
+        )
+        available = [name for name, key in BATCH_RESULT_KEYS.items() if key in st.session_state]
+        analytics_source = st.radio("Runs to analyse", ["Batch results", "Run history"], key="analytics_source", horizontal=True)
+        if analytics_source == "Batch results":
+            if not available:
+                st.info("No batch results in this session yet, run one of the batch design modes first.")
+            st.multiselect("Batch results", available, default=available, key="analytics_batches")
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.text_input("Sequence ID starts with", key="analytics_seq_id")
+            with col2:
+                st.number_input("Maximum number of runs", min_value=1, value=10000, step=1000, key="analytics_limit", help="The most recently used runs are analysed first.")
+
+        if st.button("📊 Analyse runs", key="analytics_run"):
+            if analytics_source == "Batch results":
+                analytics_runs = []
+                for name in st.session_state["analytics_batches"]:
+                    _, batch_results, batch_records = st.session_state[BATCH_RESULT_KEYS[name]]
+                    analytics_runs += [(record["seq_id"], *result) for record, result in zip(batch_records, batch_results)]
+            elif run_store is None:
+                analytics_runs = []
+                st.warning("The run history store could not be opened.")
+            else:
+                analytics_runs = stored_outputs(run_store, seq_id=st.session_state["analytics_seq_id"], limit=st.session_state["analytics_limit"])
+            st.session_state["analytics_result"] = (len(analytics_runs), *failure_analytics(analytics_runs))
+
+        if "analytics_result" in st.session_state:
+            run_count, rejections, explain_table, problem_table = st.session_state["analytics_result"]
+            col1, col2 = st.columns(2)
+            col1.metric("Runs analysed", run_count)
+            col2.metric("Runs without results", int(problem_table.loc[problem_table["Problem"].isin(["No results returned", "Primer3 failed"]), "Count"].sum()))
+            if rejections.empty:
+                st.info("No Oligo Explanation Summary counters found in the analysed runs.")
+            else:
+                st.subheader("Rejection reasons")
+                st.bar_chart(rejections.pivot_table(index="Reason", columns="Oligo", values="Rejected", aggfunc="sum", fill_value=0))
+                st.dataframe(rejections, use_container_width=True, hide_index=True)
+                st.download_button(
+                    label="Download rejection reasons as CSV",
+                    data=rejections.to_csv(index=False).encode("utf-8"),
+                    file_name="primer3_rejection_reasons.csv",
+                    mime="text/csv",
+                    key="analytics_download"
+                )
+                st.subheader("Oligo Explanation Summary (all runs)")
+                st.dataframe(explain_table, use_container_width=True)
+            st.subheader("Result problems")
+            if problem_table.empty:
+                st.write("No problems were found in the analysed runs.")
+            else:
+                st.dataframe(problem_table, use_container_width=True, hide_index=True)
+
+    #### Settings file replay ####
+    elif design_mode == "Settings file replay":
+        st.markdown(
+            "Runs the settings files uploaded in the sidebar again, as one parallel batch. Every file is read through "
+            "the settings schema: missing settings get their default value and invalid values are reported."
+        )
+        settings_files = st.session_state.get("settings_files", [])
+        if not settings_files:
+            st.info("Upload one or more settings files in the sidebar.")
+        else:
+            import_problems = [(name, problem) for name, _, problems in settings_files for problem in problems]
+            st.caption(f"{len(settings_files)} settings files loaded, {len(import_problems)} invalid values replaced by defaults.")
+            if import_problems:
+                with st.expander("Import problems"):
+                    st.dataframe(pd.DataFrame(import_problems, columns=["File", "Problem"]), use_container_width=True, hide_index=True)
+            replay_validation = validate_records(st.session_state, [values for _, values, _ in settings_files])
+            if not replay_validation.empty:
+                with st.expander(f"Validation warnings ({len(replay_validation)})"):
+                    st.dataframe(replay_validation, use_container_width=True, hide_index=True)
+            st.number_input("Parallel Primer3 runs", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="replay_workers")
+
+            if st.button("▶️ Replay settings files", key="replay_run"):
+                progress_bar = st.progress(0.0, text="Replaying settings files")
+                st.session_state["replay_result"] = run_settings_replay(
+                    settings_files, st.session_state["replay_workers"],
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Replaying settings files ({done}/{total})"),
+                )
+                progress_bar.empty()
+
+        if "replay_result" in st.session_state:
+            show_batch_results(*st.session_state["replay_result"], key="replay")
@@ -0,0 +1,3263 @@
+# Primer3GUI shared core functions
+#
+# Everything in here is free of Streamlit calls, so the functions can be shared by
+# the different versions of the app and used for batch work outside of the GUI.
+
+import os
+import re
+import functools
+import hashlib
+import gzip
+import itertools
+import json
+import mmap
+import operator
+import sqlite3
+import string
+import threading
+import time
+import zlib
+from collections import deque
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+# primer3-py computes hairpins in-process, without it the scan falls back to one ntthal process per window
+try:
+    import primer3
+except ImportError:
+    primer3 = None
+
+
+########################
+### Primer3 Settings ###
+########################
+
+### TODO: maybe order this better, so that the settings are grouped together
+# === Full Primer3 v0.4.0 settings template ===
+PRIMER3_TEMPLATE = """SEQUENCE_ID={seq_id}
+SEQUENCE_TEMPLATE={sequence}
+SEQUENCE_PRIMER={seq_primer}
+SEQUENCE_PRIMER_REVCOMP={seq_primer_rev}
+SEQUENCE_INTERNAL_OLIGO={seq_internal}
+SEQUENCE_TARGET={target}
+EXCLUDED_REGION={excluded_region}
+PRIMER_TASK={primer_task}
+PRIMER_THERMODYNAMIC_OLIGO_ALIGNMENT=0
+PRIMER_THERMODYNAMIC_TEMPLATE_ALIGNMENT=0
+PRIMER_PICK_LEFT_PRIMER=1
+PRIMER_PICK_INTERNAL_OLIGO=1
+PRIMER_PICK_RIGHT_PRIMER=1
+PRIMER_NUM_RETURN={num_return}
+PRIMER_PRODUCT_SIZE_RANGE={product_size_range}
+PRIMER_MIN_SIZE={primer_min_size}
+PRIMER_INTERNAL_MIN_SIZE={probe_min_size}
+PRIMER_OPT_SIZE={primer_opt_size}
+PRIMER_INTERNAL_OPT_SIZE={probe_opt_size}
+PRIMER_MAX_SIZE={primer_max_size}
+PRIMER_INTERNAL_MAX_SIZE={probe_max_size}
+PRIMER_MIN_GC={primer_min_GC}
+PRIMER_INTERNAL_MIN_GC={probe_min_GC}
+PRIMER_OPT_GC_PERCENT={primer_opt_GC}
+PRIMER_INTERNAL_OPT_GC_PERCENT={probe_opt_GC}
+PRIMER_MAX_GC={primer_max_GC}
+PRIMER_INTERNAL_MAX_GC={probe_max_GC}
+PRIMER_GC_CLAMP={CG_clamp}
+PRIMER_MAX_END_GC=5
+PRIMER_MIN_TM={primer_min_tm}
+PRIMER_INTERNAL_MIN_TM={probe_min_tm}
+PRIMER_OPT_TM={primer_opt_tm}
+PRIMER_INTERNAL_OPT_TM={probe_opt_tm}
+PRIMER_MAX_TM={primer_max_tm}
+PRIMER_INTERNAL_MAX_TM={probe_max_tm}
+PRIMER_PAIR_MAX_DIFF_TM={max_tm_diff}
+PRIMER_TM_SANTALUCIA={thermo_param_value}
+PRIMER_PRODUCT_MIN_TM={product_min_tm}
+PRIMER_PRODUCT_OPT_TM={product_opt_tm}
+PRIMER_PRODUCT_MAX_TM= {product_max_tm}
+PRIMER_INTERNAL_OLIGO_MIN_QUALITY={probe_min_seq_qual}
+PRIMER_INTERNAL_OLIGO_SALT_CONC={probe_salt_conc_monocat}
+PRIMER_INTERNAL_OLIGO_DIVALENT_CONC={probe_salt_conc_divcat}
+PRIMER_DNTP_CONC={primer_dntp_conc}
+PRIMER_INTERNAL_DNTP_CONC={probe_dntp_conc}
+PRIMER_SALT_CONC={primer_salt_conc_monocat}
+PRIMER_SALT_CORRECTIONS={salt_correction_value}
+PRIMER_DIVALENT_CONC={primer_salt_conc_divcat}
+PRIMER_DNA_CONC={annealing_oligo_conc}
+PRIMER_INTERNAL_DNA_CONC={probe_DNA_conc}
+PRIMER_MAX_SELF_ANY={primer_max_self_comp}
+PRIMER_INTERNAL_MAX_SELF_ANY={probe_max_self_comp}
+PRIMER_MAX_SELF_END={primer_max_3prime_self_comp}
+PRIMER_INTERNAL_MAX_SELF_END={probe_max_3prime_self_comp}
+PRIMER_MAX_END_STABILITY={max_3_prime_stability}
+PRIMER_MAX_NS_ACCEPTED={max_Ns}
+PRIMER_INTERNAL_MAX_NS_ACCEPTED={probe_max_Ns}
+PRIMER_MAX_POLY_X={max_poly_x}
+PRIMER_INTERNAL_MAX_POLY_X={probe_max_poly_x}
+PRIMER_LOWERCASE_MASKING={lowercase_masking}
+PRIMER_LIBERAL_BASE={liberal_base}
+PRIMER_FIRST_BASE_INDEX={primer_first_base_index}
+PRIMER_MAX_MISPRIMING={max_repeat_mispriming}
+PRIMER_PAIR_MAX_MISPRIMING={pair_max_repeat_mispriming}
+PRIMER_MAX_TEMPLATE_MISPRIMING={max_template_mispriming}
+PRIMER_PAIR_MAX_TEMPLATE_MISPRIMING={pair_max_template_mispriming}
+PRIMER_WT_TEMPLATE_MISPRIMING=0.0
+PRIMER_PAIR_WT_TEMPLATE_MISPRIMING=0.0
+PRIMER_LIB_AMBIGUITY_CODES_CONSENSUS={ambiguity_codes_consensus}
+PRIMER_INSIDE_PENALTY={primer_inside_target_penalty}
+PRIMER_OUTSIDE_PENALTY={primer_outside_target_penalty}
+PRIMER_MIN_5_PRIME_OVERLAP_OF_JUNCTION=5
+PRIMER_PRODUCT_OPT_SIZE=0
+PRIMER_PAIR_WT_PRODUCT_SIZE_LT=0.0
+PRIMER_PAIR_WT_PRODUCT_SIZE_GT=0.0
+PRIMER_WT_SIZE_LT=1.0
+PRIMER_INTERNAL_WT_SIZE_LT=1.0
+PRIMER_WT_SIZE_GT=1.0
+PRIMER_INTERNAL_WT_SIZE_GT=1.0
+PRIMER_WT_GC_PERCENT_LT=0.0
+PRIMER_INTERNAL_WT_GC_PERCENT_LT=0.0
+PRIMER_WT_GC_PERCENT_GT=0.0
+PRIMER_INTERNAL_WT_GC_PERCENT_GT=0.0
+PRIMER_WT_TM_LT=1.0
+PRIMER_INTERNAL_WT_TM_LT=1.0
+PRIMER_WT_TM_GT=1.0
+PRIMER_INTERNAL_WT_TM_GT=1.0
+PRIMER_PAIR_WT_DIFF_TM=0.0
+PRIMER_PAIR_MAX_COMPL_ANY=8.00
+PRIMER_WT_SELF_ANY=0.0
+PRIMER_INTERNAL_WT_SELF_ANY=0.0
+PRIMER_PAIR_WT_COMPL_ANY=0.0
+PRIMER_PAIR_MAX_COMPL_END=3.00
+PRIMER_WT_SELF_END=0.0
+PRIMER_INTERNAL_WT_SELF_END=0.0
+PRIMER_PAIR_WT_COMPL_END=0.0
+PRIMER_PAIR_WT_PRODUCT_TM_LT=0.0
+PRIMER_PAIR_WT_PRODUCT_TM_GT=0.0
+PRIMER_TM_FORMULA=0
+PRIMER_SALT_MONOVALENT=51.0
+PRIMER_INTERNAL_SALT_MONOVALENT=50.0
+PRIMER_SALT_DIVALENT=0.0
+PRIMER_INTERNAL_SALT_DIVALENT=0.0
+PRIMER_WT_END_STABILITY=0.0
+PRIMER_MIN_THREE_PRIME_DISTANCE=-1
+PRIMER_PICK_ANYWAY=1
+PRIMER_EXPLAIN_FLAG=1
+PRIMER_WT_POS_PENALTY=0.0
+PRIMER_SEQUENCING_LEAD=50
+PRIMER_SEQUENCING_SPACING=500
+PRIMER_SEQUENCING_INTERVAL=250
+PRIMER_SEQUENCING_ACCURACY=20
+PRIMER_WT_END_QUAL=0.0
+PRIMER_INTERNAL_WT_END_QUAL=0.0
+PRIMER_MAX_LIBRARY_MISPRIMING=12.00
+PRIMER_INTERNAL_MAX_LIBRARY_MISHYB=12.00
+PRIMER_PAIR_MAX_LIBRARY_MISPRIMING=24.00
+PRIMER_WT_LIBRARY_MISPRIMING=0.0
+PRIMER_INTERNAL_WT_LIBRARY_MISHYB=0.0
+PRIMER_PAIR_WT_LIBRARY_MISPRIMING=0.0
+PRIMER_MIN_QUALITY=0
+PRIMER_INTERNAL_MIN_QUALITY=0
+PRIMER_MIN_END_QUALITY=0
+PRIMER_QUALITY_RANGE_MIN=0
+PRIMER_QUALITY_RANGE_MAX=100
+PRIMER_WT_SEQ_QUAL=0.0
+PRIMER_INTERNAL_WT_SEQ_QUAL=0.0
+PRIMER_PAIR_WT_PR_PENALTY=1.0
+PRIMER_PAIR_WT_IO_PENALTY=0.0
+=
+"""
+
+# function to set the primer task based on the selected checks and/or sequences
+def determine_primer_task(pick_left, pick_right, pick_internal, left, right, internal, sequencing=False):
+    # sequencing primers are only picked on request, they replace the pair/probe tasks
+    if sequencing:
+        return "pick_sequencing_primers"
+
+    # if probe is picked or provided, and at least one primer is picked or provided
+    probe_selected = pick_internal or bool(internal.strip())
+    left_selected = pick_left or bool(left.strip())
+    right_selected = pick_right or bool(right.strip())
+
+    if left_selected and right_selected and probe_selected:
+        return "pick_pcr_primers_and_hyb_probe"
+    elif left_selected and right_selected:
+        return "pick_pcr_primers"
+    elif left_selected and probe_selected:
+        return "pick_pcr_primers_and_hyb_oligo"
+    elif left_selected:
+        return "pick_left_only"
+    elif right_selected and probe_selected:
+        return "pick_pcr_primers_and_hyb_oligo"
+    elif right_selected:
+        return "pick_right_only"
+    elif probe_selected:
+        return "pick_hyb_probe_only"
+    else:
+        return "pick_detection_primers"  # fallback
+
+# function to load previous files, also used to read Primer3 output (same KEY=VALUE format)
+def parse_primer3_input_file(file_text):
+    parsed_input_data = {}
+    for line in file_text.splitlines():
+        if '='in line:
+            key, value = line.split('=',1)
+            parsed_input_data[key.strip()] = value.strip()
+    return parsed_input_data
+
+# function to remove line breaks and target brackets from the pasted sequence
+def clean_sequence(sequence):
+    return sequence.replace("\n", "").replace("[", "").replace("]", "")
+
+# function to get the regions found by the complexity and hairpin scans, only while the sequence they were found on is unchanged
+def auto_excluded_region(values):
+    if values.get("auto_excluded_sequence") != clean_sequence(values["sequence"]).upper():
+        return ""
+    return values.get("auto_excluded_region", "")
+
+# function to compile a settings template once into its lines, each line a list of (literal text, field name) parts
+def compile_settings_template(template):
+    formatter = string.Formatter()
+    return [
+        [(literal, field) for literal, field, _, _ in formatter.parse(line)]
+        for line in template.splitlines()
+    ]
+
+# the compiled template is split after PRIMER_TASK: the head holds the tags that change per record,
+# the tail holds the general settings that are shared by all records of a batch, sweep or run
+COMPILED_TEMPLATE = compile_settings_template(PRIMER3_TEMPLATE)
+_TEMPLATE_SPLIT = next(i for i, parts in enumerate(COMPILED_TEMPLATE) if parts[0][0] == "PRIMER_TASK=") + 1
+TEMPLATE_HEAD = {parts[0][0].rstrip("="): parts for parts in COMPILED_TEMPLATE[:_TEMPLATE_SPLIT]}
+TEMPLATE_TAIL = COMPILED_TEMPLATE[_TEMPLATE_SPLIT:]
+TEMPLATE_TAIL_FIELDS = tuple(dict.fromkeys(field for parts in TEMPLATE_TAIL for _, field in parts if field))
+_tail_values = operator.itemgetter(*TEMPLATE_TAIL_FIELDS)
+
+# primer tasks that use a provided internal oligo
+PROBE_TASKS = ("pick_hyb_probe_only", "pick_pcr_primers_and_hyb_probe", "pick_pcr_primers_and_hyb_oligo")
+
+# serialized tails per set of general settings, and the last serialized tail per line for partial updates
+SETTINGS_CACHE_SIZE = 256
+_tail_cache = {}
+_last_tail = {}
+_tail_cache_lock = threading.Lock()
+
+# function to write one compiled line with the given field values
+def _render_line(parts, fields):
+    return "".join(literal + (format(fields[field]) if field else "") for literal, field in parts)
+
+# function to get the serialized general settings, from the cache or by re-serializing only the changed lines
+def _settings_tail(values):
+    tail_values = _tail_values(values)
+    # the types are part of the key, so 60 and 60.0 (written differently) do not share a cache entry
+    key = (tail_values, tuple(map(type, tail_values)))
+    try:
+        return _tail_cache[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable values are serialized without the cache
+        return "\n".join(_render_line(parts, values) for parts in TEMPLATE_TAIL)
+    fields = dict(zip(TEMPLATE_TAIL_FIELDS, tail_values))
+    # a line is only reused for values of the same type, as 60 == 60.0 but they are written differently
+    line_keys = [tuple((fields[field], type(fields[field])) for _, field in parts if field) for parts in TEMPLATE_TAIL]
+    lines = [
+        _last_tail[i][1] if i in _last_tail and _last_tail[i][0] == line_key else _render_line(parts, fields)
+        for i, (parts, line_key) in enumerate(zip(TEMPLATE_TAIL, line_keys))
+    ]
+    tail = "\n".join(lines)
+    with _tail_cache_lock:
+        _last_tail.update((i, (line_key, line)) for i, (line_key, line) in enumerate(zip(line_keys, lines)))
+        _tail_cache[key] = tail
+        while len(_tail_cache) > SETTINGS_CACHE_SIZE:
+            _tail_cache.pop(next(iter(_tail_cache)))
+    return tail
+
+# function to fill the settings template with the given values (session state or a plain dict)
+# only the per-record head is written on every call, the general settings come from _settings_tail
+def fill_primer3_settings(values, overrides=None):
+    # determine primer task
+    primer_task = determine_primer_task(
+        values["pick_left"],
+        values["pick_right"],
+        values["pick_internal"],
+        values["left"],
+        values["right"],
+        values["internal"],
+        sequencing=values.get("sequencing", False),
+    )
+
+    # template placeholders share their names with the session state keys, except for these
+    fields = {
+        "seq_id": values["seq_id"],
+        "sequence": clean_sequence(values["sequence"]),
+        "seq_primer": values["left"],
+        "seq_primer_rev": values["right"],
+        "seq_internal": values["internal"],
+        "target": values["target"],
+        # regions found by the complexity scan are added to the manual/marked excluded region
+        "excluded_region": " ".join(region for region in (values["excluded_region"], auto_excluded_region(values)) if region),
+        "primer_task": primer_task,
+    }
+    head = [TEMPLATE_HEAD["SEQUENCE_ID"], TEMPLATE_HEAD["SEQUENCE_TEMPLATE"]]
+    if not values["pick_left"]:
+        head.append(TEMPLATE_HEAD["SEQUENCE_PRIMER"])
+    if not values["pick_right"]:
+        head.append(TEMPLATE_HEAD["SEQUENCE_PRIMER_REVCOMP"])
+    # only keep the internal oligo if the primer_task actually uses a probe
+    if not values["pick_internal"] and primer_task in PROBE_TASKS:
+        head.append(TEMPLATE_HEAD["SEQUENCE_INTERNAL_OLIGO"])
+    head += [TEMPLATE_HEAD["SEQUENCE_TARGET"], TEMPLATE_HEAD["EXCLUDED_REGION"], TEMPLATE_HEAD["PRIMER_TASK"]]
+    settings_filled = "\n".join(_render_line(parts, fields) for parts in head) + "\n" + _settings_tail(values)
+
+    if overrides:
+        settings_filled = apply_settings_overrides(settings_filled, overrides)
+    return settings_filled
+
+# function to replace (or add) raw Primer3 tags in filled settings, e.g. {"PRIMER_NUM_RETURN": 500}
+def apply_settings_overrides(settings_filled, overrides):
+    remaining = dict(overrides)
+    lines = []
+    for line in settings_filled.splitlines():
+        if line == "=":
+            continue
+        key = line.split("=", 1)[0]
+        if key in remaining:
+            line = f"{key}={remaining.pop(key)}"
+        lines.append(line)
+    lines += [f"{key}={value}" for key, value in remaining.items()]
+    lines.append("=")
+    return "\n".join(lines) + "\n"
+
+
+#######################
+### Running Primer3 ###
+#######################
+
+# default number of Primer3 processes to run at the same time
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# function to make a group of Primer3 processes that can be stopped together, e.g. once their results are no longer needed
+def primer3_process_group():
+    return {"processes": [], "stopped": False, "lock": threading.Lock()}
+
+# function to stop the running processes of a group and wait for them, no new processes are started in the group after this
+def stop_primer3_processes(group):
+    with group["lock"]:
+        group["stopped"] = True
+        processes = list(group["processes"])
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        process.wait()
+
+# function to call primer3_core on filled settings, returns the output and whether the run succeeded
+# with a process group, returns None when the group was stopped before the run finished
+def _call_primer3(settings_filled, group=None):
+    command = ["primer3_core"]
+    pipes = {"stdin": subprocess.PIPE, "stdout": subprocess.PIPE, "stderr": subprocess.PIPE, "text": True}
+    if group is None:
+        process = subprocess.Popen(command, **pipes)
+    else:
+        with group["lock"]:
+            if group["stopped"]:
+                return None
+            process = subprocess.Popen(command, **pipes)
+            group["processes"].append(process)
+    stdout, stderr = process.communicate(settings_filled)
+    if group is not None and group["stopped"]:
+        return None
+    if process.returncode != 0:
+        return stderr, False
+    return stdout, True
+
+# function to run primer3_core on filled settings, reusing and recording runs in the run history store
+# returns the output, whether the run succeeded and whether the output was reused from the store
+# with a process group, returns None (and records nothing) when the group was stopped before the run finished
+def run_primer3_reused(settings_filled, group=None):
+    key = settings_hash(settings_filled)
+    stored = _stored_runs([key])
+    if key in stored:
+        return (*stored[key], True)
+    started = time.perf_counter()
+    result = _call_primer3(settings_filled, group)
+    if result is None:
+        return None
+    _store_runs([(settings_filled, *result, time.perf_counter() - started)])
+    return (*result, False)
+
+# function to run primer3_core on filled settings, returns the output and whether the run succeeded
+def run_primer3(settings_filled, group=None):
+    result = run_primer3_reused(settings_filled, group)
+    return None if result is None else result[:2]
+
+# number of Primer3 outputs kept in memory, so repeated variants are not run again
+RESULT_CACHE_SIZE = 10000
+_result_cache = {}
+_result_cache_lock = threading.Lock()
+
+# function to get a short hash identifying filled settings
+def settings_hash(settings_filled):
+    return hashlib.sha1(settings_filled.encode("utf-8")).hexdigest()
+
+# function to split a Primer3 output holding several records into one text per record
+def split_primer3_records(output):
+    records = []
+    current = []
+    for line in output.splitlines():
+        current.append(line)
+        if line == "=":
+            records.append("\n".join(current) + "\n")
+            current = []
+    return records
+
+# function to run several settings records in one primer3_core call, saving the process start up
+# returns the results and the run time per record
+def _run_primer3_chunk(chunk):
+    started = time.perf_counter()
+    output, success = _call_primer3("".join(settings if settings.endswith("\n") else settings + "\n" for settings in chunk))
+    results = [(output, success)] if len(chunk) == 1 else None
+    if success:
+        records = split_primer3_records(output)
+        if len(records) == len(chunk):
+            results = [(record, True) for record in records]
+    if results is None:
+        # fall back to single runs, so one faulty record does not fail the others
+        results = [_call_primer3(settings) for settings in chunk]
+    return results, (time.perf_counter() - started) / len(chunk)
+
+# function to run many filled settings on a pool of Primer3 processes, returns (output, success) per settings
+def run_primer3_batch(settings_list, max_workers=DEFAULT_WORKERS, chunk_size=20, use_cache=True, progress=None):
+    results = [None] * len(settings_list)
+    pending = {}
+    for i, settings in enumerate(settings_list):
+        key = settings_hash(settings)
+        if use_cache and key in _result_cache:
+            results[i] = _result_cache[key]
+        else:
+            pending.setdefault(key, []).append(i)
+
+    # runs already in the history store are reopened instead of run again
+    if use_cache and pending:
+        for key, result in _stored_runs(list(pending)).items():
+            for i in pending.pop(key):
+                results[i] = result
+
+    # Primer3 keeps global tags between records, so only records setting the same tags share a call
+    groups = {}
+    for key, indices in pending.items():
+        tags = tuple(line.split("=", 1)[0] for line in settings_list[indices[0]].splitlines())
+        groups.setdefault(tags, []).append(key)
+    chunks = [keys[i:i + chunk_size] for keys in groups.values() for i in range(0, len(keys), chunk_size)]
+
+    done = len(settings_list) - sum(len(indices) for indices in pending.values())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_run_primer3_chunk, [settings_list[pending[key][0]] for key in chunk]): chunk
+            for chunk in chunks
+        }
+        for future in as_completed(futures):
+            chunk_results, elapsed = future.result()
+            _store_runs([
+                (settings_list[pending[key][0]], *result, elapsed)
+                for key, result in zip(futures[future], chunk_results)
+            ])
+            for key, result in zip(futures[future], chunk_results):
+                if use_cache:
+                    with _result_cache_lock:
+                        _result_cache[key] = result
+                        while len(_result_cache) > RESULT_CACHE_SIZE:
+                            _result_cache.pop(next(iter(_result_cache)))
+                for i in pending[key]:
+                    results[i] = result
+                done += len(pending[key])
+            if progress:
+                progress(done, len(settings_list))
+    return results
+
+# function to summarize the best result of one Primer3 output as a table row
+def summarize_primer3_output(output, success):
+    parsed = parse_primer3_input_file(output) if success else {}
+    error = parsed.get("PRIMER_ERROR", "") if success else output.strip()
+    return {
+        "Results": results_returned(parsed) if success and not error else 0,
+        "Best penalty": to_number(parsed.get("PRIMER_PAIR_0_PENALTY", parsed.get("PRIMER_LEFT_0_PENALTY", ""))),
+        "Forward primer": parsed.get("PRIMER_LEFT_0_SEQUENCE", ""),
+        "Reverse primer": parsed.get("PRIMER_RIGHT_0_SEQUENCE", ""),
+        "Probe": parsed.get("PRIMER_INTERNAL_0_SEQUENCE", ""),
+        "Forward Tm": to_number(parsed.get("PRIMER_LEFT_0_TM", "")),
+        "Reverse Tm": to_number(parsed.get("PRIMER_RIGHT_0_TM", "")),
+        "Product size": to_number(parsed.get("PRIMER_PAIR_0_PRODUCT_SIZE", "")),
+        "Error": error,
+    }
+
+# function to get the number of returned results (pairs, or single oligos for the other tasks)
+def results_returned(parsed_output):
+    if "PRIMER_PAIR_NUM_RETURNED" in parsed_output:
+        return int(parsed_output["PRIMER_PAIR_NUM_RETURNED"])
+    returned = [
+        int(parsed_output.get(f"PRIMER_{oligo}_NUM_RETURNED", 0))
+        for oligo in ("LEFT", "RIGHT", "INTERNAL")
+    ]
+    return max(returned)
+
+# regex to split result tags such as PRIMER_LEFT_0_TM into oligo type, result index and field
+RESULT_KEY_PATTERN = re.compile(r"^PRIMER_(LEFT|RIGHT|INTERNAL|PAIR)_(\d+)(?:_(\w+))?$")
+
+# function to convert an output value into a number where possible
+def to_number(value):
+    if value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+# function to collect all results of a Primer3 output record into one table, one row per result
+def primer3_results_table(parsed_output):
+    rows = {}
+    for key, value in parsed_output.items():
+        match = RESULT_KEY_PATTERN.match(key)
+        if not match:
+            continue
+        oligo, idx, field = match.groups()
+        row = rows.setdefault(int(idx), {"rank": int(idx)})
+        prefix = oligo.lower()
+        if field is None:
+            # position tag, e.g. PRIMER_LEFT_0=start,length
+            start, length = value.split(",")
+            row[f"{prefix}_start"] = int(start)
+            row[f"{prefix}_len"] = int(length)
+        else:
+            row[f"{prefix}_{field.lower()}"] = to_number(value)
+    return pd.DataFrame.from_dict(rows, orient="index").sort_index().reset_index(drop=True)
+
+
+#################################
+### Penalty weight re-ranking ###
+#################################
+
+# penalty weights that can be recomputed from cached oligo features, with their template default
+RERANK_WEIGHTS = {
+    key: float(value)
+    for key, value in parse_primer3_input_file(PRIMER3_TEMPLATE).items()
+    if key in (
+        "PRIMER_WT_TM_LT", "PRIMER_WT_TM_GT", "PRIMER_WT_SIZE_LT", "PRIMER_WT_SIZE_GT",
+        "PRIMER_WT_GC_PERCENT_LT", "PRIMER_WT_GC_PERCENT_GT", "PRIMER_WT_SELF_ANY",
+        "PRIMER_WT_SELF_END", "PRIMER_WT_END_STABILITY",
+        "PRIMER_INTERNAL_WT_TM_LT", "PRIMER_INTERNAL_WT_TM_GT", "PRIMER_INTERNAL_WT_SIZE_LT",
+        "PRIMER_INTERNAL_WT_SIZE_GT", "PRIMER_INTERNAL_WT_GC_PERCENT_LT",
+        "PRIMER_INTERNAL_WT_GC_PERCENT_GT", "PRIMER_INTERNAL_WT_SELF_ANY", "PRIMER_INTERNAL_WT_SELF_END",
+        "PRIMER_PAIR_WT_PR_PENALTY", "PRIMER_PAIR_WT_IO_PENALTY", "PRIMER_PAIR_WT_DIFF_TM",
+        "PRIMER_PAIR_WT_COMPL_ANY", "PRIMER_PAIR_WT_COMPL_END",
+        "PRIMER_PAIR_WT_PRODUCT_SIZE_LT", "PRIMER_PAIR_WT_PRODUCT_SIZE_GT",
+        "PRIMER_PAIR_WT_PRODUCT_TM_LT", "PRIMER_PAIR_WT_PRODUCT_TM_GT",
+    )
+}
+
+# function to get a table column as a float array, with zeros when the column is missing
+def _feature(table, column):
+    if column not in table:
+        return np.zeros(len(table))
+    return pd.to_numeric(table[column], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+
+# function to build the candidate pool used for re-ranking from a (large) Primer3 run
+def build_candidate_pool(parsed_output, values):
+    table = primer3_results_table(parsed_output)
+    arrays = {column: _feature(table, column) for column in (
+        "left_tm", "left_len", "left_gc_percent", "left_self_any", "left_self_end", "left_end_stability", "left_penalty",
+        "right_tm", "right_len", "right_gc_percent", "right_self_any", "right_self_end", "right_end_stability", "right_penalty",
+        "internal_tm", "internal_len", "internal_gc_percent", "internal_self_any", "internal_self_end", "internal_penalty",
+        "pair_compl_any", "pair_compl_end", "pair_product_size", "pair_product_tm", "pair_penalty",
+    )}
+    pool = {
+        "table": table,
+        "arrays": arrays,
+        "has_internal": "internal_sequence" in table,
+        "opts": {
+            "primer": (values["primer_opt_tm"], values["primer_opt_size"], values["primer_opt_GC"]),
+            "probe": (values["probe_opt_tm"], values["probe_opt_size"], values["probe_opt_GC"]),
+            "product_tm": values["product_opt_tm"],
+            "product_size": float(parse_primer3_input_file(PRIMER3_TEMPLATE)["PRIMER_PRODUCT_OPT_SIZE"]),
+        },
+    }
+    # part of the Primer3 penalty that cannot be recomputed (e.g. sequence quality), kept as a constant
+    left, right, internal, _ = _penalties(pool, RERANK_WEIGHTS, pool["opts"])
+    pool["residuals"] = (
+        arrays["left_penalty"] - left,
+        arrays["right_penalty"] - right,
+        arrays["internal_penalty"] - internal,
+        np.zeros(len(table)),
+    )
+    # the pair residual is taken with the oligo residuals in place, so the pair term uses the reported oligo
+    # penalties and the default weights give back Primer3's pair penalty
+    pair = _penalties(pool, RERANK_WEIGHTS, pool["opts"])[3]
+    pool["residuals"] = pool["residuals"][:3] + (arrays["pair_penalty"] - pair,)
+    return pool
+
+# function to compute the penalty of one oligo type for all candidates at once
+def _oligo_penalties(arrays, prefix, weights, weight_prefix, opts):
+    opt_tm, opt_size, opt_gc = opts
+    tm = arrays[f"{prefix}_tm"]
+    size = arrays[f"{prefix}_len"]
+    gc = arrays[f"{prefix}_gc_percent"]
+    penalty = (
+        weights.get(f"{weight_prefix}TM_GT", 0.0) * np.clip(tm - opt_tm, 0, None)
+        + weights.get(f"{weight_prefix}TM_LT", 0.0) * np.clip(opt_tm - tm, 0, None)
+        + weights.get(f"{weight_prefix}SIZE_GT", 0.0) * np.clip(size - opt_size, 0, None)
+        + weights.get(f"{weight_prefix}SIZE_LT", 0.0) * np.clip(opt_size - size, 0, None)
+        + weights.get(f"{weight_prefix}GC_PERCENT_GT", 0.0) * np.clip(gc - opt_gc, 0, None)
+        + weights.get(f"{weight_prefix}GC_PERCENT_LT", 0.0) * np.clip(opt_gc - gc, 0, None)
+        + weights.get(f"{weight_prefix}SELF_ANY", 0.0) * arrays[f"{prefix}_self_any"]
+        + weights.get(f"{weight_prefix}SELF_END", 0.0) * arrays[f"{prefix}_self_end"]
+    )
+    if f"{prefix}_end_stability" in arrays:
+        penalty = penalty + weights.get(f"{weight_prefix}END_STABILITY", 0.0) * arrays[f"{prefix}_end_stability"]
+    return penalty
+
+# function to compute oligo and pair penalties following the Primer3 objective functions
+def _penalties(pool, weights, opts):
+    arrays = pool["arrays"]
+    left = _oligo_penalties(arrays, "left", weights, "PRIMER_WT_", opts["primer"])
+    right = _oligo_penalties(arrays, "right", weights, "PRIMER_WT_", opts["primer"])
+    internal = _oligo_penalties(arrays, "internal", weights, "PRIMER_INTERNAL_WT_", opts["probe"])
+    if not pool["has_internal"]:
+        internal = np.zeros_like(left)
+    if "residuals" in pool:
+        left = left + pool["residuals"][0]
+        right = right + pool["residuals"][1]
+        internal = internal + pool["residuals"][2]
+
+    product_tm = arrays["pair_product_tm"]
+    product_size = arrays["pair_product_size"]
+    pair = (
+        weights.get("PRIMER_PAIR_WT_PR_PENALTY", 0.0) * (left + right)
+        + weights.get("PRIMER_PAIR_WT_IO_PENALTY", 0.0) * internal
+        + weights.get("PRIMER_PAIR_WT_DIFF_TM", 0.0) * np.abs(arrays["left_tm"] - arrays["right_tm"])
+        + weights.get("PRIMER_PAIR_WT_COMPL_ANY", 0.0) * arrays["pair_compl_any"]
+        + weights.get("PRIMER_PAIR_WT_COMPL_END", 0.0) * arrays["pair_compl_end"]
+        + weights.get("PRIMER_PAIR_WT_PRODUCT_TM_GT", 0.0) * np.clip(product_tm - opts["product_tm"], 0, None)
+        + weights.get("PRIMER_PAIR_WT_PRODUCT_TM_LT", 0.0) * np.clip(opts["product_tm"] - product_tm, 0, None)
+        + weights.get("PRIMER_PAIR_WT_PRODUCT_SIZE_GT", 0.0) * np.clip(product_size - opts["product_size"], 0, None)
+        + weights.get("PRIMER_PAIR_WT_PRODUCT_SIZE_LT", 0.0) * np.clip(opts["product_size"] - product_size, 0, None)
+    )
+    if "residuals" in pool:
+        pair = pair + pool["residuals"][3]
+    return left, right, internal, pair
+
+# function to re-rank the cached candidates with custom weights, without running Primer3 again
+def rerank_candidates(pool, weights, product_opt_size=None):
+    full_weights = {**RERANK_WEIGHTS, **weights}
+    opts = dict(pool["opts"])
+    if product_opt_size is not None:
+        opts["product_size"] = product_opt_size
+    left, right, internal, pair = _penalties(pool, full_weights, opts)
+    order = np.argsort(pair, kind="stable")
+    ranked = pool["table"].iloc[order].copy()
+    ranked.insert(0, "new_penalty", pair[order].round(4))
+    ranked.insert(1, "new_rank", np.arange(1, len(order) + 1))
+    ranked["left_new_penalty"] = left[order].round(4)
+    ranked["right_new_penalty"] = right[order].round(4)
+    if pool["has_internal"]:
+        ranked["internal_new_penalty"] = internal[order].round(4)
+    return ranked.reset_index(drop=True)
+
+
+###########################
+### Constraint explorer ###
+###########################
+
+# rows of the oligo explanation summary, in the order Primer3 reports them
+EXPLAIN_KEYS = [
+    "considered",
+    "too many Ns",
+    "in target",
+    "in excl region",
+    "GC content failed",
+    "no GC clamp",
+    "low tm",
+    "high tm",
+    "high any compl",
+    "high end compl",
+    "long poly-x seq",
+    "high 3' stability",
+    "ok",
+]
+
+# function to read a PRIMER_*_EXPLAIN value such as "considered 100, low tm 20, ok 80" into a dict
+def parse_explain(explain_value):
+    counts = {}
+    for item in explain_value.split(", "):
+        if " " in item:
+            k, v = item.rsplit(" ", 1)
+            if v.isdigit():
+                counts[k] = int(v)
+    return counts
+
+# function to get the longest run of identical bases in a sequence
+def longest_poly_x(sequence):
+    longest = 0
+    for match in re.finditer(r"(.)\1*", sequence.upper()):
+        longest = max(longest, len(match.group(0)))
+    return longest
+
+# function to count the consecutive G/C bases at the 3' end of a sequence
+def gc_clamp_length(sequence):
+    stripped = sequence.upper().rstrip("GC")
+    return len(sequence) - len(stripped)
+
+# function to build the relaxed overrides used to collect the candidate oligo space once
+def explorer_overrides(values):
+    return {
+        "PRIMER_TASK": "pick_primer_list",
+        "PRIMER_PICK_ANYWAY": 1,
+        "PRIMER_PICK_INTERNAL_OLIGO": 1 if values["pick_internal"] else 0,
+        "PRIMER_NUM_RETURN": 100000,
+        "PRIMER_MIN_SIZE": max(1, min(values["primer_min_size"], values["primer_opt_size"]) - 3),
+        "PRIMER_MAX_SIZE": min(36, max(values["primer_max_size"], values["primer_opt_size"]) + 3),
+        "PRIMER_INTERNAL_MIN_SIZE": max(1, min(values["probe_min_size"], values["probe_opt_size"]) - 3),
+        "PRIMER_INTERNAL_MAX_SIZE": min(36, max(values["probe_max_size"], values["probe_opt_size"]) + 3),
+        "PRIMER_MIN_TM": 0.0, "PRIMER_MAX_TM": 100.0,
+        "PRIMER_INTERNAL_MIN_TM": 0.0, "PRIMER_INTERNAL_MAX_TM": 100.0,
+        "PRIMER_MIN_GC": 0.0, "PRIMER_MAX_GC": 100.0,
+        "PRIMER_INTERNAL_MIN_GC": 0.0, "PRIMER_INTERNAL_MAX_GC": 100.0,
+        "PRIMER_GC_CLAMP": 0,
+        "PRIMER_MAX_POLY_X": 36, "PRIMER_INTERNAL_MAX_POLY_X": 36,
+        "PRIMER_MAX_SELF_ANY": 100.0, "PRIMER_INTERNAL_MAX_SELF_ANY": 100.0,
+        "PRIMER_MAX_SELF_END": 100.0, "PRIMER_INTERNAL_MAX_SELF_END": 100.0,
+        "PRIMER_MAX_END_STABILITY": 100.0,
+    }
+
+# function to store the candidate oligo space of a relaxed run as numeric arrays per oligo type
+def build_oligo_space(parsed_output):
+    table = primer3_results_table(parsed_output)
+    space = {}
+    for oligo in ("LEFT", "RIGHT", "INTERNAL"):
+        prefix = oligo.lower()
+        if f"{prefix}_sequence" not in table:
+            continue
+        oligos = table.dropna(subset=[f"{prefix}_sequence"])
+        sequences = oligos[f"{prefix}_sequence"].tolist()
+        explain = parse_explain(parsed_output.get(f"PRIMER_{oligo}_EXPLAIN", ""))
+        space[oligo] = {
+            "size": _feature(oligos, f"{prefix}_len"),
+            "tm": _feature(oligos, f"{prefix}_tm"),
+            "gc": _feature(oligos, f"{prefix}_gc_percent"),
+            "self_any": _feature(oligos, f"{prefix}_self_any"),
+            "self_end": _feature(oligos, f"{prefix}_self_end"),
+            "end_stability": _feature(oligos, f"{prefix}_end_stability"),
+            "poly_x": np.array([longest_poly_x(s) for s in sequences], dtype=int),
+            "gc_clamp": np.array([gc_clamp_length(s) for s in sequences], dtype=int),
+            # rejections that do not depend on the explored constraints
+            "fixed": {key: explain.get(key, 0) for key in ("too many Ns", "in target", "in excl region")},
+        }
+    return space
+
+# function to count, with vectorized masks, how many oligos each constraint would reject
+def explore_oligo_space(space, limits):
+    summary = pd.DataFrame(index=EXPLAIN_KEYS)
+    for oligo, arrays in space.items():
+        lim = limits[oligo]
+        in_size = (arrays["size"] >= lim["min_size"]) & (arrays["size"] <= lim["max_size"])
+        # each oligo is counted once, for the first constraint it fails (as in the Primer3 explanation)
+        checks = [
+            ("GC content failed", (arrays["gc"] < lim["min_gc"]) | (arrays["gc"] > lim["max_gc"])),
+            ("no GC clamp", arrays["gc_clamp"] < lim.get("gc_clamp", 0)),
+            ("low tm", arrays["tm"] < lim["min_tm"]),
+            ("high tm", arrays["tm"] > lim["max_tm"]),
+            ("high any compl", arrays["self_any"] > lim["max_self_any"]),
+            ("high end compl", arrays["self_end"] > lim["max_self_end"]),
+            ("long poly-x seq", arrays["poly_x"] > lim["max_poly_x"]),
+            ("high 3' stability", arrays["end_stability"] > lim.get("max_end_stability", np.inf)),
+        ]
+        remaining = in_size.copy()
+        counts = dict(arrays["fixed"])
+        for key, failed in checks:
+            rejected = remaining & failed
+            counts[key] = int(rejected.sum())
+            remaining &= ~failed
+        counts["ok"] = int(remaining.sum())
+        counts["considered"] = int(in_size.sum()) + sum(arrays["fixed"].values())
+        summary[oligo] = [counts.get(key, 0) for key in EXPLAIN_KEYS]
+    return summary
+
+# function to get the explorer limits matching the current settings
+def explorer_limits(values):
+    limits = {}
+    for oligo, prefix in (("LEFT", "primer"), ("RIGHT", "primer"), ("INTERNAL", "probe")):
+        limits[oligo] = {
+            "min_size": values[f"{prefix}_min_size"],
+            "max_size": values[f"{prefix}_max_size"],
+            "min_tm": values[f"{prefix}_min_tm"],
+            "max_tm": values[f"{prefix}_max_tm"],
+            "min_gc": values[f"{prefix}_min_GC"],
+            "max_gc": values[f"{prefix}_max_GC"],
+            "max_self_any": values[f"{prefix}_max_self_comp"],
+            "max_self_end": values[f"{prefix}_max_3prime_self_comp"],
+            "max_poly_x": values["max_poly_x"] if prefix == "primer" else values["probe_max_poly_x"],
+        }
+        if prefix == "primer":
+            limits[oligo]["gc_clamp"] = values["CG_clamp"]
+            limits[oligo]["max_end_stability"] = values["max_3_prime_stability"]
+    return limits
+
+
+#########################
+### Auto-relax ladder ###
+#########################
+
+# function to widen a min/max pair by the given amount, within the allowed bounds
+def _widen(values, min_key, max_key, amount, lowest=None, highest=None):
+    new_min = values[min_key] - amount
+    new_max = values[max_key] + amount
+    if lowest is not None:
+        new_min = max(lowest, new_min)
+    if highest is not None:
+        new_max = min(highest, new_max)
+    return {min_key: new_min, max_key: new_max}
+
+# function to add one broad product size range covering (and extending) all given ranges
+def _widen_product_sizes(values):
+    ranges = [tuple(map(int, r.split("-"))) for r in values["product_size_range"].split() if "-" in r]
+    if not ranges:
+        return {}
+    lowest = min(start for start, end in ranges)
+    highest = max(end for start, end in ranges)
+    return {"product_size_range": f"{values['product_size_range']} {max(1, lowest // 2)}-{highest * 2}"}
+
+# relaxation steps, applied cumulatively: ladder variant n uses the first n steps
+RELAX_STEPS = [
+    ("Tm window widened by 2 °C", lambda v: _widen(v, "primer_min_tm", "primer_max_tm", 2.0, 0.0, 100.0)),
+    ("GC window widened by 10%", lambda v: _widen(v, "primer_min_GC", "primer_max_GC", 10.0, 0.0, 100.0)),
+    ("Max poly X increased by 1", lambda v: {"max_poly_x": v["max_poly_x"] + 1}),
+    ("Broad product size range added", _widen_product_sizes),
+    ("Primer size window widened by 2", lambda v: _widen(v, "primer_min_size", "primer_max_size", 2, 1, 36)),
+    ("Tm window widened by another 3 °C", lambda v: _widen(v, "primer_min_tm", "primer_max_tm", 3.0, 0.0, 100.0)),
+    ("Self complementarity limits increased", lambda v: {
+        "primer_max_self_comp": v["primer_max_self_comp"] + 4.0,
+        "primer_max_3prime_self_comp": v["primer_max_3prime_self_comp"] + 2.0,
+    }),
+    ("Max poly X increased by another 2", lambda v: {"max_poly_x": v["max_poly_x"] + 2}),
+    ("Max Tm difference and 3' stability relaxed", lambda v: {
+        "max_tm_diff": v["max_tm_diff"] + 5.0,
+        "max_3_prime_stability": v["max_3_prime_stability"] + 3.0,
+    }),
+]
+
+# function to build the ladder of progressively relaxed setting values (variant 0 is unchanged)
+def build_relax_ladder(values, steps=RELAX_STEPS):
+    ladder = [{"relaxations": [], "values": dict(values)}]
+    for label, relax in steps:
+        previous = ladder[-1]
+        ladder.append({
+            "relaxations": previous["relaxations"] + [label],
+            "values": {**previous["values"], **relax(previous["values"])},
+        })
+    return ladder
+
+# function to run the ladder in parallel and stop as soon as the least relaxed usable variant is known
+def run_relax_ladder(values, min_pairs, max_workers=DEFAULT_WORKERS, steps=RELAX_STEPS):
+    ladder = build_relax_ladder(values, steps)
+    for variant in ladder:
+        variant["settings"] = fill_primer3_settings(variant["values"])
+        variant["status"] = "not run"
+
+    group = primer3_process_group()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(run_primer3, variant["settings"], group): i for i, variant in enumerate(ladder)}
+    chosen = None
+    for future in as_completed(futures):
+        i = futures[future]
+        output, success = future.result()
+        returned = results_returned(parse_primer3_input_file(output)) if success else 0
+        ladder[i].update(output=output, success=success, returned=returned)
+        ladder[i]["status"] = "usable" if success and returned >= min_pairs else "too few results"
+
+        # the first usable variant wins once all less relaxed variants have finished
+        usable = [j for j, variant in enumerate(ladder) if variant["status"] == "usable"]
+        if usable and all(variant["status"] != "not run" for variant in ladder[:usable[0]]):
+            chosen = usable[0]
+            break
+    # more relaxed variants are no longer needed, stop the running ones and cancel the ones that have not started yet
+    stop_primer3_processes(group)
+    executor.shutdown(cancel_futures=True)
+    for variant in ladder:
+        if variant["status"] == "not run":
+            variant["status"] = "skipped"
+
+    summary = pd.DataFrame([
+        {
+            "Variant": i,
+            "Relaxations": len(variant["relaxations"]),
+            "Last relaxation": variant["relaxations"][-1] if variant["relaxations"] else "none",
+            "Results": variant.get("returned"),
+            "Status": variant["status"],
+        }
+        for i, variant in enumerate(ladder)
+    ])
+    return chosen, ladder, summary
+
+# function to list which setting values differ between two value sets
+def changed_settings(original, relaxed):
+    return pd.DataFrame([
+        {"Setting": key, "Original": original[key], "Relaxed": value}
+        for key, value in relaxed.items()
+        if key in original and original[key] != value
+    ])
+
+
+#######################
+### Parameter sweep ###
+#######################
+
+# function to convert comma separated sweep values to the type of the setting's default value
+def parse_sweep_values(text, default):
+    values = []
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if isinstance(default, bool):
+            values.append(item.lower() in ("1", "true", "yes"))
+        elif isinstance(default, int):
+            values.append(int(float(item)))
+        elif isinstance(default, float):
+            values.append(float(item))
+        else:
+            values.append(item)
+    return values
+
+# function to expand a parameter grid such as {"primer_salt_conc_monocat": [25.0, 50.0]} into all combinations
+def expand_parameter_grid(grid):
+    keys = list(grid)
+    return [dict(zip(keys, combination)) for combination in itertools.product(*(grid[key] for key in keys))]
+
+# function to run every combination of a parameter grid and collect the results in one comparison table
+def run_parameter_sweep(values, grid, max_workers=DEFAULT_WORKERS, progress=None):
+    variants = expand_parameter_grid(grid)
+    settings_list = [fill_primer3_settings({**values, **variant}) for variant in variants]
+    results = run_primer3_batch(settings_list, max_workers=max_workers, progress=progress)
+    rows = [
+        {**variant, **summarize_primer3_output(output, success)}
+        for variant, (output, success) in zip(variants, results)
+    ]
+    return pd.DataFrame(rows), settings_list, results
+
+
+#####################################
+### Split product size range runs ###
+#####################################
+
+# function to group the result tags of one output record per result index
+def _result_blocks(record_text):
+    blocks = {}
+    for line in record_text.splitlines():
+        key, _, value = line.partition("=")
+        match = RESULT_KEY_PATTERN.match(key)
+        if match:
+            oligo, idx, field = match.groups()
+            blocks.setdefault(int(idx), []).append((oligo, field, value))
+    return [blocks[idx] for idx in sorted(blocks)]
+
+# function to get the identity of a result (positions of its oligos), used to drop duplicate pairs
+def _result_identity(block):
+    return tuple(sorted((oligo, value) for oligo, field, value in block if field is None))
+
+# function to merge the outputs of separate product size range runs as one sequential Primer3 output
+def merge_product_range_outputs(outputs, product_size_range, num_return):
+    # only the ranges Primer3 itself would have reached are used: it stops at the first range
+    # where enough pairs have been found
+    visited = []
+    found = 0
+    for output in outputs:
+        visited.append(output)
+        found += results_returned(parse_primer3_input_file(output))
+        if found >= num_return:
+            break
+
+    # like Primer3, keep all pairs of the earlier ranges and only fill the remaining places from the next range,
+    # in Primer3's order within a range
+    merged = []
+    seen = set()
+    for output in visited:
+        for block in _result_blocks(output):
+            identity = _result_identity(block)
+            if identity in seen:
+                continue
+            seen.add(identity)
+            merged.append(block)
+            if len(merged) >= num_return:
+                break
+        if len(merged) >= num_return:
+            break
+
+    # use the first range run for the echoed settings and explanation lines
+    header = []
+    pair_explain = {}
+    for line in visited[0].splitlines():
+        key, _, value = line.partition("=")
+        if line == "=" or RESULT_KEY_PATTERN.match(key) or key.endswith("_NUM_RETURNED") or key == "PRIMER_PAIR_EXPLAIN":
+            continue
+        if key == "PRIMER_PRODUCT_SIZE_RANGE":
+            line = f"PRIMER_PRODUCT_SIZE_RANGE={product_size_range}"
+        header.append(line)
+    for output in visited:
+        for key, count in parse_explain(parse_primer3_input_file(output).get("PRIMER_PAIR_EXPLAIN", "")).items():
+            pair_explain[key] = pair_explain.get(key, 0) + count
+    if pair_explain:
+        pair_explain["ok"] = len(merged)
+        header.append("PRIMER_PAIR_EXPLAIN=" + ", ".join(f"{key} {count}" for key, count in pair_explain.items()))
+
+    return _format_result_blocks(header, merged)
+
+# function to get the settings Primer3 echoed at the top of an output record, for results that were kept without their settings
+def echoed_settings(output):
+    lines = []
+    for line in output.splitlines():
+        if line == "=":
+            break
+        key = line.partition("=")[0]
+        if RESULT_KEY_PATTERN.match(key) or key.endswith(("_EXPLAIN", "_NUM_RETURNED")) or key in ("PRIMER_ERROR", "PRIMER_WARNING"):
+            continue
+        lines.append(line)
+    return "\n".join(lines + ["="]) if lines else ""
+
+# function to write result blocks back as a Primer3 output record, renumbered from 0
+def _format_result_blocks(header, blocks):
+    lines = list(header)
+    for oligo in ("LEFT", "RIGHT", "INTERNAL", "PAIR"):
+        if any(block_oligo == oligo for block in blocks for block_oligo, field, value in block):
+            lines.append(f"PRIMER_{oligo}_NUM_RETURNED={len(blocks)}")
+    for new_idx, block in enumerate(blocks):
+        for oligo, field, value in block:
+            key = f"PRIMER_{oligo}_{new_idx}" + (f"_{field}" if field else "")
+            lines.append(f"{key}={value}")
+    lines.append("=")
+    return "\n".join(lines) + "\n"
+
+# function to run each product size range as its own parallel Primer3 job and merge the results
+def run_split_product_ranges(values, max_workers=DEFAULT_WORKERS):
+    product_size_range = values["product_size_range"]
+    ranges = product_size_range.split()
+    num_return = int(values["num_return"])
+    settings_list = [fill_primer3_settings({**values, "product_size_range": size_range}) for size_range in ranges]
+
+    results = [None] * len(ranges)
+    group = primer3_process_group()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(run_primer3, settings, group): i for i, settings in enumerate(settings_list)}
+    for future in as_completed(futures):
+        results[futures[future]] = future.result()
+        # stop once the leading ranges, which are complete, already hold enough pairs
+        found = 0
+        for result in results:
+            if result is None:
+                break
+            found += results_returned(parse_primer3_input_file(result[0])) if result[1] else 0
+            if found >= num_return:
+                break
+        if found >= num_return or all(result is not None for result in results):
+            break
+    # ranges Primer3 would not have reached are no longer needed, stop the running ones
+    stop_primer3_processes(group)
+    executor.shutdown(cancel_futures=True)
+
+    summary = pd.DataFrame([
+        {
+            "Product size range": size_range,
+            "Results": results_returned(parse_primer3_input_file(result[0])) if result and result[1] else None,
+            "Status": "skipped" if result is None else ("ok" if result[1] and "PRIMER_ERROR" not in result[0] else "failed"),
+        }
+        for size_range, result in zip(ranges, results)
+    ])
+
+    usable = []
+    for result in results:
+        if result is None:
+            break
+        if result[1] and "PRIMER_ERROR" not in result[0]:
+            usable.append(result[0])
+    if not usable:
+        # no range worked, show the first failure as Primer3 would
+        first = next(result for result in results if result is not None)
+        return first[0], first[1], summary
+    return merge_product_range_outputs(usable, product_size_range, num_return), True, summary
+
+
+#########################################
+### Regions from an indexed reference ###
+#########################################
+
+# translation table for the reverse complement, including IUPAC codes and lowercase (masked) bases
+COMPLEMENT = str.maketrans("ACGTRYKMBVDHNacgtrykmbvdhn", "TGCAYRMKVBHDNtgcayrmkvbhdn")
+
+# function to get the reverse complement of a sequence
+def reverse_complement(sequence):
+    return sequence.translate(COMPLEMENT)[::-1]
+
+# function to build a samtools style .fai index (name, length, offset, line bases, line width) for a FASTA file
+def build_fasta_index(fasta_path, index_path=None):
+    index_path = index_path or f"{fasta_path}.fai"
+    entries = []
+    with open(fasta_path, "rb") as f:
+        name = None
+        offset = 0
+        for line in f:
+            if line.startswith(b">"):
+                if name is not None:
+                    entries.append((name, length, seq_offset, line_bases, line_width))
+                name = line[1:].split()[0].decode()
+                length = 0
+                seq_offset = offset + len(line)
+                line_bases = line_width = None
+            elif name is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if line_bases is None:
+                    line_bases, line_width = bases, len(line)
+                length += bases
+            offset += len(line)
+        if name is not None:
+            entries.append((name, length, seq_offset, line_bases or 0, line_width or 0))
+    with open(index_path, "w") as f:
+        for entry in entries:
+            f.write("\t".join(map(str, entry)) + "\n")
+    return index_path
+
+# function to open a FASTA file for random access, building the .fai index if it is missing
+def open_indexed_fasta(fasta_path):
+    index_path = f"{fasta_path}.fai"
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(fasta_path):
+        build_fasta_index(fasta_path, index_path)
+    index = {}
+    with open(index_path) as f:
+        for line in f:
+            name, length, offset, line_bases, line_width = line.split("\t")[:5]
+            index[name] = (int(length), int(offset), int(line_bases), int(line_width))
+    with open(fasta_path, "rb") as f:
+        # memory mapped, so only the pages holding the requested regions are read from disk
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return {"path": fasta_path, "index": index, "data": data}
+
+# function to fetch a 0-based, end-exclusive region from an indexed FASTA file
+def fetch_sequence(fasta, chrom, start, end):
+    if chrom not in fasta["index"]:
+        raise KeyError(f"Sequence '{chrom}' not found in {fasta['path']}")
+    length, offset, line_bases, line_width = fasta["index"][chrom]
+    start = max(0, start)
+    end = min(length, end)
+    if end <= start:
+        return ""
+    first = offset + (start // line_bases) * line_width + start % line_bases
+    last = offset + ((end - 1) // line_bases) * line_width + (end - 1) % line_bases
+    raw = fasta["data"][first:last + 1]
+    return raw.replace(b"\n", b"").replace(b"\r", b"").decode("ascii")
+
+# function to read target regions from BED (0-based) or GFF/GTF (1-based) text into 0-based, end-exclusive regions
+def read_regions(file_text, file_format):
+    regions = []
+    for line_number, line in enumerate(file_text.splitlines(), start=1):
+        if not line.strip() or line.startswith(("#", "track", "browser")):
+            continue
+        fields = line.rstrip("\n").split("\t")
+        if file_format == "BED":
+            chrom, start, end = fields[0], int(fields[1]), int(fields[2])
+            name = fields[3] if len(fields) > 3 and fields[3] != "." else f"{chrom}:{start + 1}-{end}"
+            strand = fields[5] if len(fields) > 5 else "+"
+        else:
+            chrom, start, end = fields[0], int(fields[3]) - 1, int(fields[4])
+            strand = fields[6] if len(fields) > 6 else "+"
+            attributes = fields[8] if len(fields) > 8 else ""
+            match = re.search(r'(?:ID|Name|gene_name|transcript_id)[=\s]"?([^";]+)', attributes)
+            name = match.group(1) if match else f"{chrom}:{start + 1}-{end}"
+        regions.append({"name": name, "chrom": chrom, "start": start, "end": end, "strand": strand})
+    return regions
+
+# function to extract each region with flanks and mark the region itself as SEQUENCE_TARGET
+def region_records(fasta, regions, flank, first_base_index=1):
+    records = []
+    for region in regions:
+        chrom_length = fasta["index"][region["chrom"]][0]
+        left_flank = min(flank, region["start"])
+        right_flank = min(flank, chrom_length - region["end"])
+        genomic_start = region["start"] - left_flank
+        sequence = fetch_sequence(fasta, region["chrom"], genomic_start, region["end"] + right_flank)
+        if region["strand"] == "-":
+            # design on the region's own strand
+            sequence = reverse_complement(sequence)
+            left_flank = right_flank
+        records.append({
+            "seq_id": region["name"],
+            "sequence": sequence,
+            "target": f"{left_flank + first_base_index},{region['end'] - region['start']}",
+            "excluded_region": "",
+            "chrom": region["chrom"],
+            "start": genomic_start,
+            "strand": region["strand"],
+        })
+    return records
+
+
+####################
+### Batch design ###
+####################
+
+# record keys that replace the input settings for one sequence of a batch
+RECORD_KEYS = ("seq_id", "sequence", "target", "excluded_region", "left", "right", "internal", "pick_left", "pick_right", "pick_internal")
+
+# function to fill the settings for one batch record, other settings are taken from the given values
+# (a record can bring its own Boulder-IO overrides, e.g. SEQUENCE_OVERLAP_JUNCTION_LIST)
+def fill_record_settings(values, record, overrides=None):
+    # only the general settings are taken from values (often the whole session state), the record brings the rest
+    record_values = dict(zip(TEMPLATE_TAIL_FIELDS, _tail_values(values)))
+    record_values.update((key, values[key]) for key in RECORD_KEYS)
+    record_values.update(target="", excluded_region="", auto_excluded_region="", sequencing=values.get("sequencing", False))
+    record_values.update({key: value for key, value in record.items() if key in RECORD_KEYS})
+    if record.get("overrides"):
+        overrides = {**(overrides or {}), **record["overrides"]}
+    return fill_primer3_settings(record_values, overrides)
+
+# function to design primers for many records (dicts with seq_id, sequence, target, ...) in parallel
+def run_batch_design(values, records, max_workers=DEFAULT_WORKERS, overrides=None, progress=None):
+    settings_list = [fill_record_settings(values, record, overrides) for record in records]
+    results = run_primer3_batch(settings_list, max_workers=max_workers, progress=progress)
+    table = pd.DataFrame([
+        {"Sequence ID": record["seq_id"], "Length": len(clean_sequence(record["sequence"])), **summarize_primer3_output(output, success)}
+        for record, (output, success) in zip(records, results)
+    ])
+    return table, results
+
+
+########################################
+### Exon-junction templates from GTF ###
+########################################
+
+# the annotation index is a small tab separated file next to the GTF, one transcript per line
+GTF_INDEX_COLUMNS = ("transcript_id", "gene_id", "gene_name", "chrom", "strand", "exon_starts", "exon_ends")
+GTF_ATTRIBUTE_PATTERN = re.compile(r'(transcript_id|gene_id|gene_name) "([^"]*)"')
+
+_gtf_index_cache = {}
+_gtf_index_lock = threading.Lock()
+
+# function to build the transcript -> exon interval index of a GTF file (exons 0-based, end-exclusive, sorted)
+def build_gtf_index(gtf_path, index_path=None):
+    index_path = index_path or f"{gtf_path}.p3gidx"
+    transcripts = {}
+    opener = gzip.open if gtf_path.endswith(".gz") else open
+    with opener(gtf_path, "rt") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 9 or fields[2] != "exon":
+                continue
+            attributes = dict(GTF_ATTRIBUTE_PATTERN.findall(fields[8]))
+            if "transcript_id" not in attributes:
+                continue
+            transcript = transcripts.setdefault(attributes["transcript_id"], {
+                "gene_id": attributes.get("gene_id", ""),
+                "gene_name": attributes.get("gene_name", attributes.get("gene_id", "")),
+                "chrom": fields[0],
+                "strand": fields[6],
+                "exons": [],
+            })
+            transcript["exons"].append((int(fields[3]) - 1, int(fields[4])))
+    with open(index_path, "w") as f:
+        for transcript_id, transcript in transcripts.items():
+            exons = sorted(transcript["exons"])
+            f.write("\t".join([
+                transcript_id, transcript["gene_id"], transcript["gene_name"], transcript["chrom"], transcript["strand"],
+                ",".join(str(start) for start, _ in exons), ",".join(str(end) for _, end in exons),
+            ]) + "\n")
+    return index_path
+
+# function to load the annotation index of a GTF file, building it if it is missing and keeping it in memory
+def open_gtf_index(gtf_path):
+    index_path = f"{gtf_path}.p3gidx"
+    with _gtf_index_lock:
+        if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(gtf_path):
+            build_gtf_index(gtf_path, index_path)
+        key = (index_path, os.path.getmtime(index_path))
+        if key not in _gtf_index_cache:
+            transcripts = {}
+            genes = {}
+            with open(index_path) as f:
+                for line in f:
+                    transcript_id, gene_id, gene_name, chrom, strand, starts, ends = line.rstrip("\n").split("\t")
+                    transcripts[transcript_id] = {
+                        "gene_id": gene_id,
+                        "gene_name": gene_name,
+                        "chrom": chrom,
+                        "strand": strand,
+                        "starts": np.array(starts.split(","), dtype=np.int64),
+                        "ends": np.array(ends.split(","), dtype=np.int64),
+                    }
+                    # transcripts can be looked up by gene name or gene id as well
+                    for name in {gene_id, gene_name}:
+                        genes.setdefault(name, []).append(transcript_id)
+            _gtf_index_cache.clear()
+            _gtf_index_cache[key] = {"path": gtf_path, "transcripts": transcripts, "genes": genes}
+        return _gtf_index_cache[key]
+
+# function to resolve gene names, gene ids and transcript ids (whitespace or comma separated) to transcript ids
+def select_transcripts(gtf_index, names_text):
+    transcript_ids = []
+    missing = []
+    for name in re.split(r"[\s,;]+", names_text.strip()):
+        if not name:
+            continue
+        if name in gtf_index["transcripts"]:
+            found = [name]
+        else:
+            found = gtf_index["genes"].get(name, [])
+        if not found:
+            missing.append(name)
+        transcript_ids.extend(found)
+    return list(dict.fromkeys(transcript_ids)), missing
+
+# function to build spliced mRNA templates with SEQUENCE_OVERLAP_JUNCTION_LIST for the given transcripts
+def junction_records(fasta, gtf_index, transcript_ids, first_base_index=1):
+    records = []
+    single_exon = []
+    for transcript_id in transcript_ids:
+        transcript = gtf_index["transcripts"][transcript_id]
+        if len(transcript["starts"]) < 2:
+            single_exon.append(transcript_id)
+            continue
+        exons = [fetch_sequence(fasta, transcript["chrom"], start, end) for start, end in zip(transcript["starts"], transcript["ends"])]
+        lengths = transcript["ends"] - transcript["starts"]
+        if transcript["strand"] == "-":
+            exons = [reverse_complement(exon) for exon in reversed(exons)]
+            lengths = lengths[::-1]
+        # Primer3 expects the position of the base left of each junction
+        junctions = np.cumsum(lengths)[:-1] - 1 + first_base_index
+        records.append({
+            "seq_id": f"{transcript['gene_name']}|{transcript_id}",
+            "sequence": "".join(exons),
+            "target": "",
+            "excluded_region": "",
+            "chrom": transcript["chrom"],
+            "start": int(transcript["starts"][0]),
+            "strand": transcript["strand"],
+            "junctions": len(junctions),
+            "overrides": {"SEQUENCE_OVERLAP_JUNCTION_LIST": " ".join(str(position) for position in junctions)},
+        })
+    return records, single_exon
+
+
+#################################
+### Sequencing primer walking ###
+#################################
+
+# function to split a long template into chunks, the chunk targets tile the template on the spacing grid
+# and each chunk carries enough context around its target for the primers of its first and last reads
+def sequencing_chunks(sequence, chunk_size, spacing, context):
+    chunk_size = max(spacing, chunk_size // spacing * spacing)
+    chunks = []
+    for core_start in range(0, len(sequence), chunk_size):
+        core_end = min(core_start + chunk_size, len(sequence))
+        start = max(0, core_start - context)
+        end = min(len(sequence), core_end + context)
+        chunks.append({"start": start, "sequence": sequence[start:end], "target": (core_start - start, core_end - core_start)})
+    return chunks
+
+# function to design sequencing primers for a long template, chunks are designed in parallel and stitched
+# back into one tiling in template coordinates
+def run_sequencing_walk(values, chunk_size=5000, lead=50, spacing=500, interval=250, accuracy=20,
+                        forward=True, reverse=True, max_workers=DEFAULT_WORKERS, progress=None):
+    sequence = clean_sequence(values["sequence"])
+    first_base_index = values["primer_first_base_index"]
+    context = lead + accuracy + spacing
+    chunks = sequencing_chunks(sequence, chunk_size, spacing, context)
+    chunk_values = {
+        **values, "sequencing": True, "pick_left": forward, "pick_right": reverse, "pick_internal": False,
+        "left": "", "right": "", "internal": "",
+    }
+    overrides = {
+        "PRIMER_PICK_LEFT_PRIMER": int(forward),
+        "PRIMER_PICK_RIGHT_PRIMER": int(reverse),
+        "PRIMER_PICK_INTERNAL_OLIGO": 0,
+        "PRIMER_SEQUENCING_LEAD": lead,
+        "PRIMER_SEQUENCING_SPACING": spacing,
+        "PRIMER_SEQUENCING_INTERVAL": interval,
+        "PRIMER_SEQUENCING_ACCURACY": accuracy,
+    }
+    settings_list = []
+    for chunk in chunks:
+        target_start, target_length = chunk["target"]
+        record = {
+            "seq_id": f"{values['seq_id']}_{chunk['start'] + target_start + 1}-{chunk['start'] + target_start + target_length}",
+            "sequence": chunk["sequence"],
+            "target": f"{target_start + first_base_index},{target_length}",
+        }
+        settings_list.append(fill_record_settings(chunk_values, record, overrides))
+    results = run_primer3_batch(settings_list, max_workers=max_workers, progress=progress)
+
+    primers = {}
+    chunk_rows = []
+    for number, (chunk, (output, success)) in enumerate(zip(chunks, results), start=1):
+        parsed = parse_primer3_input_file(output) if success else {}
+        table = primer3_results_table(parsed)
+        for oligo, strand in (("left", "+"), ("right", "-")):
+            if f"{oligo}_start" not in table:
+                continue
+            for row in table.dropna(subset=[f"{oligo}_start"]).itertuples():
+                row = row._asdict()
+                # Primer3 gives the 5' end of each oligo, the right primer's 5' end is its rightmost base
+                five_prime = chunk["start"] + int(row[f"{oligo}_start"]) - first_base_index
+                length = int(row[f"{oligo}_len"])
+                three_prime = five_prime + length - 1 if strand == "+" else five_prime - length + 1
+                # neighbouring chunks share their context, so the same primer can be found twice
+                primers.setdefault((strand, five_prime, length), {
+                    "Strand": strand,
+                    "5' position": five_prime + first_base_index,
+                    "3' position": three_prime + first_base_index,
+                    "Length": length,
+                    "Sequence": row.get(f"{oligo}_sequence"),
+                    "Tm": row.get(f"{oligo}_tm"),
+                    "GC %": row.get(f"{oligo}_gc_percent"),
+                    "Penalty": row.get(f"{oligo}_penalty"),
+                    "Chunk": number,
+                })
+        chunk_rows.append({
+            "Chunk": number,
+            "Target": f"{chunk['start'] + chunk['target'][0] + 1}-{chunk['start'] + sum(chunk['target'])}",
+            "Forward primers": int(parsed.get("PRIMER_LEFT_NUM_RETURNED", 0) or 0),
+            "Reverse primers": int(parsed.get("PRIMER_RIGHT_NUM_RETURNED", 0) or 0),
+            "Error": parsed.get("PRIMER_ERROR", "") if success else output.strip(),
+        })
+
+    primer_table = pd.DataFrame(list(primers.values()), columns=[
+        "Name", "Strand", "5' position", "3' position", "Length", "Sequence", "Tm", "GC %", "Penalty", "Chunk",
+    ])
+    primer_table = primer_table.sort_values(["Strand", "5' position"]).reset_index(drop=True)
+    primer_table["Name"] = [
+        f"{'F' if strand == '+' else 'R'}{number}"
+        for strand, number in zip(primer_table["Strand"], primer_table.groupby("Strand").cumcount() + 1)
+    ]
+    return primer_table, pd.DataFrame(chunk_rows), len(sequence)
+
+# function to get the read depth along the template for each strand, reads start lead bases after the primer's 3' end
+def sequencing_coverage(primer_table, template_length, read_length=800, lead=50, first_base_index=1):
+    depth = {}
+    for strand in ("+", "-"):
+        three_prime = primer_table.loc[primer_table["Strand"] == strand, "3' position"].to_numpy(dtype=np.int64) - first_base_index
+        if strand == "+":
+            starts, ends = three_prime + lead, three_prime + read_length
+        else:
+            starts, ends = three_prime - read_length + 1, three_prime - lead + 1
+        starts = np.clip(starts, 0, template_length)
+        ends = np.clip(ends, 0, template_length)
+        steps = np.zeros(template_length + 1, dtype=np.int64)
+        np.add.at(steps, starts, 1)
+        np.add.at(steps, ends, -1)
+        depth[strand] = np.cumsum(steps)[:-1]
+    return depth
+
+# function to list the template regions (1-based, inclusive) that are not covered by any read
+def coverage_gaps(depth, first_base_index=1):
+    covered = np.concatenate(([True], (depth["+"] + depth["-"]) > 0, [True]))
+    changes = np.flatnonzero(covered[1:] != covered[:-1])
+    return [(start + first_base_index, end - 1 + first_base_index) for start, end in zip(changes[::2], changes[1::2])]
+
+# function to draw the read depth as a compact text map, one character per bin (lowest depth in the bin)
+def coverage_map_text(depth, width=100, first_base_index=1):
+    template_length = len(depth["+"])
+    bins = np.array_split(np.arange(template_length), min(width, template_length))
+    symbols = ".123456789"
+    lines = []
+    for label, values in (("Forward ", depth["+"]), ("Reverse ", depth["-"]), ("Combined", depth["+"] + depth["-"])):
+        lowest = [int(values[indices].min()) for indices in bins]
+        lines.append(f"{label} |" + "".join(symbols[min(value, 9)] if value < 10 else "+" for value in lowest) + "|")
+    ruler_end = str(template_length - 1 + first_base_index)
+    lines.append(" " * 10 + str(first_base_index).ljust(len(bins) - len(ruler_end)) + ruler_end)
+    return "\n".join(lines)
+
+
+#########################
+### Bulk primer check ###
+#########################
+
+# accepted column names of a primer inventory table, first name is the one used internally
+INVENTORY_COLUMNS = {
+    "name": ("name", "id", "primer_id", "assay", "seq_id"),
+    "left": ("left", "forward", "fwd", "left_primer", "forward_primer"),
+    "right": ("right", "reverse", "rev", "right_primer", "reverse_primer"),
+    "internal": ("internal", "probe", "internal_oligo"),
+    "template": ("template", "template_id", "sequence", "amplicon"),
+}
+
+# function to read FASTA text into a dict of id -> sequence
+def parse_fasta_text(fasta_text):
+    sequences = {}
+    name = None
+    for line in fasta_text.splitlines():
+        if line.startswith(">"):
+            name = line[1:].split()[0] if line[1:].strip() else f"sequence_{len(sequences) + 1}"
+            sequences[name] = []
+        elif name is not None:
+            sequences[name].append(line.strip())
+    return {name: "".join(parts) for name, parts in sequences.items()}
+
+# function to bring an inventory table to the columns name, left, right, internal, template
+def normalize_inventory(table):
+    lookup = {str(column).strip().lower().replace(" ", "_"): column for column in table.columns}
+    inventory = pd.DataFrame(index=table.index)
+    for key, names in INVENTORY_COLUMNS.items():
+        column = next((lookup[name] for name in names if name in lookup), None)
+        inventory[key] = table[column].fillna("").astype(str).str.strip() if column is not None else ""
+    inventory["name"] = [name or f"pair_{i + 1}" for i, name in enumerate(inventory["name"])]
+    return inventory.reset_index(drop=True)
+
+# function to list template ids of the inventory that are neither in the templates nor a sequence themselves
+def missing_templates(inventory, templates):
+    return sorted({
+        template for template in inventory["template"]
+        if template and template not in templates and not re.fullmatch(r"[ACGTNRYKMSWBDHVacgtnrykmswbdhv]+", template)
+    })
+
+# function to turn inventory rows into check_primers records, templates are looked up by id or given inline
+def check_records(inventory, templates=None):
+    templates = templates or {}
+    records = []
+    for row in inventory.itertuples(index=False):
+        records.append({
+            "seq_id": row.name,
+            "sequence": templates.get(row.template, row.template),
+            "left": row.left,
+            "right": row.right,
+            "internal": row.internal,
+            "pick_left": False,
+            "pick_right": False,
+            "pick_internal": False,
+        })
+    return records
+
+# function to collect the values, warnings and problems of one check_primers output into a table row
+def summarize_check_output(output, success):
+    if not success:
+        return {"Status": "failed", "Error": output.strip()}
+    parsed = parse_primer3_input_file(output)
+    table = primer3_results_table(parsed)
+    row = table.iloc[0].to_dict() if len(table) else {}
+    summary = {}
+    for oligo, label in (("left", "Left"), ("right", "Right"), ("internal", "Probe")):
+        summary[f"{label} Tm"] = row.get(f"{oligo}_tm")
+        summary[f"{label} GC %"] = row.get(f"{oligo}_gc_percent")
+        summary[f"{label} self any"] = row.get(f"{oligo}_self_any", row.get(f"{oligo}_self_any_th"))
+        summary[f"{label} self end"] = row.get(f"{oligo}_self_end", row.get(f"{oligo}_self_end_th"))
+    summary["Pair compl any"] = row.get("pair_compl_any", row.get("pair_compl_any_th"))
+    summary["Pair compl end"] = row.get("pair_compl_end", row.get("pair_compl_end_th"))
+    summary["Product size"] = row.get("pair_product_size")
+    summary["Warnings"] = parsed.get("PRIMER_WARNING", "")
+    summary["Problems"] = "; ".join(
+        f"{label}: {row[f'{oligo}_problems']}"
+        for oligo, label in (("left", "Left"), ("right", "Right"), ("internal", "Probe"))
+        if isinstance(row.get(f"{oligo}_problems"), str) and row[f"{oligo}_problems"]
+    )
+    summary["Error"] = parsed.get("PRIMER_ERROR", "")
+    if summary["Error"]:
+        summary["Status"] = "failed"
+    elif summary["Problems"] or summary["Warnings"]:
+        summary["Status"] = "problems"
+    else:
+        summary["Status"] = "ok"
+    return summary
+
+# function to check many existing primer pairs with Primer3's check_primers task in parallel
+def run_primer_check(values, inventory, templates=None, max_workers=DEFAULT_WORKERS, progress=None):
+    templates = templates or {}
+    records = check_records(inventory, templates)
+    # the template's PRIMER_PICK_ANYWAY=1 makes Primer3 report values and problems for oligos that break the constraints
+    overrides = {"PRIMER_TASK": "check_primers"}
+    settings_list = [fill_record_settings(values, record, overrides) for record in records]
+    results = run_primer3_batch(settings_list, max_workers=max_workers, progress=progress)
+    table = pd.DataFrame([
+        {
+            "Name": row.name,
+            "Template": row.template if row.template in templates or not row.template else f"{len(row.template)} bp",
+            "Left": row.left, "Right": row.right, "Probe": row.internal,
+            **summarize_check_output(output, success),
+        }
+        for row, (output, success) in zip(inventory.itertuples(index=False), results)
+    ])
+    status = table.pop("Status")
+    table.insert(1, "Status", status)
+    return table, results, records
+
+
+##############################
+### Oligo binding locator ###
+##############################
+
+# IUPAC codes as 4 bit masks (A=1, C=2, G=4, T=8), two bases match when their masks share a bit
+IUPAC_CODES = {"A": 1, "C": 2, "G": 4, "T": 8, "U": 8, "R": 5, "Y": 10, "S": 6, "W": 9, "K": 12,
+               "M": 3, "B": 14, "D": 13, "H": 11, "V": 7, "N": 15}
+IUPAC_MASKS = np.zeros(256, dtype=np.uint8)
+for code, mask in IUPAC_CODES.items():
+    IUPAC_MASKS[ord(code)] = IUPAC_MASKS[ord(code.lower())] = mask
+
+# number of bases at the 3' end that are reported separately, mismatches there hurt extension most
+THREE_PRIME_BASES = 5
+
+# function to encode a sequence as IUPAC masks
+def encode_iupac(sequence):
+    return IUPAC_MASKS[np.frombuffer(sequence.encode("ascii", "replace"), dtype=np.uint8)]
+
+# function to count the mismatches of an oligo at every template position, one vectorized pass per oligo base
+def mismatch_counts(template_masks, oligo_masks):
+    windows = len(template_masks) - len(oligo_masks) + 1
+    counts = np.zeros(max(windows, 0), dtype=np.uint16)
+    if windows <= 0:
+        return counts
+    for offset, mask in enumerate(oligo_masks):
+        counts += (template_masks[offset:offset + windows] & mask) == 0
+    return counts
+
+# function to find the binding sites of one oligo with up to max_mismatches on both strands (0-based starts)
+def locate_oligo(template_masks, oligo, max_mismatches=2, max_hits=50):
+    hits = []
+    for strand, site in (("+", oligo), ("-", reverse_complement(oligo))):
+        site_masks = encode_iupac(site)
+        counts = mismatch_counts(template_masks, site_masks)
+        for start in np.flatnonzero(counts <= max_mismatches):
+            mismatched = (template_masks[start:start + len(site_masks)] & site_masks) == 0
+            # on the minus strand the oligo's 3' end is the leftmost base of the site
+            three_prime = mismatched[-THREE_PRIME_BASES:] if strand == "+" else mismatched[:THREE_PRIME_BASES]
+            hits.append({"Strand": strand, "start": int(start), "Mismatches": int(counts[start]), "3' end mismatches": int(three_prime.sum())})
+    hits.sort(key=lambda hit: (hit["Mismatches"], hit["3' end mismatches"], hit["start"]))
+    return hits[:max_hits], len(hits)
+
+# function to locate the given oligos (label -> sequence) on a template before running Primer3
+def locate_oligos(sequence, oligos, max_mismatches=2, first_base_index=1, max_hits=50):
+    template = re.sub(r"[^A-Za-z]", "", clean_sequence(sequence))
+    template_masks = encode_iupac(template)
+    rows = []
+    totals = {}
+    for label, oligo in oligos.items():
+        oligo = re.sub(r"\s", "", oligo)
+        if not oligo:
+            continue
+        hits, totals[label] = locate_oligo(template_masks, oligo, max_mismatches, max_hits)
+        for hit in hits:
+            rows.append({
+                "Oligo": label,
+                "Strand": hit["Strand"],
+                "Start": hit["start"] + first_base_index,
+                "End": hit["start"] + len(oligo) - 1 + first_base_index,
+                "Mismatches": hit["Mismatches"],
+                "3' end mismatches": hit["3' end mismatches"],
+                "Template": template[hit["start"]:hit["start"] + len(oligo)],
+            })
+    columns = ["Oligo", "Strand", "Start", "End", "Mismatches", "3' end mismatches", "Template"]
+    return pd.DataFrame(rows, columns=columns), totals
+
+
+##############################
+### Stock primer inventory ###
+##############################
+
+# shortest stock primer that is searched for, shorter oligos give too many random hits
+MIN_STOCK_PRIMER_LENGTH = 12
+
+_automaton_cache = {}
+_automaton_lock = threading.Lock()
+
+# function to read the stock primers (name, sequence) of an inventory table, either from a sequence column
+# or from the left/right/internal columns of a primer pair table
+def read_stock_primers(table):
+    lookup = {str(column).strip().lower().replace(" ", "_"): column for column in table.columns}
+    sequence_column = next((lookup[name] for name in ("oligo", "primer", "primer_sequence", "sequence") if name in lookup), None)
+    name_column = next((lookup[name] for name in INVENTORY_COLUMNS["name"] if name in lookup), None)
+    stock = []
+    if sequence_column is not None:
+        for i, row in table.iterrows():
+            name = str(row[name_column]).strip() if name_column is not None and pd.notna(row[name_column]) else f"stock_{i + 1}"
+            stock.append((name, str(row[sequence_column])))
+    else:
+        inventory = normalize_inventory(table)
+        for row in inventory.itertuples(index=False):
+            for column, suffix in (("left", "F"), ("right", "R"), ("internal", "P")):
+                stock.append((f"{row.name}_{suffix}", getattr(row, column)))
+    stock = [(name, re.sub(r"[^ACGTN]", "", sequence.upper())) for name, sequence in stock]
+    return [(name, sequence) for name, sequence in stock if len(sequence) >= MIN_STOCK_PRIMER_LENGTH]
+
+# function to build an Aho-Corasick automaton over the stock primers and their reverse complements,
+# a primer found as itself can be used as forward primer, one found as reverse complement as reverse primer
+def build_primer_automaton(stock):
+    patterns = [(name, sequence, "+") for name, sequence in stock] + [(name, sequence, "-") for name, sequence in stock]
+    goto = [{}]
+    fail = [0]
+    output = [[]]
+    for pattern_id, (_, sequence, strand) in enumerate(patterns):
+        node = 0
+        for base in sequence if strand == "+" else reverse_complement(sequence):
+            if base not in goto[node]:
+                goto[node][base] = len(goto)
+                goto.append({})
+                fail.append(0)
+                output.append([])
+            node = goto[node][base]
+        output[node].append(pattern_id)
+    # breadth first, so the failure link of every parent is known before its children
+    queue = deque(goto[0].values())
+    while queue:
+        node = queue.popleft()
+        for base, child in goto[node].items():
+            queue.append(child)
+            state = fail[node]
+            while state and base not in goto[state]:
+                state = fail[state]
+            fail[child] = goto[state].get(base, 0) if node else 0
+            output[child] = output[child] + output[fail[child]]
+    return {"goto": goto, "fail": fail, "output": output, "patterns": patterns}
+
+# function to get the automaton of a stock list, built once per inventory
+def primer_automaton(stock):
+    key = hashlib.sha1(repr(stock).encode()).hexdigest()
+    with _automaton_lock:
+        if key not in _automaton_cache:
+            _automaton_cache.clear()
+            _automaton_cache[key] = build_primer_automaton(stock)
+        return _automaton_cache[key]
+
+# function to find all stock primers in a template in one pass, returns (0-based start, pattern) tuples
+def scan_stock_primers(automaton, template):
+    goto, fail, output, patterns = automaton["goto"], automaton["fail"], automaton["output"], automaton["patterns"]
+    hits = []
+    node = 0
+    for position, base in enumerate(template.upper()):
+        while node and base not in goto[node]:
+            node = fail[node]
+        node = goto[node].get(base, 0)
+        for pattern_id in output[node]:
+            hits.append((position - len(patterns[pattern_id][1]) + 1, patterns[pattern_id]))
+    return hits
+
+# function to build the design records for the stock primer hits of each template: the stock primer is fixed as
+# SEQUENCE_PRIMER or SEQUENCE_PRIMER_REVCOMP and Primer3 picks its partner, two stock primers that give a product
+# in the product size range are also checked as a pair
+def stock_primer_records(values, templates, automaton, max_hits=50):
+    ranges = [tuple(map(int, r.split("-"))) for r in values["product_size_range"].split() if "-" in r]
+    records = []
+    for template_id, template in templates.items():
+        template = clean_sequence(template)
+        hits = scan_stock_primers(automaton, template)
+        forward = [(start, name, sequence) for start, (name, sequence, strand) in hits if strand == "+"][:max_hits]
+        reverse = [(start, name, sequence) for start, (name, sequence, strand) in hits if strand == "-"][:max_hits]
+        base = {"sequence": template, "target": values["target"] if template_id == values["seq_id"] else "", "internal": "", "pick_internal": values["pick_internal"]}
+        for start, name, sequence in forward:
+            records.append({**base, "seq_id": f"{template_id}|{name}", "template_id": template_id, "stock": name, "stock_position": f"{start + 1} (+)",
+                            "left": sequence, "pick_left": False, "right": "", "pick_right": True})
+        for start, name, sequence in reverse:
+            records.append({**base, "seq_id": f"{template_id}|{name}", "template_id": template_id, "stock": name, "stock_position": f"{start + 1} (-)",
+                            "left": "", "pick_left": True, "right": sequence, "pick_right": False})
+        for left_start, left_name, left_sequence in forward:
+            for right_start, right_name, right_sequence in reverse:
+                product_size = right_start + len(right_sequence) - left_start
+                if any(low <= product_size <= high for low, high in ranges):
+                    records.append({**base, "seq_id": f"{template_id}|{left_name}+{right_name}", "template_id": template_id,
+                                    "stock": f"{left_name} + {right_name}", "stock_position": f"{left_start + 1} (+), {right_start + 1} (-)",
+                                    "left": left_sequence, "pick_left": False, "right": right_sequence, "pick_right": False})
+    return records
+
+
+################################
+### Sequence complexity scan ###
+################################
+
+# default thresholds of the complexity scan
+COMPLEXITY_DEFAULTS = {
+    "window": 50,
+    "gc_min": 20.0,
+    "gc_max": 80.0,
+    "homopolymer": 7,
+    "dust_window": 64,
+    "dust_threshold": 2.5,
+    "dinucleotide_repeats": 5,
+    "merge_gap": 10,
+}
+
+# function to get the (start, end) intervals where a boolean mask is True
+def mask_intervals(mask):
+    padded = np.concatenate(([False], mask, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(changes[::2].tolist(), changes[1::2].tolist()))
+
+# function to mark the bases covered by the given windows/runs (start, end arrays) in a mask
+def _cover(length, starts, ends):
+    steps = np.zeros(length + 1, dtype=np.int32)
+    np.add.at(steps, starts, 1)
+    np.add.at(steps, ends, -1)
+    return np.cumsum(steps)[:-1] > 0
+
+# function to flag low complexity and extreme GC regions of a template, all scans are vectorized over the whole template
+def complexity_masks(sequence, window=50, gc_min=20.0, gc_max=80.0, homopolymer=7, dust_window=64,
+                     dust_threshold=2.5, dinucleotide_repeats=5):
+    bases = np.frombuffer(clean_sequence(sequence).upper().encode("ascii", "replace"), dtype=np.uint8)
+    length = len(bases)
+    masks = {}
+
+    # GC% of every window from a prefix sum
+    gc = np.concatenate(([0], np.cumsum((bases == ord("G")) | (bases == ord("C")))))
+    if length >= window:
+        gc_percent = (gc[window:] - gc[:-window]) * 100.0 / window
+        flagged = np.flatnonzero((gc_percent < gc_min) | (gc_percent > gc_max))
+        masks["GC"] = _cover(length, flagged, flagged + window)
+    else:
+        masks["GC"] = np.zeros(length, dtype=bool)
+
+    # homopolymer runs from the positions where the base changes
+    run_starts = np.flatnonzero(np.concatenate(([True], bases[1:] != bases[:-1])))
+    run_ends = np.append(run_starts[1:], length)
+    long_runs = (run_ends - run_starts) >= homopolymer
+    masks["Homopolymer"] = _cover(length, run_starts[long_runs], run_ends[long_runs])
+
+    # DUST: triplet repetitiveness of half-overlapping windows, score = sum c(c-1)/2 / (triplets - 1)
+    codes = np.full(256, 255, dtype=np.uint8)
+    codes[[ord("A"), ord("C"), ord("G"), ord("T")]] = [0, 1, 2, 3]
+    encoded = codes[bases].astype(np.int32)
+    masks["Low complexity"] = np.zeros(length, dtype=bool)
+    if length >= dust_window:
+        triplets = encoded[:-2] * 16 + encoded[1:-1] * 4 + encoded[2:]
+        valid = (encoded[:-2] < 4) & (encoded[1:-1] < 4) & (encoded[2:] < 4)
+        step = dust_window // 2
+        starts = np.arange(0, length - dust_window + 1, step)
+        if starts[-1] != length - dust_window:
+            starts = np.append(starts, length - dust_window)
+        offsets = starts[:, None] + np.arange(dust_window - 2)
+        window_ids = np.broadcast_to(np.arange(len(starts))[:, None], offsets.shape)
+        keep = valid[offsets]
+        counts = np.bincount(window_ids[keep] * 64 + triplets[offsets][keep], minlength=len(starts) * 64).reshape(len(starts), 64)
+        scores = (counts * (counts - 1) // 2).sum(axis=1) / (dust_window - 3)
+        flagged = starts[scores > dust_threshold]
+        masks["Low complexity"] = _cover(length, flagged, flagged + dust_window)
+
+    # dinucleotide repeats: stretches where every base equals the base two positions before (and is not a homopolymer)
+    masks["Dinucleotide repeat"] = np.zeros(length, dtype=bool)
+    if length > 2:
+        periodic = (bases[2:] == bases[:-2]) & (bases[1:-1] != bases[:-2])
+        intervals = np.array(mask_intervals(periodic), dtype=np.int64).reshape(-1, 2)
+        repeats = intervals[(intervals[:, 1] - intervals[:, 0] + 2) >= 2 * dinucleotide_repeats]
+        masks["Dinucleotide repeat"] = _cover(length, repeats[:, 0], repeats[:, 1] + 2)
+    return masks
+
+# function to merge the flagged bases into excluded regions, regions closer than merge_gap are joined
+def complexity_regions(masks, merge_gap=10, first_base_index=1):
+    combined = np.logical_or.reduce(list(masks.values()))
+    merged = []
+    for start, end in mask_intervals(combined):
+        if merged and start - merged[-1][1] <= merge_gap:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return pd.DataFrame([
+        {
+            "Start": start + first_base_index,
+            "Length": end - start,
+            "Reason": ", ".join(reason for reason, mask in masks.items() if mask[start:end].any()),
+        }
+        for start, end in merged
+    ], columns=["Start", "Length", "Reason"])
+
+# function to drop the regions that overlap a target ("start,length" pairs), Primer3 does not accept those
+def drop_target_overlaps(regions, target):
+    targets = [tuple(map(int, pair.split(","))) for pair in target.split() if "," in pair]
+    keep = [
+        not any(start < target_start + target_length and target_start < start + length for target_start, target_length in targets)
+        for start, length in zip(regions["Start"], regions["Length"])
+    ]
+    return regions[keep].reset_index(drop=True)
+
+# function to write excluded regions as the EXCLUDED_REGION value (start,length pairs)
+def excluded_region_string(regions):
+    return " ".join(f"{start},{length}" for start, length in zip(regions["Start"], regions["Length"]))
+
+
+##############################
+### Template hairpin scan ###
+##############################
+
+# ntthal (and primer3-py, which wraps the same code) aligns at most 60 bases of a single oligo
+HAIRPIN_MAX_WINDOW = 60
+DG_PATTERN = re.compile(r"dG\s*=\s*(-?[\d.]+)")
+
+_hairpin_cache = {}
+_hairpin_lock = threading.Lock()
+
+# function to get the hairpin dG (kcal/mol) of one window with ntthal, 0 when no structure is formed
+def ntthal_hairpin_dg(sequence, conditions):
+    result = subprocess.run(
+        ["ntthal", "-a", "HAIRPIN", "-s1", sequence,
+         "-t", str(conditions["temperature"]), "-mv", str(conditions["mv"]), "-dv", str(conditions["dv"]),
+         "-n", str(conditions["dntp"]), "-d", str(conditions["dna"])],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "ntthal failed")
+    match = DG_PATTERN.search(result.stdout)
+    return min(0.0, float(match.group(1)) / 1000) if match else 0.0
+
+# function to get the hairpin dG (kcal/mol) of one window in-process with primer3-py, 0 when no structure is formed
+def primer3_hairpin_dg(sequence, conditions):
+    try:
+        result = primer3.calc_hairpin(
+            sequence, mv_conc=conditions["mv"], dv_conc=conditions["dv"], dntp_conc=conditions["dntp"],
+            dna_conc=conditions["dna"], temp_c=conditions["temperature"]
+        )
+    except (OSError, ValueError) as e:
+        raise RuntimeError(str(e)) from e
+    return min(0.0, result.dg / 1000) if result.structure_found else 0.0
+
+# function to pick the hairpin dG function, in-process when primer3-py is installed
+def default_hairpin_dg():
+    return primer3_hairpin_dg if primer3 is not None else ntthal_hairpin_dg
+
+# function to build the cache key of a hairpin scan
+def hairpin_scan_key(template, window, step, conditions, dg_function):
+    return settings_hash(f"{template}|{window}|{step}|{sorted(conditions.items())}|{dg_function.__module__}.{dg_function.__qualname__}")
+
+# function to reduce the window dGs to one dG per base: the most stable structure of all windows covering the base
+def hairpin_per_position(starts, window, dg, length):
+    per_position = np.zeros(length)
+    if len(starts):
+        positions = (np.asarray(starts)[:, None] + np.arange(window)).ravel()
+        np.minimum.at(per_position, positions, np.repeat(np.asarray(dg, dtype=float), window))
+    return per_position
+
+# function to scan the hairpin dG of sliding windows over a template, in-process with primer3-py or with ntthal
+# processes split into chunks that run in parallel, results are cached per template, conditions and dG function
+def hairpin_scan(sequence, values, window=40, step=5, temperature=60.0, max_workers=DEFAULT_WORKERS, dg_function=None):
+    dg_function = dg_function or default_hairpin_dg()
+    template = clean_sequence(sequence).upper()
+    window = min(window, HAIRPIN_MAX_WINDOW, len(template))
+    conditions = {
+        "temperature": temperature,
+        "mv": values["primer_salt_conc_monocat"],
+        "dv": values["primer_salt_conc_divcat"],
+        "dntp": values["primer_dntp_conc"],
+        "dna": values["annealing_oligo_conc"],
+    }
+    key = hairpin_scan_key(template, window, step, conditions, dg_function)
+    with _hairpin_lock:
+        if key in _hairpin_cache:
+            return _hairpin_cache[key]
+
+    starts = np.arange(0, max(len(template) - window, 0) + 1, step)
+    if len(starts) and starts[-1] != len(template) - window:
+        starts = np.append(starts, len(template) - window)
+
+    def scan_chunk(chunk):
+        return [dg_function(template[start:start + window], conditions) for start in chunk]
+
+    if dg_function is ntthal_hairpin_dg:
+        # one process per window, so the windows run in parallel chunks
+        chunks = np.array_split(starts, max(1, min(len(starts), max_workers * 4)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            dg = np.array([value for chunk_dg in executor.map(scan_chunk, chunks) for value in chunk_dg], dtype=float)
+    else:
+        dg = np.array(scan_chunk(starts), dtype=float)
+
+    per_position = hairpin_per_position(starts, window, dg, len(template))
+    scan = {"starts": starts, "window": window, "dg": dg, "per_position": per_position}
+    with _hairpin_lock:
+        _hairpin_cache[key] = scan
+        while len(_hairpin_cache) > 20:
+            _hairpin_cache.pop(next(iter(_hairpin_cache)))
+    return scan
+
+# function to turn the bases below a dG threshold into excluded regions
+def hairpin_regions(scan, threshold=-4.0, merge_gap=10, first_base_index=1):
+    return complexity_regions({"Hairpin": scan["per_position"] <= threshold}, merge_gap, first_base_index)
+
+# function to draw the per-position hairpin dG as one overlay character per base for the binding site view
+def hairpin_overlay(scan, threshold=-4.0):
+    per_position = scan["per_position"]
+    levels = np.where(per_position <= threshold, "#", np.where(per_position <= threshold / 2, "~", " "))
+    return "".join(levels)
+
+
+#############################
+### Variant-aware design ###
+#############################
+
+AF_PATTERN = re.compile(r"(?:^|;)AF=([^;]+)")
+
+_vcf_index_cache = {}
+_vcf_index_lock = threading.Lock()
+
+# function to get the highest allele frequency of a VCF INFO field, NaN when it is not given
+def _allele_frequency(info):
+    match = AF_PATTERN.search(info)
+    if not match:
+        return np.nan
+    values = [float(value) for value in match.group(1).split(",") if value not in ("", ".")]
+    return max(values) if values else np.nan
+
+# function to build a compact position index (sorted per chromosome) of a plain or bgzipped VCF file
+def build_vcf_index(vcf_path, index_path=None):
+    index_path = index_path or f"{vcf_path}.p3gvcf.npz"
+    variants = {}
+    opener = gzip.open if vcf_path.endswith((".gz", ".bgz")) else open
+    with opener(vcf_path, "rt") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t", 8)
+            if len(fields) < 5:
+                continue
+            starts, lengths, frequencies = variants.setdefault(fields[0], ([], [], []))
+            starts.append(int(fields[1]) - 1)
+            lengths.append(len(fields[3]))
+            frequencies.append(_allele_frequency(fields[7]) if len(fields) > 7 else np.nan)
+    chroms = sorted(variants)
+    arrays = {"starts": [], "lengths": [], "af": []}
+    offsets = [0]
+    for chrom in chroms:
+        starts, lengths, frequencies = (np.array(values) for values in variants[chrom])
+        order = np.argsort(starts, kind="stable")
+        arrays["starts"].append(starts[order].astype(np.int64))
+        arrays["lengths"].append(lengths[order].astype(np.int32))
+        arrays["af"].append(frequencies[order].astype(np.float32))
+        offsets.append(offsets[-1] + len(starts))
+    with open(index_path, "wb") as f:
+        np.savez(
+            f, chroms=np.array(chroms, dtype=str), offsets=np.array(offsets, dtype=np.int64),
+            **{name: np.concatenate(values) if values else np.zeros(0) for name, values in arrays.items()}
+        )
+    return index_path
+
+# function to load the position index of a VCF file, building it if it is missing and keeping it in memory
+def open_vcf_index(vcf_path):
+    index_path = f"{vcf_path}.p3gvcf.npz"
+    with _vcf_index_lock:
+        if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(vcf_path):
+            build_vcf_index(vcf_path, index_path)
+        key = (index_path, os.path.getmtime(index_path))
+        if key not in _vcf_index_cache:
+            data = np.load(index_path)
+            index = {}
+            for i, chrom in enumerate(data["chroms"]):
+                part = slice(data["offsets"][i], data["offsets"][i + 1])
+                lengths = data["lengths"][part]
+                index[str(chrom)] = {
+                    "starts": data["starts"][part],
+                    "lengths": lengths,
+                    "af": data["af"][part],
+                    "max_length": int(lengths.max()) if len(lengths) else 1,
+                }
+            _vcf_index_cache.clear()
+            _vcf_index_cache[key] = {"path": vcf_path, "chroms": index, "count": int(data["offsets"][-1])}
+        return _vcf_index_cache[key]
+
+# function to find the variants overlapping a 0-based, end-exclusive region with two binary searches
+def variants_in_region(vcf_index, chrom, start, end):
+    chroms = vcf_index["chroms"]
+    if chrom not in chroms:
+        # allow "chr1" in the templates with "1" in the VCF and the other way around
+        chrom = chrom[3:] if chrom.startswith("chr") else f"chr{chrom}"
+    if chrom not in chroms:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+    variants = chroms[chrom]
+    first = np.searchsorted(variants["starts"], start - variants["max_length"] + 1)
+    last = np.searchsorted(variants["starts"], end)
+    starts, lengths, af = variants["starts"][first:last], variants["lengths"][first:last], variants["af"][first:last]
+    overlapping = starts + lengths > start
+    return starts[overlapping], lengths[overlapping], af[overlapping]
+
+# function to get the variants of a record (with chrom, start and strand) in template coordinates (0-based)
+# variants without an allele frequency are kept, they could be common
+def template_variants(vcf_index, record, min_af=0.0):
+    length = len(clean_sequence(record["sequence"]))
+    starts, lengths, af = variants_in_region(vcf_index, record["chrom"], record["start"], record["start"] + length)
+    keep = np.isnan(af) | (af >= min_af)
+    starts, lengths, af = starts[keep], lengths[keep], af[keep]
+    ends = starts + lengths
+    if record.get("strand", "+") == "-":
+        template_starts, template_ends = length - (ends - record["start"]), length - (starts - record["start"])
+    else:
+        template_starts, template_ends = starts - record["start"], ends - record["start"]
+    return pd.DataFrame({
+        "start": np.clip(template_starts, 0, length),
+        "end": np.clip(template_ends, 0, length),
+        "Genomic position": starts + 1,
+        "AF": af,
+    })
+
+# function to mark the variant bases of a template
+def variant_mask(variants, length):
+    return _cover(length, variants["start"].to_numpy(), variants["end"].to_numpy())
+
+# function to turn the variant bases of a template into EXCLUDED_REGION start,length pairs
+def variant_excluded_region(variants, length, first_base_index=1):
+    return " ".join(f"{start + first_base_index},{end - start}" for start, end in mask_intervals(variant_mask(variants, length)))
+
+# function to keep only the result blocks that pass a check, written back as a renumbered Primer3 output
+def filter_result_blocks(output, keep, num_return=None):
+    kept = []
+    rejected = 0
+    for block in _result_blocks(output):
+        if keep(block):
+            kept.append(block)
+        else:
+            rejected += 1
+    header = [
+        line for line in output.splitlines()
+        if line != "=" and not RESULT_KEY_PATTERN.match(line.partition("=")[0]) and not line.partition("=")[0].endswith("_NUM_RETURNED")
+    ]
+    return _format_result_blocks(header, kept[:num_return]), rejected
+
+# function to get the 0-based, end-exclusive template span of every oligo of a result block
+def _block_spans(block, first_base_index=1):
+    spans = {}
+    for oligo, field, value in block:
+        if field is None and oligo != "PAIR":
+            start, length = (int(part) for part in value.split(","))
+            start -= first_base_index
+            # the right primer's position is its 5' end (rightmost base)
+            spans[oligo] = (start - length + 1, start + 1) if oligo == "RIGHT" else (start, start + length)
+    return spans
+
+# function to drop the results whose left or right primer has a variant within the last bases of its 3' end
+def filter_three_prime_variants(output, mask, three_prime_bases=5, first_base_index=1, num_return=None):
+    def keep(block):
+        for oligo, (start, end) in _block_spans(block, first_base_index).items():
+            if oligo == "LEFT" and mask[max(end - three_prime_bases, 0):end].any():
+                return False
+            # the right primer's 3' end is the leftmost base of its span
+            if oligo == "RIGHT" and mask[max(start, 0):start + three_prime_bases].any():
+                return False
+        return True
+    return filter_result_blocks(output, keep, num_return)
+
+# function to design records (with chrom, start, strand) around the variants of a VCF, either by excluding the
+# variant positions or by rejecting pairs with a variant near a 3' end afterwards
+def run_variant_aware_design(values, records, vcf_index, min_af=0.0, exclude=True, three_prime_bases=5,
+                             max_workers=DEFAULT_WORKERS, progress=None):
+    first_base_index = values["primer_first_base_index"]
+    annotations = [template_variants(vcf_index, record, min_af) for record in records]
+    if exclude:
+        records = [
+            {**record, "excluded_region": " ".join(region for region in (
+                record.get("excluded_region", ""), variant_excluded_region(variants, len(clean_sequence(record["sequence"])), first_base_index)
+            ) if region)}
+            for record, variants in zip(records, annotations)
+        ]
+        overrides = None
+    else:
+        # ask for more pairs, so enough are left after the filter
+        overrides = {"PRIMER_NUM_RETURN": int(values["num_return"]) * 5}
+    settings_list = [fill_record_settings(values, record, overrides) for record in records]
+    results = run_primer3_batch(settings_list, max_workers=max_workers, progress=progress)
+
+    rows = []
+    for i, (record, variants, (output, success)) in enumerate(zip(records, annotations, results)):
+        rejected = 0
+        if not exclude and success:
+            mask = variant_mask(variants, len(clean_sequence(record["sequence"])))
+            output, rejected = filter_three_prime_variants(output, mask, three_prime_bases, first_base_index, int(values["num_return"]))
+            results[i] = (output, success)
+        rows.append({
+            "Sequence ID": record["seq_id"],
+            "Length": len(clean_sequence(record["sequence"])),
+            "Variants": len(variants),
+            "Rejected pairs": rejected,
+            **summarize_primer3_output(output, success),
+        })
+    return pd.DataFrame(rows), results, records, annotations
+
+
+#####################################
+### Allele-specific (ARMS) design ###
+#####################################
+
+SNP_PATTERN = re.compile(r"\[([ACGT])/([ACGT])\]", re.IGNORECASE)
+
+# deliberate penultimate mismatch: a transversion of the template base destabilises the 3' end further,
+# so the primer extends its own allele well but the other allele (two mismatches) hardly at all
+ARMS_MISMATCH = {"A": "C", "C": "A", "G": "T", "T": "G"}
+
+# function to read a SNP list, one SNP per line as "name sequence" with the SNP written as [A/G] in the sequence
+def parse_snp_list(text):
+    snps = []
+    invalid = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        parts = re.split(r"[\s,;]+", line.strip(), maxsplit=1)
+        name, sequence = (parts[0], parts[1]) if len(parts) == 2 else (f"snp_{line_number}", parts[0])
+        sequence = re.sub(r"\s", "", sequence)
+        match = SNP_PATTERN.search(sequence)
+        if not match:
+            invalid.append(name)
+            continue
+        snps.append({
+            "name": name,
+            "upstream": sequence[:match.start()].upper(),
+            "downstream": sequence[match.end():].upper(),
+            "alleles": (match.group(1).upper(), match.group(2).upper()),
+        })
+    return snps, invalid
+
+# function to build the allele-specific forward primer, its 3' base sits on the SNP
+def arms_primer(upstream, allele, length, penultimate_mismatch=False):
+    primer = upstream[-(length - 1):] + allele
+    if penultimate_mismatch and len(primer) > 1:
+        primer = primer[:-2] + ARMS_MISMATCH.get(primer[-2], primer[-2]) + primer[-1]
+    return primer
+
+# function to design ARMS assays for many SNPs: the allele 1 primer is fixed (SEQUENCE_PRIMER) while Primer3 picks
+# the common reverse primer and probe, then the allele 2 primer is checked together with them on its own template
+def run_arms_design(values, snps, penultimate_mismatch=False, max_workers=DEFAULT_WORKERS, progress=None):
+    length = int(values["primer_opt_size"])
+    records = []
+    for snp in snps:
+        allele = snp["alleles"][0]
+        records.append({
+            "seq_id": f"{snp['name']}_{allele}",
+            "sequence": snp["upstream"] + allele + snp["downstream"],
+            "left": arms_primer(snp["upstream"], allele, length, penultimate_mismatch),
+            "pick_left": False,
+            "right": "",
+            "pick_right": True,
+            "internal": "",
+            "pick_internal": values["pick_internal"],
+        })
+    results = run_primer3_batch([fill_record_settings(values, record) for record in records], max_workers=max_workers, progress=progress)
+    designs = []
+    for output, success in results:
+        table = primer3_results_table(parse_primer3_input_file(output)) if success else pd.DataFrame()
+        designs.append(table.iloc[0].to_dict() if len(table) else {})
+
+    # second allele: same reverse primer and probe, checked on the allele 2 template
+    check_list = []
+    for snp, design in zip(snps, designs):
+        allele = snp["alleles"][1]
+        check_list.append({
+            "seq_id": f"{snp['name']}_{allele}",
+            "sequence": snp["upstream"] + allele + snp["downstream"],
+            "left": arms_primer(snp["upstream"], allele, length, penultimate_mismatch),
+            "right": design.get("right_sequence", "") if isinstance(design.get("right_sequence"), str) else "",
+            "internal": design.get("internal_sequence", "") if isinstance(design.get("internal_sequence"), str) else "",
+            "pick_left": False,
+            "pick_right": False,
+            "pick_internal": False,
+        })
+    checked = [i for i, record in enumerate(check_list) if record["right"]]
+    check_results = run_primer3_batch(
+        [fill_record_settings(values, check_list[i], {"PRIMER_TASK": "check_primers"}) for i in checked], max_workers=max_workers
+    )
+    checks = dict(zip(checked, (summarize_check_output(output, success) for output, success in check_results)))
+
+    rows = []
+    for i, (snp, record, design, (output, success)) in enumerate(zip(snps, records, designs, results)):
+        check = checks.get(i, {})
+        error = parse_primer3_input_file(output).get("PRIMER_ERROR", "") if success else output.strip()
+        rows.append({
+            "SNP": snp["name"],
+            "Alleles": "/".join(snp["alleles"]),
+            "Allele 1 primer": record["left"],
+            "Allele 2 primer": check_list[i]["left"],
+            "Reverse primer": design.get("right_sequence"),
+            "Probe": design.get("internal_sequence"),
+            "Allele 1 Tm": design.get("left_tm"),
+            "Allele 2 Tm": check.get("Left Tm"),
+            "Reverse Tm": design.get("right_tm"),
+            "Probe Tm": design.get("internal_tm"),
+            "Product size": design.get("pair_product_size"),
+            "Pair penalty": design.get("pair_penalty"),
+            "Allele 2 problems": "; ".join(value for value in (check.get("Warnings"), check.get("Problems")) if value),
+            "Error": error or ("" if design else "no pair found"),
+        })
+    return pd.DataFrame(rows), results, records
+
+
+##########################
+### Nested PCR design ###
+##########################
+
+# function to move "start,length" regions into a sub-template starting at offset (0-based), clipped to its length
+def shift_regions(regions, offset, length, first_base_index=1):
+    shifted = []
+    for region in regions.split():
+        if "," not in region:
+            continue
+        start, size = (int(part) for part in region.split(","))
+        start -= first_base_index + offset
+        end = min(start + size, length)
+        start = max(start, 0)
+        if end > start:
+            shifted.append(f"{start + first_base_index},{end - start}")
+    return " ".join(shifted)
+
+# function to design nested PCR: outer pairs first, then inner pairs inside each of the top outer products,
+# the inner jobs run in parallel and identical amplicon interiors are designed only once
+def run_nested_design(values, outer_range, inner_range, top_outer=5, max_workers=DEFAULT_WORKERS, progress=None):
+    first_base_index = values["primer_first_base_index"]
+    sequence = clean_sequence(values["sequence"])
+    excluded_region = " ".join(region for region in (values["excluded_region"], auto_excluded_region(values)) if region)
+    pick_both = {"left": "", "right": "", "internal": "", "pick_left": True, "pick_right": True}
+    outer_record = {"seq_id": f"{values['seq_id']}_outer", "sequence": sequence, "target": values["target"],
+                    "excluded_region": excluded_region, **pick_both, "pick_internal": False}
+    outer_values = {**values, "product_size_range": outer_range, "num_return": top_outer}
+    outer_output, outer_success = run_primer3_batch([fill_record_settings(outer_values, outer_record)], max_workers=1)[0]
+    outer_table = primer3_results_table(parse_primer3_input_file(outer_output)) if outer_success else pd.DataFrame()
+    if "pair_penalty" not in outer_table:
+        return pd.DataFrame(), [outer_record], [(outer_output, outer_success)]
+
+    # the interior of an outer product lies between the 3' ends of its primers
+    interiors = []
+    for row in outer_table.itertuples():
+        start = int(row.left_start) - first_base_index + int(row.left_len)
+        end = int(row.right_start) - first_base_index - int(row.right_len) + 1
+        interiors.append((start, end))
+    inner_values = {**values, "product_size_range": inner_range}
+    inner_records = {}
+    for start, end in dict.fromkeys(interiors):
+        if end - start < 2:
+            continue
+        inner_records[(start, end)] = {
+            "seq_id": f"{values['seq_id']}_inner_{start + first_base_index}-{end - 1 + first_base_index}",
+            "sequence": sequence[start:end],
+            "target": shift_regions(values["target"], start, end - start, first_base_index),
+            "excluded_region": shift_regions(excluded_region, start, end - start, first_base_index),
+            **pick_both,
+            "pick_internal": values["pick_internal"],
+        }
+    inner_results = dict(zip(inner_records, run_primer3_batch(
+        [fill_record_settings(inner_values, record) for record in inner_records.values()], max_workers=max_workers, progress=progress
+    )))
+
+    rows = []
+    for outer_rank, (outer, interior) in enumerate(zip(outer_table.itertuples(), interiors), start=1):
+        output, success = inner_results.get(interior, ("", False))
+        inner_table = primer3_results_table(parse_primer3_input_file(output)) if success else pd.DataFrame()
+        if "pair_penalty" not in inner_table:
+            continue
+        offset = interior[0]
+        for inner_rank, inner in enumerate(inner_table.itertuples(), start=1):
+            rows.append({
+                "Outer rank": outer_rank,
+                "Inner rank": inner_rank,
+                "Outer forward": outer.left_sequence,
+                "Outer reverse": outer.right_sequence,
+                "Outer size": int(outer.pair_product_size),
+                "Inner forward": inner.left_sequence,
+                "Inner reverse": inner.right_sequence,
+                "Inner probe": getattr(inner, "internal_sequence", None),
+                "Inner size": int(inner.pair_product_size),
+                "Inner forward position": int(inner.left_start) + offset,
+                "Inner reverse position": int(inner.right_start) + offset,
+                "Outer penalty": outer.pair_penalty,
+                "Inner penalty": inner.pair_penalty,
+                "Combined penalty": outer.pair_penalty + inner.pair_penalty,
+            })
+    combinations = pd.DataFrame(rows)
+    if len(combinations):
+        combinations = combinations.sort_values(["Combined penalty", "Outer rank", "Inner rank"]).reset_index(drop=True)
+        combinations.insert(0, "Rank", range(1, len(combinations) + 1))
+    records = [outer_record] + list(inner_records.values())
+    results = [(outer_output, outer_success)] + [inner_results[key] for key in inner_records]
+    return combinations, records, results
+
+
+######################################
+### Degenerate consensus alignment ###
+######################################
+
+ALIGNMENT_BASES = np.frombuffer(b"ACGT-", dtype=np.uint8)
+# IUPAC code of each 4 bit mask, 0 (no base) is written as N
+MASK_TO_IUPAC = np.frombuffer(b"NACMGRSVTWYHKDBN", dtype=np.uint8)
+MASK_DEGENERACY = np.array([bin(mask).count("1") for mask in range(16)])
+
+# function to read an aligned FASTA file into the strain names and a (strains x columns) byte matrix
+def read_alignment(fasta_text):
+    sequences = parse_fasta_text(fasta_text)
+    lengths = {len(sequence) for sequence in sequences.values()}
+    if len(lengths) > 1:
+        raise ValueError("The sequences are not aligned, they have different lengths.")
+    if not sequences:
+        raise ValueError("No sequences found.")
+    matrix = np.array([np.frombuffer(sequence.upper().replace(".", "-").encode("ascii", "replace"), dtype=np.uint8) for sequence in sequences.values()])
+    return list(sequences), matrix
+
+# function to count A, C, G, T and gaps per alignment column, other characters (N, ...) are not counted
+def alignment_counts(matrix):
+    return np.stack([(matrix == base).sum(axis=0) for base in ALIGNMENT_BASES], axis=1)
+
+# function to derive the IUPAC consensus template and conservation of an alignment, columns that are mostly
+# gaps are left out of the template (column_map holds the alignment column of every template base)
+def alignment_consensus(matrix, min_fraction=0.05, max_gap_fraction=0.5):
+    counts = alignment_counts(matrix)
+    strains = matrix.shape[0]
+    kept = counts[:, 4] / strains <= max_gap_fraction
+    base_counts = counts[kept, :4]
+    totals = np.maximum(base_counts.sum(axis=1, keepdims=True), 1)
+    # every base seen in at least min_fraction of the (ungapped) strains becomes part of the IUPAC code
+    present = (base_counts / totals) >= min_fraction
+    masks = present @ np.array([1, 2, 4, 8])
+    consensus = MASK_TO_IUPAC[masks].tobytes().decode()
+    # conservation: share of all strains (gaps included) that have the most common base
+    conservation = base_counts.max(axis=1) / strains
+    return {"consensus": consensus, "conservation": conservation, "column_map": np.flatnonzero(kept), "counts": counts}
+
+# function to check each designed primer against every strain of the alignment at once
+def strain_coverage(matrix, consensus, table, first_base_index=1):
+    strain_masks = IUPAC_MASKS[matrix]
+    column_map = consensus["column_map"]
+    rows = []
+    for row in table.itertuples():
+        row = row._asdict()
+        result = {"Rank": row["rank"] + 1}
+        for oligo, label in (("left", "Forward"), ("right", "Reverse"), ("internal", "Probe")):
+            if not isinstance(row.get(f"{oligo}_sequence"), str):
+                continue
+            start, length = int(row[f"{oligo}_start"]) - first_base_index, int(row[f"{oligo}_len"])
+            if oligo == "right":
+                # the right primer's position is its 5' end, the site on the template is its reverse complement
+                start = start - length + 1
+                site = reverse_complement(row[f"{oligo}_sequence"])
+            else:
+                site = row[f"{oligo}_sequence"]
+            columns = column_map[start:start + length]
+            matches = (strain_masks[:, columns] & encode_iupac(site)) != 0
+            mismatches = (~matches).sum(axis=1)
+            # 3' end: last bases of the site for forward oligos, first bases for the reverse primer
+            three_prime = ~matches[:, :THREE_PRIME_BASES] if oligo == "right" else ~matches[:, -THREE_PRIME_BASES:]
+            result[label] = row[f"{oligo}_sequence"]
+            result[f"{label} degeneracy"] = int(np.prod(MASK_DEGENERACY[encode_iupac(site)]))
+            result[f"{label} exact %"] = round(100.0 * (mismatches == 0).mean(), 1)
+            result[f"{label} ≤1 mismatch %"] = round(100.0 * (mismatches <= 1).mean(), 1)
+            result[f"{label} 3' mismatch %"] = round(100.0 * three_prime.any(axis=1).mean(), 1)
+        rows.append(result)
+    return pd.DataFrame(rows)
+
+# function to design primers on the consensus of an alignment, poorly conserved regions are excluded and
+# ambiguous bases are accepted through PRIMER_LIBERAL_BASE and the max Ns setting
+def run_consensus_design(values, matrix, min_fraction=0.05, max_gap_fraction=0.5, min_conservation=0.8):
+    consensus = alignment_consensus(matrix, min_fraction, max_gap_fraction)
+    first_base_index = values["primer_first_base_index"]
+    excluded = " ".join(
+        f"{start + first_base_index},{end - start}" for start, end in mask_intervals(consensus["conservation"] < min_conservation)
+    )
+    record = {
+        "seq_id": f"{values['seq_id']}_consensus",
+        "sequence": consensus["consensus"],
+        "target": "",
+        "excluded_region": excluded,
+    }
+    output, success = run_primer3_batch([fill_record_settings(values, record, {"PRIMER_LIBERAL_BASE": 1})], max_workers=1)[0]
+    table = primer3_results_table(parse_primer3_input_file(output)) if success else pd.DataFrame()
+    coverage = strain_coverage(matrix, consensus, table, first_base_index) if "left_sequence" in table or "right_sequence" in table else pd.DataFrame()
+    return consensus, coverage, [record], [(output, success)]
+
+
+##########################
+### Bisulfite templates ###
+##########################
+
+# unmethylated C reads as T after bisulfite treatment, CpG C is first replaced by a placeholder byte
+BISULFITE_TABLE = bytes.maketrans(b"C", b"T")
+CPG_PLACEHOLDER = b"\x00"
+# what a CpG C becomes: kept (methylated), converted (unmethylated) or either (IUPAC Y)
+CPG_STATES = {"Methylated (CpG stays C)": b"C", "Unmethylated (CpG becomes T)": b"T", "Either (CpG as Y)": b"Y"}
+
+# function to convert a template in silico, the bottom strand is converted on its own 5'-3' sequence
+def bisulfite_convert(sequence, strand="top", cpg_state=b"C"):
+    sequence = clean_sequence(sequence).upper()
+    if strand == "bottom":
+        sequence = reverse_complement(sequence)
+    data = sequence.encode("ascii").replace(b"CG", CPG_PLACEHOLDER + b"G").translate(BISULFITE_TABLE)
+    return data.replace(CPG_PLACEHOLDER, cpg_state).decode("ascii")
+
+# function to get the cumulative count of CpG bases (C and G of every CpG) of a strand, so any span can be
+# checked with one subtraction
+def cpg_prefix_sums(sequence):
+    bases = np.frombuffer(sequence.upper().encode("ascii"), dtype=np.uint8)
+    cpg = (bases[:-1] == ord("C")) & (bases[1:] == ord("G"))
+    in_cpg = np.zeros(len(bases), dtype=np.int32)
+    in_cpg[:-1] += cpg
+    in_cpg[1:] += cpg
+    return np.concatenate(([0], np.cumsum(in_cpg > 0)))
+
+# function to mirror "start,length" regions onto the reverse complement of a template
+def mirror_regions(regions, length, first_base_index=1):
+    mirrored = []
+    for region in regions.split():
+        if "," in region:
+            start, size = (int(part) for part in region.split(","))
+            mirrored.append(f"{length - (start - first_base_index) - size + first_base_index},{size}")
+    return " ".join(mirrored)
+
+# function to design primers on bisulfite converted templates for many records in parallel, primers that
+# contain a CpG (and so depend on the methylation state) can be rejected afterwards
+def run_bisulfite_design(values, records, strand="top", cpg_state=b"C", reject_cpg=True, max_workers=DEFAULT_WORKERS, progress=None):
+    first_base_index = values["primer_first_base_index"]
+    num_return = int(values["num_return"])
+    converted = []
+    prefix_sums = []
+    for record in records:
+        original = clean_sequence(record["sequence"]).upper()
+        length = len(original)
+        oriented = reverse_complement(original) if strand == "bottom" else original
+        prefix_sums.append(cpg_prefix_sums(oriented))
+        converted_record = {**record, "seq_id": f"{record['seq_id']}_bisulfite_{strand}", "sequence": bisulfite_convert(original, strand, cpg_state)}
+        if strand == "bottom":
+            for key in ("target", "excluded_region"):
+                converted_record[key] = mirror_regions(record.get(key, ""), length, first_base_index)
+        converted.append(converted_record)
+    overrides = {}
+    if cpg_state == b"Y":
+        overrides["PRIMER_LIBERAL_BASE"] = 1
+    if reject_cpg:
+        # ask for more pairs, so enough are left after the filter
+        overrides["PRIMER_NUM_RETURN"] = num_return * 5
+    results = run_primer3_batch([fill_record_settings(values, record, overrides) for record in converted], max_workers=max_workers, progress=progress)
+
+    rows = []
+    for i, (record, cumulative, (output, success)) in enumerate(zip(converted, prefix_sums, results)):
+        rejected = 0
+        if reject_cpg and success:
+            def keep(block):
+                return all(cumulative[min(end, len(cumulative) - 1)] == cumulative[max(start, 0)] for start, end in _block_spans(block, first_base_index).values())
+            output, rejected = filter_result_blocks(output, keep, num_return)
+            results[i] = (output, success)
+        rows.append({
+            "Sequence ID": record["seq_id"],
+            "Length": len(record["sequence"]),
+            "CpG sites": int(cumulative[-1] // 2),
+            "CpG rejected pairs": rejected,
+            **summarize_primer3_output(output, success),
+        })
+    return pd.DataFrame(rows), results, converted
+
+#########################
+### Run history store ###
+#########################
+
+# file name of the run history database, and the number of most recently used runs it keeps
+RUN_STORE_FILE = "primer3_runs.sqlite"
+RUN_STORE_MAX_RUNS = 5000
+
+# function to get the location of the run history database, resolved when it is opened:
+# P3G_RUN_STORE if set (an empty value switches the history off), otherwise the folder the app is started from
+def run_store_path():
+    return os.environ.get("P3G_RUN_STORE", os.path.join(os.getcwd(), RUN_STORE_FILE))
+
+# tables of the run history store, the settings hash is unique so every run is kept only once
+RUN_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    settings_hash TEXT NOT NULL UNIQUE,
+    seq_id TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    output TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    results INTEGER NOT NULL,
+    elapsed REAL NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS pairs (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    penalty REAL,
+    product_size INTEGER,
+    left_sequence TEXT,
+    right_sequence TEXT,
+    internal_sequence TEXT,
+    PRIMARY KEY (run_id, rank)
+);
+CREATE INDEX IF NOT EXISTS runs_seq_id ON runs(seq_id);
+CREATE INDEX IF NOT EXISTS runs_last_used ON runs(last_used);
+CREATE INDEX IF NOT EXISTS pairs_left ON pairs(left_sequence);
+CREATE INDEX IF NOT EXISTS pairs_right ON pairs(right_sequence);
+CREATE INDEX IF NOT EXISTS pairs_internal ON pairs(internal_sequence);
+"""
+
+# SQLite limits the number of parameters in one statement
+SQL_CHUNK_SIZE = 500
+
+_run_store = None
+_run_store_lock = threading.Lock()
+
+# function to open (or create) the run history store, write-ahead logging lets readers run next to a writer
+def open_run_store(path):
+    connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    connection.executescript(RUN_STORE_SCHEMA)
+    return connection
+
+# function to switch the run history on for all Primer3 runs, keeping at most max_runs runs (an empty path switches it off)
+def use_run_store(path, max_runs=RUN_STORE_MAX_RUNS):
+    global _run_store
+    with _run_store_lock:
+        if _run_store is not None and _run_store[0] == path:
+            _run_store = (path, _run_store[1], max_runs)
+            return _run_store[1]
+        connection = open_run_store(path) if path else None
+        _run_store = (path, connection, max_runs) if connection else None
+    return connection
+
+# function to get the parsed pairs of an output as rows for the pairs table
+def _run_pairs(run_id, parsed_output):
+    table = primer3_results_table(parsed_output)
+    rows = []
+    for row in table.to_dict("records"):
+        sequences = [row.get(f"{oligo}_sequence") for oligo in ("left", "right", "internal")]
+        if not any(isinstance(sequence, str) for sequence in sequences):
+            continue
+        penalty = row.get("pair_penalty", row.get("left_penalty", row.get("right_penalty")))
+        size = row.get("pair_product_size")
+        rows.append((
+            run_id, int(row["rank"]),
+            None if pd.isna(penalty) else penalty,
+            None if size is None or pd.isna(size) else int(size),
+            *[sequence.upper() if isinstance(sequence, str) else None for sequence in sequences],
+        ))
+    return rows
+
+# function to record runs as (settings, output, success, elapsed), a repeated run replaces the stored one
+# with max_runs, only that many of the most recently used runs are kept
+def record_runs(connection, runs, max_runs=None):
+    now = time.time()
+    with _run_store_lock, connection:
+        for settings, output, success, elapsed in runs:
+            # runs that Primer3 rejected with an error are not kept, they are run again next time
+            if "PRIMER_ERROR=" in output:
+                continue
+            parsed = parse_primer3_input_file(settings)
+            parsed_output = parse_primer3_input_file(output) if success else {}
+            results = results_returned(parsed_output) if parsed_output else 0
+            run_id = connection.execute(
+                """INSERT INTO runs (settings_hash, seq_id, settings, output, success, results, elapsed, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(settings_hash) DO UPDATE SET
+                    output = excluded.output, success = excluded.success, results = excluded.results,
+                    elapsed = excluded.elapsed, last_used = excluded.last_used, uses = uses + 1
+                RETURNING id""",
+                (settings_hash(settings), parsed.get("SEQUENCE_ID", ""), settings, output,
+                 int(success), results, elapsed, now, now),
+            ).fetchone()[0]
+            connection.execute("DELETE FROM pairs WHERE run_id = ?", (run_id,))
+            connection.executemany("INSERT INTO pairs VALUES (?, ?, ?, ?, ?, ?, ?)", _run_pairs(run_id, parsed_output))
+        if max_runs:
+            # the pairs of removed runs are removed with them
+            connection.execute(
+                "DELETE FROM runs WHERE id IN (SELECT id FROM runs ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (int(max_runs),)
+            )
+
+# function to look up successful stored runs (without a Primer3 error) by settings hash, returns {hash: (output, success)}
+def lookup_runs(connection, hashes):
+    found = {}
+    now = time.time()
+    with _run_store_lock, connection:
+        for i in range(0, len(hashes), SQL_CHUNK_SIZE):
+            chunk = hashes[i:i + SQL_CHUNK_SIZE]
+            marks = ", ".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT settings_hash, output FROM runs WHERE success = 1 AND settings_hash IN ({marks}) "
+                "AND instr(output, 'PRIMER_ERROR=') = 0", chunk
+            ).fetchall()
+            found.update((key, (output, True)) for key, output in rows)
+            if rows:
+                # count the reuse, so the history shows how many runs were saved
+                connection.executemany(
+                    "UPDATE runs SET uses = uses + 1, last_used = ? WHERE settings_hash = ?",
+                    [(now, key) for key, _ in rows],
+                )
+    return found
+
+# functions used by the Primer3 runners, a failing history store never fails the design itself
+def _stored_runs(hashes):
+    store = _run_store
+    if store is None:
+        return {}
+    try:
+        return lookup_runs(store[1], hashes)
+    except sqlite3.Error:
+        return {}
+
+def _store_runs(runs):
+    store = _run_store
+    if store is None or not runs:
+        return
+    try:
+        record_runs(store[1], runs, store[2])
+    except sqlite3.Error:
+        pass
+
+# function to build the WHERE clause selecting stored runs by sequence ID, oligo sequence or settings hash prefixes
+def _run_conditions(seq_id, oligo, settings_hash_prefix):
+    conditions = []
+    parameters = []
+    if seq_id.strip():
+        conditions.append("r.seq_id LIKE ?")
+        parameters.append(seq_id.strip() + "%")
+    if oligo.strip():
+        # each GLOB prefix match uses the index of its oligo column
+        pattern = oligo.strip().upper() + "*"
+        conditions.append(
+            "r.id IN (SELECT run_id FROM pairs WHERE left_sequence GLOB ? "
+            "UNION SELECT run_id FROM pairs WHERE right_sequence GLOB ? "
+            "UNION SELECT run_id FROM pairs WHERE internal_sequence GLOB ?)"
+        )
+        parameters += [pattern] * 3
+    if settings_hash_prefix.strip():
+        conditions.append("r.settings_hash GLOB ?")
+        parameters.append(settings_hash_prefix.strip().lower() + "*")
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), parameters
+
+# function to search the stored runs by sequence ID, oligo sequence or settings hash (prefixes, case-insensitive ID)
+def search_runs(connection, seq_id="", oligo="", settings_hash_prefix="", limit=200):
+    where, parameters = _run_conditions(seq_id, oligo, settings_hash_prefix)
+    with _run_store_lock:
+        table = pd.read_sql_query(
+            f"""SELECT r.id AS "Run", datetime(r.created, 'unixepoch', 'localtime') AS "Created",
+                r.seq_id AS "Sequence ID", substr(r.settings_hash, 1, 12) AS "Settings hash",
+                r.success AS "Success", r.results AS "Results",
+                p.penalty AS "Best penalty", p.left_sequence AS "Forward primer",
+                p.right_sequence AS "Reverse primer", p.internal_sequence AS "Probe",
+                p.product_size AS "Product size", round(r.elapsed, 3) AS "Run time (s)", r.uses AS "Uses"
+            FROM runs r LEFT JOIN pairs p ON p.run_id = r.id AND p.rank = 0
+            {where} ORDER BY r.last_used DESC LIMIT ?""",
+            connection, params=parameters + [int(limit)],
+        )
+    table["Success"] = table["Success"].astype(bool)
+    return table
+
+# function to load one stored run, returns the settings, output and success, or None if it is missing
+def load_run(connection, run_id):
+    with _run_store_lock:
+        row = connection.execute(
+            "SELECT settings, output, success FROM runs WHERE id = ?", (int(run_id),)
+        ).fetchone()
+    if row is None:
+        return None
+    return row[0], row[1], bool(row[2])
+
+# function to get the outputs of the stored runs matching a search, as (sequence ID, output, success)
+def stored_outputs(connection, seq_id="", oligo="", settings_hash_prefix="", limit=10000):
+    where, parameters = _run_conditions(seq_id, oligo, settings_hash_prefix)
+    with _run_store_lock:
+        rows = connection.execute(
+            f"SELECT r.seq_id, r.output, r.success FROM runs r {where} ORDER BY r.last_used DESC LIMIT ?",
+            parameters + [int(limit)],
+        ).fetchall()
+    return [(name, output, bool(success)) for name, output, success in rows]
+
+# function to count the stored runs and the repeated runs that were reused instead of run again
+def run_store_stats(connection):
+    with _run_store_lock:
+        runs, uses = connection.execute("SELECT count(*), coalesce(sum(uses), 0) FROM runs").fetchone()
+    return {"runs": runs, "reused": uses - runs}
+
+# function to turn stored settings back into a record for the 'Input Settings' tab
+def stored_run_record(settings):
+    parsed = parse_primer3_input_file(settings)
+    record = {
+        "seq_id": parsed.get("SEQUENCE_ID", ""),
+        "sequence": parsed.get("SEQUENCE_TEMPLATE", ""),
+        "target": parsed.get("SEQUENCE_TARGET", ""),
+        "excluded_region": parsed.get("EXCLUDED_REGION", ""),
+        "left": parsed.get("SEQUENCE_PRIMER", ""),
+        "right": parsed.get("SEQUENCE_PRIMER_REVCOMP", ""),
+        "internal": parsed.get("SEQUENCE_INTERNAL_OLIGO", ""),
+    }
+    for oligo, tag in (("left", "PRIMER_PICK_LEFT_PRIMER"), ("right", "PRIMER_PICK_RIGHT_PRIMER"), ("internal", "PRIMER_PICK_INTERNAL_OLIGO")):
+        record[f"pick_{oligo}"] = parsed.get(tag, "0") == "1" and not record[oligo]
+    return record
+
+#########################
+### Failure analytics ###
+#########################
+
+# regexes to find the EXPLAIN and PROBLEMS tags of a Primer3 output
+EXPLAIN_LINE_PATTERN = re.compile(r"^PRIMER_(LEFT|RIGHT|INTERNAL|PAIR)_EXPLAIN=(.*)$", re.M)
+PROBLEMS_LINE_PATTERN = re.compile(r"^PRIMER_(LEFT|RIGHT|INTERNAL)_\d+_PROBLEMS=(.*)$", re.M)
+MESSAGE_LINE_PATTERN = re.compile(r"^PRIMER_(ERROR|WARNING)=(.*)$", re.M)
+RETURNED_LINE_PATTERN = re.compile(r"^(PRIMER_(?:LEFT|RIGHT|INTERNAL|PAIR)_NUM_RETURNED)=(\d+)$", re.M)
+
+# regex to split an EXPLAIN value such as "considered 100, low tm 20, ok 80" into reasons and counts
+EXPLAIN_ITEM_PATTERN = r"(?:^|, )(?P<reason>[^,]+?) (?P<count>\d+)(?=,|$)"
+
+# EXPLAIN counters that are not a rejection reason
+EXPLAIN_TOTALS = ("considered", "ok")
+
+# function to collect the EXPLAIN values and problems of many runs given as (name, output, success)
+def _failure_lines(runs):
+    explain = []
+    problems = []
+    for name, output, success in runs:
+        if not success:
+            problems.append((name, "RUN", "Primer3 failed"))
+            continue
+        explain += [(name, oligo, value) for oligo, value in EXPLAIN_LINE_PATTERN.findall(output)]
+        problems += [(name, oligo, value) for oligo, value in PROBLEMS_LINE_PATTERN.findall(output)]
+        problems += [(name, "RUN", f"{kind.capitalize()}: {value}") for kind, value in MESSAGE_LINE_PATTERN.findall(output)]
+        if "PRIMER_ERROR=" not in output and not results_returned(dict(RETURNED_LINE_PATTERN.findall(output))):
+            problems.append((name, "RUN", "No results returned"))
+    explain = pd.DataFrame(explain, columns=["Run", "Oligo", "Explain"])
+    problems = pd.DataFrame(problems, columns=["Run", "Oligo", "Problem"])
+    return explain, problems
+
+# function to aggregate the EXPLAIN counters and problem categories of many runs
+# returns the rejection reasons (totals, share of the considered oligos and runs affected),
+# the EXPLAIN counters per oligo type and the problem categories
+def failure_analytics(runs):
+    explain, problems = _failure_lines(runs)
+
+    counts = explain["Explain"].str.extractall(EXPLAIN_ITEM_PATTERN).reset_index(level=1, drop=True)
+    counts = explain[["Run", "Oligo"]].join(counts, how="inner")
+    counts["count"] = counts["count"].astype(np.int64)
+    counts["reason"] = counts["reason"].str.strip()
+
+    explain_table = counts.pivot_table(index="reason", columns="Oligo", values="count", aggfunc="sum", fill_value=0)
+    order = [key for key in EXPLAIN_KEYS if key in explain_table.index]
+    explain_table = explain_table.reindex(order + sorted(set(explain_table.index) - set(order))).rename_axis(index="Reason", columns=None)
+
+    considered = counts[counts["reason"] == "considered"].groupby("Oligo")["count"].sum()
+    rejected = counts[~counts["reason"].isin(EXPLAIN_TOTALS)].assign(affected=lambda df: df["count"] > 0)
+    rejections = rejected.groupby(["Oligo", "reason"]).agg(
+        Rejected=("count", "sum"), Runs=("affected", "sum")
+    ).reset_index()
+    rejections["% of considered"] = (
+        100 * rejections["Rejected"] / rejections["Oligo"].map(considered).replace(0, np.nan)
+    ).round(2)
+    rejections = rejections.rename(columns={"reason": "Reason"}).sort_values("Rejected", ascending=False, ignore_index=True)
+
+    # PROBLEMS values list several problems separated by semicolons
+    problems["Problem"] = problems["Problem"].str.split(";")
+    problems = problems.explode("Problem")
+    problems["Problem"] = problems["Problem"].str.strip()
+    problems = problems[problems["Problem"] != ""]
+    problem_table = problems.groupby(["Oligo", "Problem"]).agg(
+        Count=("Run", "size"), Runs=("Run", "nunique")
+    ).reset_index().sort_values("Count", ascending=False, ignore_index=True)
+    return rejections, explain_table, problem_table
+
+#########################
+### Session snapshots ###
+#########################
+
+# snapshot files are gzip compressed JSON, the version is raised when the layout changes
+SNAPSHOT_FORMAT = "p3g-snapshot"
+SNAPSHOT_VERSION = 1
+
+# function to write NumPy values (e.g. from batch records) as plain JSON values
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} can not be stored in a snapshot")
+
+# function to pack the settings, the raw and parsed output and optional batch results (key: (table, results, records))
+def build_snapshot(values, settings_filled, output, success, batches=None):
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "values": values,
+        "settings": settings_filled,
+        "output": output,
+        "success": bool(success),
+        "results": primer3_results_table(parse_primer3_input_file(output)).to_dict("split") if success else None,
+        "batches": {
+            key: {"table": table.to_dict("split"), "results": results, "records": records}
+            for key, (table, results, records) in (batches or {}).items()
+        },
+    }
+    return gzip.compress(json.dumps(snapshot, default=_json_default, separators=(",", ":")).encode("utf-8"))
+
+# function to unpack a snapshot, raises ValueError for files that are not a (supported) snapshot
+def read_snapshot(data):
+    try:
+        snapshot = json.loads(gzip.decompress(data).decode("utf-8"))
+    except (OSError, EOFError, ValueError, zlib.error) as e:
+        raise ValueError(f"not a snapshot file ({e})")
+    if not isinstance(snapshot, dict) or snapshot.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError("not a snapshot file")
+    if snapshot.get("version", 0) > SNAPSHOT_VERSION:
+        raise ValueError(f"snapshot version {snapshot['version']} is newer than this version of the app supports")
+    if snapshot["results"] is not None:
+        snapshot["results"] = pd.DataFrame(**snapshot["results"])
+    snapshot["batches"] = {
+        key: (
+            pd.DataFrame(**batch["table"]),
+            [tuple(result) for result in batch["results"]],
+            batch["records"],
+        )
+        for key, batch in snapshot.get("batches", {}).items()
+    }
+    return snapshot
+
+############################
+### Settings file import ###
+############################
+
+# Boulder-IO tag, session state key, type and default of every setting of the app: the defaults of a new session
+# in all app versions and the schema used to read settings files (settings without a tag are not in the files)
+SETTINGS_SCHEMA = [
+    # general options
+    ("SEQUENCE_ID", "seq_id", "str", "example sequence"),
+    ("SEQUENCE_TEMPLATE", "sequence", "str", ""),
+    ("SEQUENCE_PRIMER", "left", "str", ""),
+    ("SEQUENCE_PRIMER_REVCOMP", "right", "str", ""),
+    ("SEQUENCE_INTERNAL_OLIGO", "internal", "str", ""),
+    ("PRIMER_PICK_LEFT_PRIMER", "pick_left", "flag", False),
+    ("PRIMER_PICK_RIGHT_PRIMER", "pick_right", "flag", False),
+    ("PRIMER_PICK_INTERNAL_OLIGO", "pick_internal", "flag", False),
+    ("SEQUENCE_TARGET", "target", "str", ""),
+    ("EXCLUDED_REGION", "excluded_region", "str", ""),
+    ("PRIMER_PRODUCT_SIZE_RANGE", "product_size_range", "str", "100-300 150-250 301-400 401-500 501-600 601-700 701-850 851-1000"),
+    ("PRIMER_NUM_RETURN", "num_return", "int", 5),
+    (None, "split_size_ranges", "flag", False),
+    (None, "auto_excluded_region", "str", ""),
+    (None, "auto_excluded_sequence", "str", ""),
+    (None, "save_input_file", "flag", False),
+    ("PRIMER_MAX_MISPRIMING", "max_repeat_mispriming", "float", 12.0),
+    ("PRIMER_MAX_TEMPLATE_MISPRIMING", "max_template_mispriming", "float", 12.0),
+    ("PRIMER_MAX_END_STABILITY", "max_3_prime_stability", "float", 9.0),
+    ("PRIMER_PAIR_MAX_MISPRIMING", "pair_max_repeat_mispriming", "float", 24.0),
+    ("PRIMER_PAIR_MAX_TEMPLATE_MISPRIMING", "pair_max_template_mispriming", "float", 24.0),
+    # primer options
+    ("PRIMER_MIN_SIZE", "primer_min_size", "int", 18),
+    ("PRIMER_OPT_SIZE", "primer_opt_size", "int", 20),
+    ("PRIMER_MAX_SIZE", "primer_max_size", "int", 27),
+    ("PRIMER_MIN_TM", "primer_min_tm", "float", 57.0),
+    ("PRIMER_OPT_TM", "primer_opt_tm", "float", 60.0),
+    ("PRIMER_MAX_TM", "primer_max_tm", "float", 63.0),
+    ("PRIMER_PRODUCT_MIN_TM", "product_min_tm", "float", -1000000.0),
+    ("PRIMER_PRODUCT_OPT_TM", "product_opt_tm", "float", 0.0),
+    ("PRIMER_PRODUCT_MAX_TM", "product_max_tm", "float", 1000000.0),
+    ("PRIMER_MIN_GC", "primer_min_GC", "float", 20.0),
+    ("PRIMER_OPT_GC_PERCENT", "primer_opt_GC", "float", 50.0),
+    ("PRIMER_MAX_GC", "primer_max_GC", "float", 80.0),
+    ("PRIMER_PAIR_MAX_DIFF_TM", "max_tm_diff", "float", 100.0),
+    ("PRIMER_TM_SANTALUCIA", "thermo_param_value", "str", "0"),
+    ("PRIMER_MAX_SELF_ANY", "primer_max_self_comp", "float", 8.0),
+    ("PRIMER_MAX_SELF_END", "primer_max_3prime_self_comp", "float", 3.0),
+    ("PRIMER_MAX_NS_ACCEPTED", "max_Ns", "int", 0),
+    ("PRIMER_MAX_POLY_X", "max_poly_x", "int", 5),
+    ("PRIMER_INSIDE_PENALTY", "primer_inside_target_penalty", "float", -1.0),
+    ("PRIMER_OUTSIDE_PENALTY", "primer_outside_target_penalty", "float", 0.0),
+    ("PRIMER_FIRST_BASE_INDEX", "primer_first_base_index", "int", 1),
+    ("PRIMER_GC_CLAMP", "CG_clamp", "int", 0),
+    ("PRIMER_SALT_CONC", "primer_salt_conc_monocat", "float", 50.0),
+    ("PRIMER_DIVALENT_CONC", "primer_salt_conc_divcat", "float", 0.0),
+    ("PRIMER_SALT_CORRECTIONS", "salt_correction_value", "str", "0"),
+    ("PRIMER_DNTP_CONC", "primer_dntp_conc", "float", 0.0),
+    ("PRIMER_DNA_CONC", "annealing_oligo_conc", "float", 50.0),
+    ("PRIMER_LIBERAL_BASE", "liberal_base", "int", 0),
+    ("PRIMER_LIB_AMBIGUITY_CODES_CONSENSUS", "ambiguity_codes_consensus", "int", 1),
+    ("PRIMER_LOWERCASE_MASKING", "lowercase_masking", "int", 1),
+    # the checkboxes behind the three options above (ambiguity codes and lowercase masking are inverted)
+    ("PRIMER_LIBERAL_BASE", "liberal_base_checkbox", "flag", True),
+    ("PRIMER_LIB_AMBIGUITY_CODES_CONSENSUS", "ambiguity_codes_checkbox", "inverted flag", True),
+    ("PRIMER_LOWERCASE_MASKING", "lowercase_masking_checkbox", "inverted flag", False),
+    # probe options
+    ("PRIMER_INTERNAL_MIN_SIZE", "probe_min_size", "int", 18),
+    ("PRIMER_INTERNAL_OPT_SIZE", "probe_opt_size", "int", 20),
+    ("PRIMER_INTERNAL_MAX_SIZE", "probe_max_size", "int", 27),
+    ("PRIMER_INTERNAL_MIN_TM", "probe_min_tm", "float", 57.0),
+    ("PRIMER_INTERNAL_OPT_TM", "probe_opt_tm", "float", 60.0),
+    ("PRIMER_INTERNAL_MAX_TM", "probe_max_tm", "float", 63.0),
+    ("PRIMER_INTERNAL_MIN_GC", "probe_min_GC", "float", 20.0),
+    ("PRIMER_INTERNAL_OPT_GC_PERCENT", "probe_opt_GC", "float", 50.0),
+    ("PRIMER_INTERNAL_MAX_GC", "probe_max_GC", "float", 80.0),
+    ("PRIMER_INTERNAL_MAX_SELF_ANY", "probe_max_self_comp", "float", 12.0),
+    ("PRIMER_INTERNAL_MAX_NS_ACCEPTED", "probe_max_Ns", "int", 0),
+    ("PRIMER_INTERNAL_OLIGO_MIN_QUALITY", "probe_min_seq_qual", "int", 0),
+    ("PRIMER_INTERNAL_OLIGO_SALT_CONC", "probe_salt_conc_monocat", "float", 50.0),
+    ("PRIMER_INTERNAL_OLIGO_DIVALENT_CONC", "probe_salt_conc_divcat", "float", 0.0),
+    ("PRIMER_INTERNAL_MAX_SELF_END", "probe_max_3prime_self_comp", "float", 12.0),
+    ("PRIMER_INTERNAL_MAX_POLY_X", "probe_max_poly_x", "int", 5),
+    ("PRIMER_INTERNAL_DNA_CONC", "probe_DNA_conc", "float", 50.0),
+    ("PRIMER_INTERNAL_DNTP_CONC", "probe_dntp_conc", "float", 0.0),
+]
+SETTING_DEFAULTS = {key: default for _, key, _, default in SETTINGS_SCHEMA}
+
+# conversions of the schema types, a ValueError marks an invalid value
+SETTING_TYPES = {
+    "str": str,
+    "int": lambda value: int(float(value)),
+    "float": float,
+    "flag": lambda value: int(float(value)) == 1,
+    "inverted flag": lambda value: int(float(value)) == 0,
+}
+
+# function to convert a parsed settings file into session state values in one pass over the schema
+# missing tags get the schema default, invalid values get the default and are reported as problems
+def import_settings(parsed, schema=SETTINGS_SCHEMA):
+    values = {}
+    problems = []
+    for tag, key, kind, default in schema:
+        if tag is None:
+            continue
+        if tag not in parsed:
+            values[key] = default
+            continue
+        try:
+            values[key] = SETTING_TYPES[kind](parsed[tag])
+        except ValueError:
+            values[key] = default
+            problems.append(f"{tag}={parsed[tag]} is not a valid {kind}, using {default}")
+    # a provided oligo is used as given instead of picked
+    for oligo in ("left", "right", "internal"):
+        if values.get(oligo):
+            values[f"pick_{oligo}"] = False
+    return values, problems
+
+# function to import many settings files given as {file name: text}, returns (file name, values, problems) per file
+def import_settings_files(files):
+    imported = []
+    for name, text in files.items():
+        parsed = parse_primer3_input_file(text)
+        values, problems = import_settings(parsed)
+        # a file without a sequence ID is named after the file
+        if not parsed.get("SEQUENCE_ID"):
+            values["seq_id"] = os.path.splitext(name)[0]
+        imported.append((name, values, problems))
+    return imported
+
+# function to run imported settings files again as one parallel batch, returns the summary table,
+# the (output, success) per file and the imported values as batch records
+def run_settings_replay(imported, max_workers=DEFAULT_WORKERS, progress=None):
+    records = [values for _, values, _ in imported]
+    results = run_primer3_batch(
+        [fill_primer3_settings(values) for values in records], max_workers=max_workers, progress=progress
+    )
+    rows = [
+        {"File": name, "Sequence ID": values["seq_id"], "Import problems": len(problems), **summarize_primer3_output(*result)}
+        for (name, values, problems), result in zip(imported, results)
+    ]
+    return pd.DataFrame(rows), results, records
+
+###########################
+### Settings validation ###
+###########################
+
+# function to check that an optimum lies between its minimum and maximum
+def _outside(optimum, minimum, maximum):
+    return lambda v: v[optimum] < v[minimum] or v[optimum] > v[maximum]
+
+# validation rules as (stage, severity, check, message), a check returns True when the rule is broken
+# stages: "oligo" checks provided oligos, "run" checks the input when Primer3 is run, "range" checks min/opt/max settings
+# severities: an "error" blocks the run, a "warning" is only shown
+VALIDATION_RULES = [
+    ("oligo", "warning", lambda v: v["left"] and len(v["left"]) < v["primer_min_size"],
+     "Forward primer sequence is shorter ({left_length}) than the minimum set length ({primer_min_size})."),
+    ("oligo", "warning", lambda v: v["right"] and len(v["right"]) < v["primer_min_size"],
+     "Reverse primer sequence is shorter ({right_length}) than the minimum set length ({primer_min_size})."),
+    ("oligo", "warning", lambda v: v["internal"] and len(v["internal"]) < v["probe_min_size"],
+     "Probe sequence is shorter ({internal_length}) than the minimum set length ({probe_min_size})."),
+    ("oligo", "warning", lambda v: v["left"] and len(v["left"]) > v["primer_max_size"],
+     "Forward primer sequence is longer ({left_length}) than the maximum set length ({primer_max_size})."),
+    ("oligo", "warning", lambda v: v["right"] and len(v["right"]) > v["primer_max_size"],
+     "Reverse primer sequence is longer ({right_length}) than the maximum set length ({primer_max_size})."),
+    ("oligo", "warning", lambda v: v["internal"] and len(v["internal"]) > v["probe_max_size"],
+     "Probe sequence is longer ({internal_length}) than the maximum set length ({probe_max_size})"),
+    ("run", "error", lambda v: not v["sequence"],
+     "Please enter a DNA sequence before running Primer3."),
+    ("run", "error", lambda v: v["sequence"] and not v["pick_left"] and not v["pick_right"] and not v["left"].strip() and not v["right"].strip(),
+     "You must either select to pick primers or provide sequences for the forward and/or reverse primers."),
+    ("run", "error", lambda v: v["sequence"] and (
+        (v["left"].strip() and not v["pick_right"] and not v["right"].strip())
+        or (v["right"].strip() and not v["pick_left"] and not v["left"].strip())
+    ), "You must provide both primer sequences or select to pick the missing primer."),
+    ("range", "warning", _outside("primer_opt_size", "primer_min_size", "primer_max_size"),
+     "Optimal primer size ({primer_opt_size}) should be between minimum ({primer_min_size}) and maximum ({primer_max_size}) size."),
+    ("range", "warning", _outside("primer_opt_tm", "primer_min_tm", "primer_max_tm"),
+     "Optimal primer Tm ({primer_opt_tm}) should be between minimum ({primer_min_tm}) and maximum ({primer_max_tm}) Tm."),
+    ("range", "warning", _outside("primer_opt_GC", "primer_min_GC", "primer_max_GC"),
+     "Optimal primer GC% ({primer_opt_GC}) should be between minimum ({primer_min_GC}) and maximum ({primer_max_GC}) GC%."),
+    ("range", "warning", _outside("probe_opt_size", "probe_min_size", "probe_max_size"),
+     "Optimal probe size ({probe_opt_size}) should be between minimum ({probe_min_size}) and maximum ({probe_max_size}) size."),
+    ("range", "warning", _outside("probe_opt_tm", "probe_min_tm", "probe_max_tm"),
+     "Optimal probe Tm ({probe_opt_tm}) should be between minimum ({probe_min_tm}) and maximum ({probe_max_tm}) Tm."),
+    ("range", "warning", _outside("probe_opt_GC", "probe_min_GC", "probe_max_GC"),
+     "Optimal probe GC% ({probe_opt_GC}) should be between minimum ({probe_min_GC}) and maximum ({probe_max_GC}) GC%."),
+]
+
+# the values the rules read, the sequence is only checked for being empty, so it is reduced to a flag before memoizing
+VALIDATION_KEYS = (
+    "sequence", "left", "right", "internal", "pick_left", "pick_right",
+    "primer_min_size", "primer_opt_size", "primer_max_size", "primer_min_tm", "primer_opt_tm", "primer_max_tm",
+    "primer_min_GC", "primer_opt_GC", "primer_max_GC",
+    "probe_min_size", "probe_opt_size", "probe_max_size", "probe_min_tm", "probe_opt_tm", "probe_max_tm",
+    "probe_min_GC", "probe_opt_GC", "probe_max_GC",
+)
+_validation_values = operator.itemgetter(*VALIDATION_KEYS)
+
+# function to evaluate all rules on one set of relevant values, memoized so unchanged settings are not checked again
+@functools.lru_cache(maxsize=1024)
+def _evaluate_rules(relevant_values):
+    values = dict(zip(VALIDATION_KEYS, relevant_values))
+    for oligo in ("left", "right", "internal"):
+        values[f"{oligo}_length"] = len(values[oligo])
+    return tuple(
+        (stage, severity, message.format_map(values))
+        for stage, severity, check, message in VALIDATION_RULES
+        if check(values)
+    )
+
+# function to validate settings (session state or a plain dict), returns (stage, severity, message) per broken rule
+def validate_settings(values, stages=None):
+    relevant_values = _validation_values(values)
+    relevant_values = (bool(relevant_values[0].strip()),) + relevant_values[1:]
+    return [finding for finding in _evaluate_rules(relevant_values) if stages is None or finding[0] in stages]
+
+# function to validate many batch records against the general settings, one row per broken rule
+def validate_records(values, records, stages=("oligo", "run", "range")):
+    base = dict(zip(VALIDATION_KEYS, _validation_values(values)))
+    rows = []
+    for record in records:
+        record_values = {**base, **{key: value for key, value in record.items() if key in base}}
+        rows += [
+            {"Sequence ID": record.get("seq_id", ""), "Stage": stage, "Severity": severity, "Message": message}
+            for stage, severity, message in validate_settings(record_values, stages)
+        ]
+    return pd.DataFrame(rows, columns=["Sequence ID", "Stage", "Severity", "Message"])
+
+####################
+### Results grid ###
+####################
+
+# oligo rows of the result detail table, as (label, tag prefix)
+RESULT_OLIGOS = [("LEFT PRIMER", "PRIMER_LEFT"), ("RIGHT PRIMER", "PRIMER_RIGHT"), ("HYB OLIGO", "PRIMER_INTERNAL")]
+
+# columns of the results grid, taken from the primer3_results_table columns
+RESULT_GRID_COLUMNS = {
+    "pair_penalty": "Penalty",
+    "pair_product_size": "Product size",
+    "pair_product_tm": "Product Tm",
+    "pair_compl_any": "Pair compl any",
+    "pair_compl_end": "Pair compl end",
+    "left_sequence": "Forward primer",
+    "left_start": "Forward start",
+    "left_tm": "Forward Tm",
+    "left_gc_percent": "Forward GC%",
+    "right_sequence": "Reverse primer",
+    "right_start": "Reverse start",
+    "right_tm": "Reverse Tm",
+    "right_gc_percent": "Reverse GC%",
+    "internal_sequence": "Probe",
+    "internal_start": "Probe start",
+    "internal_tm": "Probe Tm",
+    "internal_gc_percent": "Probe GC%",
+}
+
+# columns of the results grid without pairs (e.g. primer lists or a single oligo), the oligos take the pair's place
+OLIGO_GRID_COLUMNS = {
+    "left_penalty": "Forward penalty",
+    "right_penalty": "Reverse penalty",
+    "internal_penalty": "Probe penalty",
+    **{column: name for column, name in RESULT_GRID_COLUMNS.items() if not column.startswith("pair_")},
+}
+
+# function to put all results of an output into one table, one row per result; without pairs the oligos
+# of the same rank share a row, as in the Primer3 output
+def results_grid(parsed_output, include_internal=True):
+    table = primer3_results_table(parsed_output)
+    if "pair_penalty" in table:
+        table = table[table["pair_penalty"].notna()]
+        names = RESULT_GRID_COLUMNS
+    else:
+        starts = [f"{oligo}_start" for oligo in ("left", "right", "internal") if f"{oligo}_start" in table]
+        if not include_internal:
+            starts = [column for column in starts if not column.startswith("internal_")]
+        if not starts:
+            return pd.DataFrame(columns=["Result"])
+        table = table[table[starts].notna().any(axis=1)]
+        names = OLIGO_GRID_COLUMNS
+    columns = [column for column in names if column in table and (include_internal or not column.startswith("internal_"))]
+    grid = table[columns].rename(columns=names)
+    grid.insert(0, "Result", table["rank"].astype(int) + 1)
+    return grid.reset_index(drop=True)
+
+# function to get the widget key of the results grid, keyed on the output and the filter, so a row selection
+# never points into a different table
+def result_grid_key(output_key, result_filter=""):
+    return f"result_grid_{output_key}_{result_filter}"
+
+# function to get the result (index from 0) shown in detail: the selected result, kept as (output key, result number)
+# so it stays shown as long as it matches the filter, otherwise the best shown result
+def shown_result_index(shown_results, output_key, selected=None):
+    selected_output, selected_result = selected or (None, None)
+    if selected_output == output_key and selected_result in shown_results["Result"].values:
+        return int(selected_result) - 1
+    return int(shown_results["Result"].iloc[0]) - 1
+
+# function to get the oligo and product tables of one result (index from 0), as shown in the result details and exports
+def result_tables(parsed_output, idx, include_internal=True):
+    rows = []
+    for label, prefix in RESULT_OLIGOS if include_internal else RESULT_OLIGOS[:2]:
+        position = parsed_output.get(f"{prefix}_{idx}", "").split(",")
+        if len(position) != 2:
+            # not picked (e.g. a primer list without pairs)
+            continue
+        start, length = position
+        rows.append({
+            "Type": label,
+            "Start": start,
+            "Len": length,
+            "Tm": parsed_output.get(f"{prefix}_{idx}_TM"),
+            "GC%": parsed_output.get(f"{prefix}_{idx}_GC_PERCENT"),
+            "Any": parsed_output.get(f"{prefix}_{idx}_SELF_ANY"),
+            "3'": parsed_output.get(f"{prefix}_{idx}_SELF_END"),
+            "Seq": parsed_output.get(f"{prefix}_{idx}_SEQUENCE"),
+        })
+    product = [{
+        "Product size": parsed_output.get(f"PRIMER_PAIR_{idx}_PRODUCT_SIZE"),
+        "Product Tm": parsed_output.get(f"PRIMER_PAIR_{idx}_PRODUCT_TM"),
+        "Self complementary": parsed_output.get(f"PRIMER_PAIR_{idx}_COMPL_ANY"),
+        "3' end complementary": parsed_output.get(f"PRIMER_PAIR_{idx}_COMPL_END"),
+    }] if f"PRIMER_PAIR_{idx}_PENALTY" in parsed_output else []
+    columns = ["Product size", "Product Tm", "Self complementary", "3' end complementary"]
+    return pd.DataFrame(rows, columns=["Type", "Start", "Len", "Tm", "GC%", "Any", "3'", "Seq"]), pd.DataFrame(product, columns=columns)
+
+# function to read a "start,length" value, returns None for anything else (e.g. several regions)
+def _start_length(value):
+    parts = value.split(",")
+    if len(parts) != 2:
+        return None
+    return int(parts[0]), int(parts[1])
+
+# function to mark the oligos, target and excluded regions of one result below the sequence, in rows of the given width
+# returns (sequence row, marker row) per row
+def binding_rows(sequence, parsed_output, idx, width=60):
+    sequence = clean_sequence(sequence)
+    marker = np.full(len(sequence), " ", dtype="<U1")
+    spans = []
+    left = _start_length(parsed_output.get(f"PRIMER_LEFT_{idx}", ""))
+    if left:
+        spans.append((left[0], left[1], ">"))
+    right = _start_length(parsed_output.get(f"PRIMER_RIGHT_{idx}", ""))
+    if right:
+        # right primer: position is last base, so mark backwards
+        spans.append((right[0] - right[1] + 1, right[1], "<"))
+    internal = _start_length(parsed_output.get(f"PRIMER_INTERNAL_{idx}", ""))
+    if internal:
+        spans.append((internal[0], internal[1], "^"))
+    target = _start_length(parsed_output.get("SEQUENCE_TARGET", ""))
+    if target:
+        spans.append((target[0], target[1], "*"))
+    # several excluded regions can be given as space separated start,length pairs
+    for region in parsed_output.get("EXCLUDED_REGION", "").split():
+        excluded = _start_length(region)
+        if excluded:
+            spans.append((excluded[0], excluded[1], "X"))
+    for start, length, symbol in spans:
+        marker[max(start, 0):max(start + length, 0)] = symbol
+    marker = "".join(marker)
+
+    rows = [[sequence[i:i + width], marker[i:i + width]] for i in range(0, len(sequence), width)]
+    # a forward primer starting a row is marked at the end of the previous row
+    for previous, row in zip(rows, rows[1:]):
+        if row[1][0] == ">":
+            previous[1] = previous[1][:-1] + ">"
+            row[1] = " " + row[1][1:]
+    return [tuple(row) for row in rows]
@@ -0,0 +1,501 @@
+import pytest
+import re
+import numpy as np
+import P3G_core
+from P3G_core import SETTINGS_SCHEMA, fill_primer3_settings, settings_hash, _render_line, TEMPLATE_TAIL
+
+
+# function to get a full set of default settings values
+def default_values(**changes):
+    values = {key: default for _, key, _, default in SETTINGS_SCHEMA}
+    values.update(seq_id="test", sequence="ACGT" * 30, pick_left=True, pick_right=True)
+    values.update(changes)
+    return values
+
+
+# function to serialize the values as if no earlier call had filled the caches
+def fresh_settings(values):
+    P3G_core._tail_cache.clear()
+    P3G_core._last_tail.clear()
+    return fill_primer3_settings(values)
+
+
+def test_settings_do_not_depend_on_earlier_calls():
+    for earlier, later in [
+        (default_values(product_min_tm=-1000000), default_values(product_min_tm=-1000000.0)),
+        (default_values(product_min_tm=-1000000.0), default_values(product_min_tm=-1000000)),
+        (default_values(num_return=5.0), default_values(num_return=5)),
+    ]:
+        expected = fresh_settings(later)
+        fresh_settings(earlier)
+        assert fill_primer3_settings(later) == expected
+        assert settings_hash(fill_primer3_settings(later)) == settings_hash(expected)
+
+
+def test_settings_tail_matches_plain_render():
+    values = default_values(product_min_tm=-1000000, primer_opt_tm=60)
+    fill_primer3_settings(default_values())
+    tail = "\n".join(_render_line(parts, values) for parts in TEMPLATE_TAIL)
+    assert fill_primer3_settings(values).endswith(tail)
+
+
+# function to write a Primer3 output record with pairs given as (left position, penalty)
+def range_output(pairs):
+    lines = ["SEQUENCE_ID=test", "PRIMER_PRODUCT_SIZE_RANGE=100-200", "PRIMER_PAIR_EXPLAIN=considered 10, ok 2"]
+    lines.append(f"PRIMER_PAIR_NUM_RETURNED={len(pairs)}")
+    for idx, (left, penalty) in enumerate(pairs):
+        lines += [f"PRIMER_PAIR_{idx}_PENALTY={penalty}", f"PRIMER_LEFT_{idx}={left},20", f"PRIMER_RIGHT_{idx}={left + 150},20",
+                  f"PRIMER_LEFT_{idx}_SEQUENCE={'ACGT' * 5}", f"PRIMER_RIGHT_{idx}_SEQUENCE={'TGCA' * 5}"]
+    return "\n".join(lines + ["="]) + "\n"
+
+
+def test_merged_ranges_keep_earlier_ranges_first():
+    outputs = [range_output([(0, 2.0), (5, 3.0)]), range_output([(10, 0.1), (0, 2.0), (20, 0.5)]), range_output([(30, 0.0)])]
+    merged = P3G_core.parse_primer3_input_file(P3G_core.merge_product_range_outputs(outputs, "100-200 200-300 300-400", 3))
+    # both pairs of the first range are kept, the duplicate is dropped and only one place is left for the second range
+    assert [merged[f"PRIMER_LEFT_{idx}"] for idx in range(3)] == ["0,20", "5,20", "10,20"]
+    assert "PRIMER_LEFT_3" not in merged
+    assert merged["PRIMER_PAIR_NUM_RETURNED"] == "3"
+
+
+def test_stopped_processes_are_not_left_running(tmp_path, monkeypatch):
+    slow = tmp_path / "primer3_core"
+    slow.write_text("#!/bin/sh\nexec sleep 30\n")
+    slow.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{P3G_core.os.environ['PATH']}")
+    group = P3G_core.primer3_process_group()
+    with P3G_core.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(P3G_core._call_primer3, "SEQUENCE_ID=test\n=\n", group) for _ in range(2)]
+        while len(group["processes"]) < 2:
+            P3G_core.time.sleep(0.01)
+        P3G_core.stop_primer3_processes(group)
+        assert all(process.poll() is not None for process in group["processes"])
+        assert [future.result() for future in futures] == [None, None]
+    # no new processes are started once the group is stopped
+    assert P3G_core._call_primer3("SEQUENCE_ID=test\n=\n", group) is None
+
+
+def test_echoed_settings_leave_out_results():
+    settings = fill_primer3_settings(default_values())
+    # Primer3 echoes the settings without their closing "=" line, followed by the results
+    output = settings.removesuffix("=") + range_output([(0, 1.0)]).split("\n", 2)[2]
+    assert P3G_core.echoed_settings(output) == settings
+
+
+def test_auto_excluded_regions_follow_their_sequence():
+    values = default_values(sequence="acgt" * 30, auto_excluded_region="10,5", auto_excluded_sequence="ACGT" * 30)
+    assert "EXCLUDED_REGION=10,5" in fill_primer3_settings(values).splitlines()
+    values["sequence"] = "TTGCA" * 30
+    assert "EXCLUDED_REGION=" in fill_primer3_settings(values).splitlines()
+
+
+def test_run_store_keeps_most_recent_runs(tmp_path):
+    connection = P3G_core.open_run_store(str(tmp_path / "runs.sqlite"))
+    for i in range(5):
+        settings = fill_primer3_settings(default_values(seq_id=f"run{i}"))
+        P3G_core.record_runs(connection, [(settings, range_output([(i, 1.0)]), True, 0.1)], max_runs=3)
+    assert [row[0] for row in connection.execute("SELECT seq_id FROM runs ORDER BY id")] == ["run2", "run3", "run4"]
+    # the pairs of removed runs are removed with them
+    assert connection.execute("SELECT count(*) FROM pairs").fetchone()[0] == 3
+
+
+def test_run_store_path_is_resolved_when_opened(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("P3G_RUN_STORE", raising=False)
+    assert P3G_core.run_store_path() == str(tmp_path / P3G_core.RUN_STORE_FILE)
+    monkeypatch.setenv("P3G_RUN_STORE", "")
+    assert P3G_core.run_store_path() == ""
+
+
+def test_run_problems_are_errors_and_range_problems_warnings():
+    findings = P3G_core.validate_settings(default_values(sequence="", primer_opt_size=30))
+    assert {(stage, severity) for stage, severity, _ in findings} == {("run", "error"), ("range", "warning")}
+
+
+# function to write a pair result as Primer3 would, with the oligo penalties following the default weights
+# plus a part that cannot be recomputed (e.g. sequence quality), given as residuals
+def rerank_output(pairs):
+    lines = ["SEQUENCE_ID=test", f"PRIMER_PAIR_NUM_RETURNED={len(pairs)}"]
+    for idx, (left_tm, right_tm, left_residual, right_residual, pair_residual) in enumerate(pairs):
+        left_penalty = abs(left_tm - 60.0) + left_residual
+        right_penalty = abs(right_tm - 60.0) + right_residual
+        lines += [
+            f"PRIMER_PAIR_{idx}_PENALTY={left_penalty + right_penalty + pair_residual:.4f}",
+            f"PRIMER_LEFT_{idx}_PENALTY={left_penalty:.4f}", f"PRIMER_RIGHT_{idx}_PENALTY={right_penalty:.4f}",
+            f"PRIMER_LEFT_{idx}_SEQUENCE={'ACGT' * 5}", f"PRIMER_RIGHT_{idx}_SEQUENCE={'TGCA' * 5}",
+            f"PRIMER_LEFT_{idx}={idx},20", f"PRIMER_RIGHT_{idx}={idx + 150},20",
+            f"PRIMER_LEFT_{idx}_TM={left_tm}", f"PRIMER_RIGHT_{idx}_TM={right_tm}",
+            f"PRIMER_LEFT_{idx}_GC_PERCENT=50.0", f"PRIMER_RIGHT_{idx}_GC_PERCENT=50.0",
+            f"PRIMER_PAIR_{idx}_PRODUCT_SIZE=170", f"PRIMER_PAIR_{idx}_PRODUCT_TM=80.0",
+        ]
+    return "\n".join(lines + ["="]) + "\n"
+
+
+RERANK_PAIRS = [(60.5, 59.0, 0.0, 0.3, 0.0), (61.0, 61.0, 0.8, 0.0, 0.1), (58.0, 60.2, 0.2, 0.1, 0.5)]
+
+
+def test_default_weights_reproduce_primer3_penalties():
+    parsed = P3G_core.parse_primer3_input_file(rerank_output(RERANK_PAIRS))
+    values = default_values(primer_opt_tm=60.0, primer_opt_size=20, primer_opt_GC=50.0)
+    ranked = P3G_core.rerank_candidates(P3G_core.build_candidate_pool(parsed, values), {})
+    table = P3G_core.primer3_results_table(parsed)
+    assert ranked["new_penalty"].tolist() == pytest.approx(ranked["pair_penalty"].tolist(), abs=1e-4)
+    assert ranked["left_new_penalty"].tolist() == pytest.approx(ranked["left_penalty"].tolist(), abs=1e-4)
+    assert ranked["rank"].tolist() == table.sort_values("pair_penalty", kind="stable")["rank"].tolist()
+
+
+def test_changed_weight_reorders_pairs():
+    parsed = P3G_core.parse_primer3_input_file(rerank_output(RERANK_PAIRS))
+    values = default_values(primer_opt_tm=60.0, primer_opt_size=20, primer_opt_GC=50.0)
+    pool = P3G_core.build_candidate_pool(parsed, values)
+    table = P3G_core.primer3_results_table(parsed)
+    # a Tm difference weight adds weight * |left Tm - right Tm| to the pair penalty
+    ranked = P3G_core.rerank_candidates(pool, {"PRIMER_PAIR_WT_DIFF_TM": 2.0})
+    expected = table["pair_penalty"] + 2.0 * (table["left_tm"] - table["right_tm"]).abs()
+    assert ranked["rank"].tolist() == expected.sort_values(kind="stable").index.tolist()
+    assert ranked["new_penalty"].tolist() == pytest.approx(sorted(expected), abs=1e-4)
+    assert ranked["rank"].tolist() != table.sort_values("pair_penalty")["rank"].tolist()
+
+
+# the settings read from settings files, with the defaults of a new session in the app
+def file_defaults(**changes):
+    defaults = {key: default for tag, key, _, default in SETTINGS_SCHEMA if tag}
+    defaults.update(changes)
+    return defaults
+
+
+def test_empty_settings_file_imports_app_defaults():
+    [(name, values, problems)] = P3G_core.import_settings_files({"empty.txt": ""})
+    assert values == file_defaults(seq_id="empty")
+    assert problems == []
+    # the same task as a new session: nothing picked
+    assert not (values["pick_left"] or values["pick_right"] or values["pick_internal"])
+
+
+def test_partial_settings_file_keeps_defaults_and_reports_bad_values():
+    text = "SEQUENCE_ID=partial\nPRIMER_PICK_LEFT_PRIMER=1\nPRIMER_OPT_TM=61.5\nPRIMER_NUM_RETURN=many\n="
+    [(name, values, problems)] = P3G_core.import_settings_files({"partial.txt": text})
+    assert values == file_defaults(seq_id="partial", pick_left=True, primer_opt_tm=61.5)
+    assert problems == ["PRIMER_NUM_RETURN=many is not a valid int, using 5"]
+    assert all(type(values[key]) is type(P3G_core.SETTING_DEFAULTS[key]) for key in values)
+
+
+def test_primer3_errors_are_not_stored_or_reused(tmp_path):
+    connection = P3G_core.open_run_store(str(tmp_path / "runs.sqlite"))
+    good = fill_primer3_settings(default_values(seq_id="good"))
+    bad = fill_primer3_settings(default_values(seq_id="bad"))
+    P3G_core.record_runs(connection, [
+        (good, range_output([(0, 1.0)]), True, 0.1),
+        (bad, "SEQUENCE_ID=bad\nPRIMER_ERROR=bad settings\n=\n", True, 0.1),
+    ])
+    assert [row[0] for row in connection.execute("SELECT seq_id FROM runs")] == ["good"]
+    # an error output stored by an older version is not reused either
+    connection.execute("UPDATE runs SET output = output || 'PRIMER_ERROR=x'")
+    assert P3G_core.lookup_runs(connection, [settings_hash(good)]) == {}
+
+
+def test_run_primer3_reports_reused_runs(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(P3G_core, "_call_primer3", lambda settings, group=None: calls.append(settings) or (range_output([(0, 1.0)]), True))
+    P3G_core.use_run_store(str(tmp_path / "runs.sqlite"))
+    try:
+        settings = fill_primer3_settings(default_values(seq_id="reuse"))
+        assert P3G_core.run_primer3_reused(settings)[2] is False
+        assert P3G_core.run_primer3_reused(settings)[2] is True
+        assert P3G_core.run_primer3(settings) == (range_output([(0, 1.0)]), True)
+        assert len(calls) == 1
+    finally:
+        P3G_core.use_run_store("")
+
+
+def test_hairpin_per_position_takes_most_stable_covering_window():
+    # windows of 4 at 0, 3 and 6 over 10 bases
+    per_position = P3G_core.hairpin_per_position([0, 3, 6], 4, [-1.0, -5.0, -2.0], 10)
+    assert per_position.tolist() == [-1, -1, -1, -5, -5, -5, -5, -2, -2, -2]
+    assert P3G_core.hairpin_per_position([], 4, [], 3).tolist() == [0, 0, 0]
+
+
+def test_hairpin_scan_reuses_cached_scans(monkeypatch):
+    monkeypatch.setattr(P3G_core, "_hairpin_cache", {})
+    windows = []
+
+    def stub_dg(sequence, conditions):
+        windows.append(sequence)
+        return -float(sequence.count("G"))
+
+    sequence = "A" * 10 + "GGGG" + "A" * 10
+    scan = P3G_core.hairpin_scan(sequence, default_values(), window=8, step=4, dg_function=stub_dg)
+    assert scan["starts"].tolist() == [0, 4, 8, 12, 16]
+    assert windows == [sequence[start:start + 8] for start in scan["starts"]]
+    assert scan["per_position"].tolist() == P3G_core.hairpin_per_position(scan["starts"], 8, scan["dg"], len(sequence)).tolist()
+    assert scan["per_position"].min() == -4 and scan["per_position"][0] == 0
+
+    # same template (after cleaning), window, step and conditions: no new windows are computed
+    assert P3G_core.hairpin_scan(sequence.lower(), default_values(), window=8, step=4, dg_function=stub_dg) is scan
+    assert len(windows) == 5
+    # a changed step, condition or temperature is a new scan
+    P3G_core.hairpin_scan(sequence, default_values(), window=8, step=3, dg_function=stub_dg)
+    P3G_core.hairpin_scan(sequence, default_values(primer_salt_conc_monocat=25.0), window=8, step=4, dg_function=stub_dg)
+    P3G_core.hairpin_scan(sequence, default_values(), window=8, step=4, temperature=55.0, dg_function=stub_dg)
+    assert len(P3G_core._hairpin_cache) == 4
+
+
+def naive_stock_hits(stock, template):
+    hits = []
+    for name, sequence in stock:
+        for strand, site in (("+", sequence), ("-", P3G_core.reverse_complement(sequence))):
+            start = template.find(site)
+            while start != -1:
+                hits.append((start, (name, sequence, strand)))
+                start = template.find(site, start + 1)
+    return sorted(hits)
+
+
+def test_stock_primer_scan_matches_naive_find():
+    import random
+    rng = random.Random(36)
+    template = "".join(rng.choice("ACGT") for _ in range(400))
+    stock = [
+        # overlapping copies of a repeat, and a pattern that is a suffix of another (failure links)
+        ("repeat", "ACGTACGTACGT"),
+        ("long", template[100:124]),
+        ("suffix", template[110:124]),
+        # only found as reverse complement
+        ("reverse", P3G_core.reverse_complement(template[300:318])),
+        ("absent", "GATTACAGATTACA"),
+    ]
+    template = template[:200] + "ACGTACGTACGTACGTACGT" + template[200:]
+    hits = P3G_core.scan_stock_primers(P3G_core.build_primer_automaton(stock), template)
+    assert sorted(hits) == naive_stock_hits(stock, template)
+    names = [(pattern[0], pattern[2]) for _, pattern in hits]
+    assert names.count(("repeat", "+")) == 3 and ("reverse", "-") in names and ("suffix", "+") in names
+    assert not any(name == "absent" for name, _ in names)
+    # the mismatch locator finds the same exact sites
+    table, totals = P3G_core.locate_oligos(template, dict(stock), max_mismatches=0, first_base_index=0, max_hits=100)
+    located = sorted((row.Start, (row.Oligo, dict(stock)[row.Oligo], row.Strand)) for row in table.itertuples())
+    assert located == naive_stock_hits(stock, template)
+
+
+def test_homopolymer_and_dinucleotide_runs_have_exact_boundaries():
+    background = "ACGT" * 5
+    sequence = background + "A" * 7 + "CT" + "G" * 6 + background + "CA" * 5 + "G" + background + "CA" * 4 + "G" + background
+    masks = P3G_core.complexity_masks(sequence)
+    # a run of 7 is flagged, a run of 6 is one base too short
+    assert P3G_core.mask_intervals(masks["Homopolymer"]) == [(20, 27)]
+    assert P3G_core.mask_intervals(P3G_core.complexity_masks(sequence, homopolymer=6)["Homopolymer"]) == [(20, 27), (29, 35)]
+    # 5 CA repeats are flagged, 4 are not
+    assert P3G_core.mask_intervals(masks["Dinucleotide repeat"]) == [(55, 65)]
+    assert P3G_core.mask_intervals(P3G_core.complexity_masks(sequence, dinucleotide_repeats=4)["Dinucleotide repeat"]) == [(55, 65), (86, 94)]
+
+
+def test_low_complexity_windows_match_naive_dust():
+    import random
+    rng = random.Random(37)
+    sequence = "".join(rng.choice("ACGT") for _ in range(150)) + "CAG" * 30 + "".join(rng.choice("ACGT") for _ in range(170))
+    dust_window, threshold = 64, 2.5
+    expected = [False] * len(sequence)
+    starts = list(range(0, len(sequence) - dust_window + 1, dust_window // 2))
+    if starts[-1] != len(sequence) - dust_window:
+        starts.append(len(sequence) - dust_window)
+    for start in starts:
+        window = sequence[start:start + dust_window]
+        counts = {}
+        for i in range(dust_window - 2):
+            counts[window[i:i + 3]] = counts.get(window[i:i + 3], 0) + 1
+        if sum(c * (c - 1) // 2 for c in counts.values()) / (dust_window - 3) > threshold:
+            expected[start:start + dust_window] = [True] * dust_window
+    mask = P3G_core.complexity_masks(sequence, dust_window=dust_window, dust_threshold=threshold)["Low complexity"]
+    assert mask.tolist() == expected
+    # the repeat is flagged, the random flanks away from it are not
+    assert mask[150:240].all() and not mask[:100].any() and not mask[300:].any()
+
+
+VCF_SNIPPET = """##fileformat=VCFv4.2
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO
+chr1\t120\t.\tACG\tA\t.\tPASS\tAF=0.01
+chr1\t105\tsnp\tC\tT\t.\tPASS\tDP=10;AF=0.5
+chr1\t101\t.\tG\tA,C\t.\tPASS\tAF=0.2,0.3
+chr1\t150\t.\tT\tG\t.\tPASS\t.
+chr2\t5\t.\tA\tG\t.\tPASS\tAF=0.9
+"""
+
+
+def vcf_index(tmp_path):
+    vcf_path = tmp_path / "snippet.vcf"
+    vcf_path.write_text(VCF_SNIPPET)
+    return P3G_core.open_vcf_index(str(vcf_path))
+
+
+def test_vcf_index_window_lookup_matches_naive_overlap(tmp_path):
+    index = vcf_index(tmp_path)
+    assert index["count"] == 5 and (tmp_path / "snippet.vcf.p3gvcf.npz").exists()
+    # 0-based start, length of the chr1 variants
+    variants = [(100, 1), (104, 1), (119, 3), (149, 1)]
+    for start in range(95, 155):
+        for end in range(start + 1, 160):
+            found = P3G_core.variants_in_region(index, "chr1", start, end)
+            expected = [(s, n) for s, n in variants if s < end and s + n > start]
+            assert list(zip(found[0].tolist(), found[1].tolist())) == expected
+    # the deletion reaches into a window that starts after its first base
+    assert P3G_core.variants_in_region(index, "chr1", 121, 130)[0].tolist() == [119]
+    # "chr" prefixes are matched either way, unknown chromosomes have no variants
+    assert P3G_core.variants_in_region(index, "2", 0, 10)[0].tolist() == [4]
+    assert len(P3G_core.variants_in_region(index, "chrX", 0, 1000)[0]) == 0
+
+
+def test_template_variants_filter_af_and_map_minus_strand(tmp_path):
+    index = vcf_index(tmp_path)
+    record = {"chrom": "chr1", "start": 100, "sequence": "A" * 50}
+    plus = P3G_core.template_variants(index, record, min_af=0.1)
+    # AF 0.01 is dropped, the highest of several AFs counts, a missing AF is kept
+    assert plus["Genomic position"].tolist() == [101, 105, 150]
+    assert plus[["start", "end"]].values.tolist() == [[0, 1], [4, 5], [49, 50]]
+    minus = P3G_core.template_variants(index, {**record, "strand": "-"})
+    assert minus["Genomic position"].tolist() == [101, 105, 120, 150]
+    assert minus[["start", "end"]].values.tolist() == [[49, 50], [45, 46], [28, 31], [0, 1]]
+    sequence = record["sequence"]
+    for (start, end), position in zip(minus[["start", "end"]].values.tolist(), minus["Genomic position"]):
+        # the reverse complemented template base of a genomic position
+        assert len(sequence) - 1 - (position - 1 - record["start"]) in range(start, end)
+
+
+def test_pairs_with_a_variant_near_a_three_prime_end_are_rejected():
+    # left primers cover 9-28 and 29-48 (0-based), right primers 140-159 and 160-179, 3' ends 24-28, 44-48, 140-144, 160-164
+    output = range_output([(10, 1.0), (30, 2.0)])
+
+    def kept(*positions):
+        mask = np.zeros(200, dtype=bool)
+        mask[list(positions)] = True
+        filtered, rejected = P3G_core.filter_three_prime_variants(output, mask)
+        return [line.split("=")[1] for line in filtered.splitlines() if line.startswith("PRIMER_LEFT_") and "_SEQUENCE" not in line and "NUM" not in line], rejected
+
+    assert kept() == (["10,20", "30,20"], 0)
+    assert kept(28) == (["30,20"], 1)
+    assert kept(23, 145) == (["10,20", "30,20"], 0)
+    assert kept(164) == (["10,20"], 1)
+    assert kept(24, 160) == ([], 2)
+
+
+@pytest.mark.parametrize("state, top, bottom", [
+    ("Methylated (CpG stays C)", "GACGTTTTA", "TGGAACGTT"),
+    ("Unmethylated (CpG becomes T)", "GATGTTTTA", "TGGAATGTT"),
+    ("Either (CpG as Y)", "GAYGTTTTA", "TGGAAYGTT"),
+])
+def test_bisulfite_conversion_of_both_strands(state, top, bottom):
+    # the bottom strand is the reverse complement TGGAACGTC, converted on its own
+    cpg_state = P3G_core.CPG_STATES[state]
+    assert P3G_core.bisulfite_convert("gacgttcca", "top", cpg_state) == top
+    assert P3G_core.bisulfite_convert("GACGTTCCA", "bottom", cpg_state) == bottom
+
+
+def test_bisulfite_design_rejects_primers_with_a_cpg(monkeypatch):
+    # one CpG at 20-21 (0-based): inside the first left primer (9-28) on the top strand and, mirrored to 178-179,
+    # inside the second right primer (160-179) on the bottom strand
+    template = "A" * 20 + "CG" + "A" * 178
+    calls = []
+
+    def stub_batch(settings_list, **kwargs):
+        calls.extend(settings_list)
+        return [(range_output([(10, 1.0), (30, 2.0)]), True) for _ in settings_list]
+
+    monkeypatch.setattr(P3G_core, "run_primer3_batch", stub_batch)
+    values = default_values(num_return=5)
+    record = {"seq_id": "bs", "sequence": template, "target": "51,10"}
+
+    def left_positions(strand, **kwargs):
+        table, results, converted = P3G_core.run_bisulfite_design(values, [record], strand=strand, **kwargs)
+        output = results[0][0]
+        return [line.split("=")[1] for line in output.splitlines() if re.match(r"PRIMER_LEFT_\d+=", line)], table, converted[0]
+
+    kept, table, converted = left_positions("top")
+    assert kept == ["30,20"] and table["CpG rejected pairs"].tolist() == [1] and table["CpG sites"].tolist() == [1]
+    assert "PRIMER_NUM_RETURN=25" in calls[-1] and "SEQUENCE_TARGET=51,10" in calls[-1]
+    kept, table, converted = left_positions("bottom", cpg_state=b"Y")
+    assert kept == ["10,20"] and converted["seq_id"] == "bs_bisulfite_bottom" and converted["target"] == "141,10"
+    assert "PRIMER_LIBERAL_BASE=1" in calls[-1] and converted["sequence"] == P3G_core.bisulfite_convert(template, "bottom", b"Y")
+    kept, table, converted = left_positions("top", reject_cpg=False)
+    assert kept == ["10,20", "30,20"] and "PRIMER_NUM_RETURN=5\n" in calls[-1]
+
+
+def test_failure_analytics_sums_rejections_and_problems():
+    first = "\n".join([
+        "SEQUENCE_ID=first",
+        "PRIMER_LEFT_EXPLAIN=considered 100, GC content failed 10, low tm 20, ok 70",
+        "PRIMER_RIGHT_EXPLAIN=considered 80, high tm 5, ok 75",
+        "PRIMER_PAIR_NUM_RETURNED=2",
+        "PRIMER_LEFT_0_PROBLEMS=Tm too low; GC content too high",
+        "PRIMER_LEFT_1_PROBLEMS=Tm too low",
+        "=",
+    ])
+    second = "\n".join([
+        "SEQUENCE_ID=second",
+        "PRIMER_LEFT_EXPLAIN=considered 50, low tm 30, ok 20",
+        "PRIMER_RIGHT_EXPLAIN=considered 40, high tm 0, ok 40",
+        "PRIMER_WARNING=few oligos",
+        "PRIMER_PAIR_NUM_RETURNED=0",
+        "=",
+    ])
+    rejections, explain_table, problem_table = P3G_core.failure_analytics([("first", first, True), ("second", second, True)])
+
+    rows = rejections.set_index(["Oligo", "Reason"])
+    assert rejections["Rejected"].tolist() == [50, 10, 5]
+    assert rows.loc[("LEFT", "low tm")].tolist() == [50, 2, 33.33]
+    assert rows.loc[("LEFT", "GC content failed")].tolist() == [10, 1, 6.67]
+    # a zero count does not count as an affected run
+    assert rows.loc[("RIGHT", "high tm")].tolist() == [5, 1, 4.17]
+    assert explain_table.loc["considered"].to_dict() == {"LEFT": 150, "RIGHT": 120}
+    assert explain_table.loc["ok"].to_dict() == {"LEFT": 90, "RIGHT": 115}
+    assert explain_table.index[0] == "considered"
+
+    problems = {(row.Oligo, row.Problem): (row.Count, row.Runs) for row in problem_table.itertuples()}
+    assert problems == {
+        ("LEFT", "Tm too low"): (2, 1),
+        ("LEFT", "GC content too high"): (1, 1),
+        ("RUN", "Warning: few oligos"): (1, 1),
+        ("RUN", "No results returned"): (1, 1),
+    }
+    assert problem_table.iloc[0][["Oligo", "Problem"]].tolist() == ["LEFT", "Tm too low"]
+
+
+def test_results_grid_rows_for_pairs_and_oligo_lists():
+    pairs = P3G_core.parse_primer3_input_file(range_output([(10, 2.0), (30, 1.0)]))
+    grid = P3G_core.results_grid(pairs)
+    assert grid["Result"].tolist() == [1, 2] and grid["Penalty"].tolist() == [2.0, 1.0]
+    assert grid["Forward start"].tolist() == [10, 30] and "Forward penalty" not in grid
+
+    # a primer list without pairs: more left than right primers, the oligos of the same rank share a row
+    output = "\n".join([
+        "SEQUENCE_ID=list", "PRIMER_LEFT_NUM_RETURNED=3", "PRIMER_RIGHT_NUM_RETURNED=1",
+        "PRIMER_LEFT_0_PENALTY=0.5", "PRIMER_LEFT_0=5,20", "PRIMER_LEFT_0_SEQUENCE=" + "ACGT" * 5,
+        "PRIMER_LEFT_1_PENALTY=0.7", "PRIMER_LEFT_1=9,20", "PRIMER_LEFT_1_SEQUENCE=" + "CGTA" * 5,
+        "PRIMER_LEFT_2_PENALTY=0.9", "PRIMER_LEFT_2=15,20", "PRIMER_LEFT_2_SEQUENCE=" + "GTAC" * 5,
+        "PRIMER_RIGHT_0_PENALTY=0.4", "PRIMER_RIGHT_0=120,20", "PRIMER_RIGHT_0_SEQUENCE=" + "TGCA" * 5,
+        "=",
+    ])
+    parsed = P3G_core.parse_primer3_input_file(output)
+    grid = P3G_core.results_grid(parsed)
+    assert grid["Result"].tolist() == [1, 2, 3]
+    assert grid["Forward penalty"].tolist() == [0.5, 0.7, 0.9] and grid["Reverse start"].tolist()[0] == 120
+    assert grid["Reverse primer"].isna().tolist() == [False, True, True] and "Penalty" not in grid
+    primer_table, product_table = P3G_core.result_tables(parsed, 1)
+    assert primer_table["Type"].tolist() == ["LEFT PRIMER"] and product_table.empty
+    primer_table, product_table = P3G_core.result_tables(pairs, 0, include_internal=False)
+    assert primer_table["Type"].tolist() == ["LEFT PRIMER", "RIGHT PRIMER"] and len(product_table) == 1
+
+    # nothing returned
+    assert P3G_core.results_grid(P3G_core.parse_primer3_input_file("SEQUENCE_ID=none\n=\n")).empty
+
+
+def test_result_selection_is_kept_per_output_and_filter():
+    grid = P3G_core.results_grid(P3G_core.parse_primer3_input_file(range_output([(10, 1.0), (30, 2.0), (50, 3.0)])))
+    first, second = settings_hash("first output"), settings_hash("second output")
+    # a new output or filter gets a new grid widget, so an old row selection is not applied to it
+    assert len({P3G_core.result_grid_key(first), P3G_core.result_grid_key(first, "ACGT"), P3G_core.result_grid_key(second)}) == 3
+    assert P3G_core.result_grid_key(first, "") == P3G_core.result_grid_key(first)
+
+    assert P3G_core.shown_result_index(grid, first) == 0
+    assert P3G_core.shown_result_index(grid, first, (first, 3)) == 2
+    # a selection of another output, or of a result that is filtered out, falls back to the best shown result
+    assert P3G_core.shown_result_index(grid, second, (first, 3)) == 0
+    assert P3G_core.shown_result_index(grid[grid["Result"] != 3].iloc[::-1], first, (first, 3)) == 1
+    assert P3G_core.shown_result_index(grid[grid["Result"] > 1], first, (first, 2)) == 1